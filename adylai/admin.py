@@ -0,0 +1,109 @@
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+# Query string flag asking an estimated changelist for the exact count
+EXACT_COUNT_VAR = 'exact_count'
+
+
+class SelectRelatedFieldListFilter(admin.RelatedFieldListFilter):
+    """
+    Related-field list filter whose choice labels come from one joined query.
+    The stock filter renders str() of every related object, which for
+    lawyers and websites costs a user query per choice.
+    """
+    select_related = ()
+
+    def field_choices(self, field, request, model_admin):
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        queryset = field.remote_field.model._default_manager.complex_filter(
+            field.get_limit_choices_to()
+        ).select_related(*self.select_related)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        target = field.remote_field.get_related_field().attname
+        return [(getattr(obj, target), str(obj)) for obj in queryset]
+
+
+def related_filter(*select_related):
+    """list_filter class for a relation whose labels need `select_related`"""
+    return type('SelectRelatedFieldListFilter', (SelectRelatedFieldListFilter,), {'select_related': select_related})
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that takes an unfiltered PostgreSQL table's row count from the
+    planner's statistics (pg_class.reltuples) instead of COUNT(*) once the
+    table holds at least `threshold` rows. Filtered querysets, other
+    databases and never-analyzed tables are counted exactly.
+    """
+
+    def __init__(self, *args, threshold=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threshold = settings.ADMIN_ESTIMATED_COUNT_THRESHOLD if threshold is None else threshold
+        self.is_estimated = False
+
+    def estimate(self):
+        """The planner's row estimate for the whole table, or None"""
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet) or queryset.query.where or queryset.query.distinct:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)',
+                [connection.ops.quote_name(queryset.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 until the table is first vacuumed or analyzed
+        return row[0] if row and row[0] >= 0 else None
+
+    @cached_property
+    def count(self):
+        estimate = self.estimate()
+        if estimate is not None and estimate >= self.threshold:
+            self.is_estimated = True
+            return estimate
+        return super().count
+
+
+class EstimatedCountChangeList(ChangeList):
+    def get_filters_params(self, params=None):
+        # The exact count flag is not a field lookup, but page links keep it
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(EXACT_COUNT_VAR, None)
+        return lookup_params
+
+
+class EstimatedCountAdminMixin:
+    """
+    ModelAdmin mixin for very large tables: the changelist paginates on an
+    estimated row count and offers a link to count exactly
+    (?exact_count=1). The unfiltered total is not counted at all.
+    """
+    change_list_template = 'admin/estimated_change_list.html'
+    show_full_result_count = False
+    estimated_count_threshold = None
+
+    def get_changelist(self, request, **kwargs):
+        return EstimatedCountChangeList
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        if EXACT_COUNT_VAR in request.GET:
+            return super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
+        return EstimatedCountPaginator(
+            queryset, per_page, orphans, allow_empty_first_page, threshold=self.estimated_count_threshold
+        )
+
+    def changelist_view(self, request, extra_context=None):
+        query = request.GET.copy()
+        query[EXACT_COUNT_VAR] = '1'
+        extra_context = {**(extra_context or {}), 'exact_count_url': f'?{query.urlencode()}'}
+        return super().changelist_view(request, extra_context)
@@ -0,0 +1,193 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import JsonResponse
+from django.views import View
+
+
+logger = logging.getLogger('adylai.profiling')
+
+# Placeholder lists of any length collapse to one fingerprint: `IN (%s, %s, %s)` -> `IN (...)`
+_PLACEHOLDER_LIST_RE = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Normalize SQL so statements that differ only in parameters compare equal"""
+    sql = _PLACEHOLDER_LIST_RE.sub('(...)', sql)
+    return _WHITESPACE_RE.sub(' ', sql).strip()
+
+
+class QueryProfile:
+    """
+    Database execute wrapper counting queries, SQL time and repeated statements.
+    A fingerprint executed more than once inside one request is usually an N+1.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duration_ms(self):
+        return round(self.duration * 1000, 2)
+
+    @property
+    def duplicates(self):
+        """Fingerprints executed more than once, most repeated first"""
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count > 1]
+
+    @property
+    def duplicate_count(self):
+        """Queries that repeated an earlier fingerprint"""
+        return sum(count - 1 for _, count in self.duplicates)
+
+    @contextmanager
+    def capture(self):
+        """Install the wrapper on every configured database connection"""
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+
+class QueryProfileReport:
+    """Thread-safe per-URL-name totals, aggregated across requests"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.views = {}
+            self.requests = 0
+
+    def add(self, view_name, profile):
+        with self._lock:
+            self.requests += 1
+            stats = self.views.setdefault(view_name, {
+                'requests': 0,
+                'queries': 0,
+                'max_queries': 0,
+                'sql_ms': 0.0,
+                'duplicate_queries': 0,
+                'duplicates': Counter(),
+            })
+            stats['requests'] += 1
+            stats['queries'] += profile.count
+            stats['max_queries'] = max(stats['max_queries'], profile.count)
+            stats['sql_ms'] += profile.duration_ms
+            stats['duplicate_queries'] += profile.duplicate_count
+            for sql, count in profile.duplicates:
+                stats['duplicates'][sql] += count - 1
+            return self.requests
+
+    def snapshot(self, top_duplicates=5):
+        """Per-view averages, heaviest views first"""
+        with self._lock:
+            rows = []
+            for view_name, stats in self.views.items():
+                rows.append({
+                    'view': view_name,
+                    'requests': stats['requests'],
+                    'avg_queries': round(stats['queries'] / stats['requests'], 1),
+                    'max_queries': stats['max_queries'],
+                    'avg_sql_ms': round(stats['sql_ms'] / stats['requests'], 2),
+                    'duplicate_queries': stats['duplicate_queries'],
+                    'top_duplicates': [
+                        {'sql': sql, 'repeats': count}
+                        for sql, count in stats['duplicates'].most_common(top_duplicates)
+                    ],
+                })
+        return sorted(rows, key=lambda row: row['avg_queries'], reverse=True)
+
+    def log(self):
+        for row in self.snapshot(top_duplicates=1):
+            logger.info(
+                "%s: %s requests, avg %s queries (max %s), avg %sms SQL, %s duplicate queries",
+                row['view'], row['requests'], row['avg_queries'], row['max_queries'],
+                row['avg_sql_ms'], row['duplicate_queries'],
+            )
+            for duplicate in row['top_duplicates']:
+                logger.info("    repeated %s×: %s", duplicate['repeats'], duplicate['sql'][:300])
+
+
+report = QueryProfileReport()
+
+
+class QueryProfilingMiddleware:
+    """
+    Record query count, SQL time and duplicate-query fingerprints for every
+    request. Enabled with QUERY_PROFILING; results go to X-Query-* response
+    headers and to the aggregated report, logged every
+    QUERY_PROFILING_REPORT_EVERY requests.
+
+    Streaming responses (the CSV exports) run most of their queries after
+    the headers are sent, so they get no X-Query-* headers; profiling
+    continues while the body streams and the totals reach the report only.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.report_every = getattr(settings, 'QUERY_PROFILING_REPORT_EVERY', 100)
+
+    def __call__(self, request):
+        profile = QueryProfile()
+        with profile.capture():
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else request.path
+
+        if response.streaming:
+            response.streaming_content = self._profile_stream(response.streaming_content, profile, view_name)
+            return response
+
+        response['X-Query-Count'] = str(profile.count)
+        response['X-Query-Time-Ms'] = str(profile.duration_ms)
+        response['X-Query-Duplicates'] = str(profile.duplicate_count)
+        self._record(view_name, profile)
+        return response
+
+    def _profile_stream(self, content, profile, view_name):
+        try:
+            with profile.capture():
+                yield from content
+        finally:
+            self._record(view_name, profile)
+
+    def _record(self, view_name, profile):
+        total = report.add(view_name, profile)
+        if self.report_every and total % self.report_every == 0:
+            report.log()
+
+
+class QueryProfileReportView(View):
+    """Aggregated query profile as JSON (staff only)"""
+
+    def get(self, request):
+        if not request.user.is_staff:
+            return JsonResponse({'error': 'Forbidden'}, status=403)
+        if request.GET.get('reset'):
+            report.reset()
+        return JsonResponse({'requests': report.requests, 'views': report.snapshot()})
@@ -67,6 +67,13 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Query profiling: per-view query count, SQL time and duplicate queries
+QUERY_PROFILING = config('QUERY_PROFILING', default=False, cast=bool)
+QUERY_PROFILING_REPORT_EVERY = config('QUERY_PROFILING_REPORT_EVERY', default=100, cast=int)
+
+if QUERY_PROFILING:
+    MIDDLEWARE.insert(0, 'adylai.profiling.QueryProfilingMiddleware')
+
 ROOT_URLCONF = 'adylai.urls'
 
 TEMPLATES = [
@@ -119,6 +126,19 @@ if DEBUG:
         }
 
 
+# Cache shared by every worker and host: availability indexes, calendar feeds
+# and the per-lawyer versions that invalidate them must agree across processes.
+# The database cache needs `createcachetable`; point CACHE_BACKEND at
+# django.core.cache.backends.redis.RedisCache (with the redis package installed)
+# and CACHE_LOCATION at a redis:// URL to use Redis instead.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': config('CACHE_LOCATION', default='adylai_cache'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -209,6 +229,34 @@ CRISPY_TEMPLATE_PACK = "bootstrap4"
 DEEPSEEK_API_KEY = config('DEEPSEEK_API_KEY', default='')
 DEEPSEEK_API_URL = config('DEEPSEEK_API_URL', default='https://api.deepseek.com/v1/chat/completions')
 
+# Record a per-stage latency breakdown (ChatTurnTiming) for every chat turn
+CHAT_TURN_TIMING_ENABLED = config('CHAT_TURN_TIMING_ENABLED', default=True, cast=bool)
+
+# Two-tier routing: small talk from templates, short non-legal turns to a light model call
+CHAT_ROUTING_ENABLED = config('CHAT_ROUTING_ENABLED', default=True, cast=bool)
+CHAT_LIGHT_MODEL = config('CHAT_LIGHT_MODEL', default='deepseek-chat')
+CHAT_LIGHT_MAX_TOKENS = config('CHAT_LIGHT_MAX_TOKENS', default=120, cast=int)
+
+# Active chat sessions idle this long are ended by the reap_idle_sessions command
+CHAT_SESSION_IDLE_MINUTES = config('CHAT_SESSION_IDLE_MINUTES', default=30, cast=int)
+
+# Consultation availability: gap kept around bookings, slot grid, how far ahead
+# slots are offered, and how long a lawyer's availability index stays cached
+CONSULTATION_BUFFER_MINUTES = config('CONSULTATION_BUFFER_MINUTES', default=10, cast=int)
+CONSULTATION_SLOT_STEP_MINUTES = config('CONSULTATION_SLOT_STEP_MINUTES', default=30, cast=int)
+CONSULTATION_BOOKING_DAYS = config('CONSULTATION_BOOKING_DAYS', default=30, cast=int)
+AVAILABILITY_CACHE_SECONDS = config('AVAILABILITY_CACHE_SECONDS', default=300, cast=int)
+
+# Clients get a reminder email this many hours before their consultation (send_consultation_reminders)
+CONSULTATION_REMINDER_HOURS = config('CONSULTATION_REMINDER_HOURS', default=24, cast=int)
+
+# Rendered iCalendar feeds are cached until a consultation changes, or this long at most
+CALENDAR_FEED_CACHE_SECONDS = config('CALENDAR_FEED_CACHE_SECONDS', default=3600, cast=int)
+
+# Admin changelists of very large tables (chat messages, leads) paginate on the
+# planner's row estimate instead of COUNT(*) once a table holds this many rows
+ADMIN_ESTIMATED_COUNT_THRESHOLD = config('ADMIN_ESTIMATED_COUNT_THRESHOLD', default=100000, cast=int)
+
 # Email Configuration (for notifications)
 EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
 EMAIL_HOST = config('EMAIL_HOST', default='')
@@ -216,6 +264,11 @@ EMAIL_PORT = config('EMAIL_PORT', default=587, cast=int)
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@adyl.ai')
+
+# Outbox delivery (send_outbox): parallel SMTP connections, and attempts before a message is marked failed
+OUTBOX_CONCURRENCY = config('OUTBOX_CONCURRENCY', default=4, cast=int)
+OUTBOX_MAX_ATTEMPTS = config('OUTBOX_MAX_ATTEMPTS', default=8, cast=int)
 
 # Security settings for production
 if not DEBUG:
@@ -233,3 +286,28 @@ LOGOUT_REDIRECT_URL = '/'
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
+
+# Logging
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'adylai': {
+            'handlers': ['console'],
+            'level': config('ADYLAI_LOG_LEVEL', default='INFO'),
+        },
+        'chatbot': {
+            'handlers': ['console'],
+            'level': config('ADYLAI_LOG_LEVEL', default='INFO'),
+        },
+        'leads': {
+            'handlers': ['console'],
+            'level': config('ADYLAI_LOG_LEVEL', default='INFO'),
+        },
+    },
+}
@@ -0,0 +1,34 @@
+from .profiling import QueryProfile
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin asserting that a request stays within a query budget.
+    Unlike assertNumQueries the budget is an upper bound, and a failure
+    lists the repeated statements so N+1 regressions are easy to spot.
+    """
+
+    def _profiled_request(self, method, url, *args, **kwargs):
+        profile = QueryProfile()
+        with profile.capture():
+            response = getattr(self.client, method)(url, *args, **kwargs)
+        return response, profile
+
+    def assertQueryBudget(self, budget, method, url, *args, **kwargs):
+        response, profile = self._profiled_request(method, url, *args, **kwargs)
+        if profile.count > budget:
+            lines = [f"{method.upper()} {url} ran {profile.count} queries, budget is {budget}"]
+            for sql, count in profile.duplicates:
+                lines.append(f"  {count}× {sql}")
+            self.fail('\n'.join(lines))
+        return response
+
+    def assertQueryCount(self, expected, method, url, *args, **kwargs):
+        """Like assertQueryBudget, but the request must run exactly `expected` queries"""
+        response, profile = self._profiled_request(method, url, *args, **kwargs)
+        if profile.count != expected:
+            lines = [f"{method.upper()} {url} ran {profile.count} queries, expected {expected}"]
+            for sql, count in profile.fingerprints.most_common():
+                lines.append(f"  {count}× {sql}")
+            self.fail('\n'.join(lines))
+        return response
@@ -0,0 +1,113 @@
+import json
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from leads.models import Lead
+
+from .profiling import QueryProfileReport, QueryProfileReportView, fingerprint, report
+
+
+class FakeProfile:
+    """Stand-in for a finished QueryProfile"""
+
+    def __init__(self, count, duration_ms, fingerprints):
+        self.count = count
+        self.duration_ms = duration_ms
+        self.fingerprints = Counter(fingerprints)
+        self.duplicates = [(sql, repeats) for sql, repeats in self.fingerprints.most_common() if repeats > 1]
+        self.duplicate_count = sum(repeats - 1 for _, repeats in self.duplicates)
+
+
+class QueryProfileReportTests(TestCase):
+    """Statements differing only in parameters share a fingerprint; the report averages per view"""
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint('SELECT *\n  FROM "leads_lead"  WHERE "id" IN (%s, %s,%s)'),
+            'SELECT * FROM "leads_lead" WHERE "id" IN (...)',
+        )
+        self.assertEqual(fingerprint('WHERE "id" IN (%s)'), fingerprint('WHERE "id" IN (%s, %s)'))
+
+    def test_aggregation(self):
+        profile_report = QueryProfileReport()
+        profile_report.add('leads:lead_list', FakeProfile(3, 1.5, {'SELECT a': 1, 'SELECT b': 2}))
+        profile_report.add('leads:lead_list', FakeProfile(7, 2.5, {'SELECT a': 1, 'SELECT b': 6}))
+        self.assertEqual(profile_report.add('leads:analytics', FakeProfile(1, 0.5, {'SELECT c': 1})), 3)
+
+        heaviest, lightest = profile_report.snapshot()
+        self.assertEqual(heaviest, {
+            'view': 'leads:lead_list',
+            'requests': 2,
+            'avg_queries': 5.0,
+            'max_queries': 7,
+            'avg_sql_ms': 2.0,
+            'duplicate_queries': 6,
+            'top_duplicates': [{'sql': 'SELECT b', 'repeats': 6}],
+        })
+        self.assertEqual(lightest['view'], 'leads:analytics')
+        self.assertEqual(lightest['top_duplicates'], [])
+
+        profile_report.reset()
+        self.assertEqual((profile_report.requests, profile_report.snapshot()), (0, []))
+
+    def test_report_view_is_staff_only(self):
+        report.reset()
+        report.add('leads:lead_list', FakeProfile(2, 1.0, {'SELECT a': 2}))
+        factory = RequestFactory()
+        view = QueryProfileReportView.as_view()
+
+        for user in [AnonymousUser(), User.objects.create_user('lawyer')]:
+            request = factory.get('/debug/query-profile/')
+            request.user = user
+            self.assertEqual(view(request).status_code, 403)
+
+        request = factory.get('/debug/query-profile/')
+        request.user = User.objects.create_user('staff', is_staff=True)
+        payload = json.loads(view(request).content)
+        self.assertEqual(payload['requests'], 1)
+        self.assertEqual(payload['views'][0]['view'], 'leads:lead_list')
+
+        request = factory.get('/debug/query-profile/', {'reset': 1})
+        request.user = User.objects.get(username='staff')
+        self.assertEqual(json.loads(view(request).content), {'requests': 0, 'views': []})
+
+
+@override_settings(QUERY_PROFILING=True, MIDDLEWARE=['adylai.profiling.QueryProfilingMiddleware'] + settings.MIDDLEWARE)
+class QueryProfilingMiddlewareTests(TestCase):
+    """Responses carry X-Query-* headers; streamed exports are profiled until the body is sent"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lawyer', password='secret')
+        for index in range(3):
+            Lead.objects.create(lawyer=cls.user.lawyer_profile, name=f'Клиент {index}', phone=f'+99670000000{index}')
+
+    def setUp(self):
+        report.reset()
+        self.client.force_login(self.user)
+
+    def test_headers(self):
+        response = self.client.get(reverse('leads:lead_list'))
+        self.assertEqual(response.status_code, 200)
+        stats = report.views['leads:lead_list']
+        self.assertEqual(int(response['X-Query-Count']), stats['queries'])
+        self.assertEqual(int(response['X-Query-Duplicates']), stats['duplicate_queries'])
+        self.assertGreaterEqual(float(response['X-Query-Time-Ms']), 0)
+        self.assertEqual(report.requests, 1)
+
+    def test_streaming_export(self):
+        response = self.client.get(reverse('leads:lead_export'))
+        self.assertTrue(response.streaming)
+        self.assertNotIn('X-Query-Count', response)
+        # Nothing is recorded until the body has been sent
+        self.assertEqual(report.requests, 0)
+
+        body = b''.join(response.streaming_content).decode('utf-8-sig')
+        self.assertIn('Клиент 2', body)
+        self.assertEqual(report.requests, 1)
+        # The lead rows are fetched while streaming and counted with the request
+        self.assertGreater(report.views['leads:lead_export']['queries'], 2)
@@ -54,6 +54,11 @@ if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 
+# Aggregated query profile (only when QUERY_PROFILING is enabled)
+if settings.QUERY_PROFILING:
+    from .profiling import QueryProfileReportView
+    urlpatterns.insert(0, path('debug/query-profile/', QueryProfileReportView.as_view(), name='query_profile'))
+
 # Admin site configuration
 admin.site.site_header = "Lawyer Website Builder"
 admin.site.site_title = "Lawyer Platform"
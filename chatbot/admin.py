@@ -1,15 +1,18 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 from django.utils.html import format_html
-from .models import ChatSession, ChatMessage, ChatConfiguration, ChatFeedback, ChatAnalytics
+from adylai.admin import EstimatedCountAdminMixin, related_filter
+from .models import ChatSession, ChatMessage, ChatTurnTiming, ChatConfiguration, ChatFeedback, ChatAnalytics
 
 
 @admin.register(ChatSession)
-class ChatSessionAdmin(admin.ModelAdmin):
-    list_display = ['visitor_display', 'lawyer', 'status', 'language', 'is_lead_display', 'started_at']
+class ChatSessionAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
+    list_display = ['visitor_display', 'lawyer', 'status', 'language', 'user_message_count', 'ai_message_count', 'last_message_preview', 'is_lead_display', 'started_at']
     list_filter = ['status', 'language', 'consultation_requested', 'started_at']
     search_fields = ['visitor_name', 'visitor_email', 'visitor_phone', 'lawyer__user__username']
-    readonly_fields = ['session_id', 'started_at', 'last_activity', 'duration']
+    list_select_related = ['lawyer__user']
+    raw_id_fields = ['lead']
+    readonly_fields = ['session_id', 'started_at', 'last_activity', 'duration', 'user_message_count', 'ai_message_count', 'total_tokens', 'last_message_preview', 'last_message_at']
     
     fieldsets = (
         (_('Session Information'), {
@@ -19,7 +22,11 @@ class ChatSessionAdmin(admin.ModelAdmin):
             'fields': ('visitor_name', 'visitor_email', 'visitor_phone', 'visitor_ip')
         }),
         (_('Case Information'), {
-            'fields': ('legal_category', 'consultation_requested', 'consultation_message', 'preferred_contact_method')
+            'fields': ('legal_category', 'consultation_requested', 'consultation_message', 'preferred_contact_method', 'lead')
+        }),
+        (_('Message Statistics'), {
+            'fields': ('user_message_count', 'ai_message_count', 'total_tokens', 'last_message_preview', 'last_message_at'),
+            'classes': ('collapse',)
         }),
         (_('Technical Details'), {
             'fields': ('user_agent', 'referrer'),
@@ -48,10 +55,12 @@ class ChatSessionAdmin(admin.ModelAdmin):
 
 
 @admin.register(ChatMessage)
-class ChatMessageAdmin(admin.ModelAdmin):
+class ChatMessageAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ['session_visitor', 'message_type', 'content_preview', 'response_time_ms', 'created_at']
     list_filter = ['message_type', 'ai_model', 'is_helpful', 'needs_review', 'created_at']
     search_fields = ['session__visitor_name', 'content']
+    list_select_related = ['session__lawyer__user']
+    raw_id_fields = ['session']
     readonly_fields = ['created_at']
     
     fieldsets = (
@@ -80,19 +89,33 @@ class ChatMessageAdmin(admin.ModelAdmin):
     content_preview.short_description = _('Content')
 
 
+@admin.register(ChatTurnTiming)
+class ChatTurnTimingAdmin(EstimatedCountAdminMixin, admin.ModelAdmin):
+    list_display = ['session', 'outcome', 'route', 'intent', 'max_tokens', 'tokens_used', 'session_lookup_ms', 'prompt_build_ms', 'upstream_ttfb_ms', 'upstream_total_ms', 'persist_ms', 'total_ms', 'created_at']
+    list_filter = ['outcome', 'route', 'intent', 'created_at']
+    search_fields = ['lawyer__user__username']
+    list_select_related = ['session__lawyer__user']
+    readonly_fields = [field.name for field in ChatTurnTiming._meta.fields]
+    date_hierarchy = 'created_at'
+    
+    def has_add_permission(self, request):
+        return False
+
+
 @admin.register(ChatConfiguration)
 class ChatConfigurationAdmin(admin.ModelAdmin):
     list_display = ['lawyer', 'ai_model', 'collect_contact_info', 'office_hours_enabled', 'updated_at']
     list_filter = ['ai_model', 'collect_contact_info', 'office_hours_enabled', 'show_disclaimer']
     search_fields = ['lawyer__user__username']
-    readonly_fields = ['created_at', 'updated_at']
+    list_select_related = ['lawyer__user']
+    readonly_fields = ['office_hours_compiled', 'created_at', 'updated_at']
     
     fieldsets = (
         (_('Basic Configuration'), {
             'fields': ('lawyer', 'ai_model', 'system_prompt')
         }),
         (_('AI Settings'), {
-            'fields': ('max_tokens', 'temperature', 'response_delay_seconds')
+            'fields': ('max_tokens', 'temperature', 'generation_policy', 'response_delay_seconds')
         }),
         (_('Chat Behavior'), {
             'fields': ('collect_contact_info', 'auto_suggest_consultation')
@@ -101,7 +124,7 @@ class ChatConfigurationAdmin(admin.ModelAdmin):
             'fields': ('welcome_message_ru', 'welcome_message_ky', 'welcome_message_en')
         }),
         (_('Business Hours'), {
-            'fields': ('office_hours_enabled', 'office_hours', 'offline_message')
+            'fields': ('office_hours_enabled', 'office_hours', 'office_hours_compiled', 'offline_message')
         }),
         (_('Legal & Compliance'), {
             'fields': ('legal_disclaimer', 'show_disclaimer')
@@ -121,6 +144,8 @@ class ChatFeedbackAdmin(admin.ModelAdmin):
     list_display = ['session_visitor', 'rating', 'would_recommend', 'created_at']
     list_filter = ['rating', 'would_recommend', 'helpfulness', 'response_quality', 'ease_of_use']
     search_fields = ['session__visitor_name', 'comment']
+    list_select_related = ['session__lawyer__user']
+    raw_id_fields = ['session']
     readonly_fields = ['created_at']
     
     fieldsets = (
@@ -144,8 +169,9 @@ class ChatFeedbackAdmin(admin.ModelAdmin):
 @admin.register(ChatAnalytics)
 class ChatAnalyticsAdmin(admin.ModelAdmin):
     list_display = ['lawyer', 'date', 'total_sessions', 'leads_generated', 'avg_rating', 'conversion_rate']
-    list_filter = ['date', 'lawyer']
+    list_filter = ['date', ('lawyer', related_filter('user'))]
     search_fields = ['lawyer__user__username']
+    list_select_related = ['lawyer__user']
     readonly_fields = ['created_at']
     date_hierarchy = 'date'
     
@@ -0,0 +1,166 @@
+from datetime import datetime, time, timedelta
+from django.db import connections
+from django.db.models import Aggregate, Avg, Count, FloatField, Max, Min, Q
+from django.utils import timezone
+
+
+# Message types that carry AI response metadata ('ai' from ChatbotService, 'assistant' from the chat API)
+AI_MESSAGE_TYPES = ['ai', 'assistant']
+
+# Upper bounds (ms) of the fixed latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [500, 1000, 2000, 3000, 5000, 8000, 13000, 20000, 30000]
+
+# Finer buckets for individual pipeline stages, most of which take a few milliseconds
+STAGE_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+PERCENTILES = [50, 90, 99]
+
+WEEKDAY_LABELS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+
+def local_time_buckets(value=None):
+    """Return (hour, weekday) of a datetime in the project time zone; Monday is 0"""
+    local = timezone.localtime(value or timezone.now())
+    return local.hour, local.weekday()
+
+
+def local_day_start(days_ago=0):
+    """
+    Aware datetime at local midnight `days_ago` days back. Filtering on a range
+    between two of these keeps index range scans, unlike `__date` lookups which
+    wrap the column in a function.
+    """
+    day = timezone.localdate() - timedelta(days=days_ago)
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def peak_hours(queryset, limit=3):
+    """Busiest local hours, grouped on the stored local_hour bucket"""
+    rows = queryset.filter(local_hour__isnull=False).values('local_hour').annotate(
+        count=Count('pk')
+    ).order_by('-count', 'local_hour')[:limit]
+    return [
+        {'hour': row['local_hour'], 'label': f"{row['local_hour']:02d}:00–{(row['local_hour'] + 1) % 24:02d}:00", 'count': row['count']}
+        for row in rows
+    ]
+
+
+def weekday_hour_heatmap(queryset):
+    """7×24 matrix of counts by stored local weekday and hour, with 0–4 intensity levels"""
+    matrix = [[0] * 24 for _ in range(7)]
+    rows = queryset.filter(local_hour__isnull=False, local_weekday__isnull=False).values(
+        'local_weekday', 'local_hour'
+    ).annotate(count=Count('pk')).order_by()
+    for row in rows:
+        matrix[row['local_weekday']][row['local_hour']] = row['count']
+
+    peak = max(max(hours) for hours in matrix)
+    return [
+        {
+            'label': WEEKDAY_LABELS[weekday],
+            'total': sum(hours),
+            'cells': [
+                {'hour': hour, 'count': count, 'level': (count * 4 + peak - 1) // peak if peak else 0}
+                for hour, count in enumerate(hours)
+            ],
+        }
+        for weekday, hours in enumerate(matrix)
+    ]
+
+
+class PercentileCont(Aggregate):
+    """PostgreSQL percentile_cont ordered-set aggregate"""
+    function = 'PERCENTILE_CONT'
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+def _format_ms(value):
+    return f"{value / 1000:g}s" if value >= 1000 else f"{value}ms"
+
+
+def _bucket_label(lower, upper):
+    if upper is None:
+        return f"≥{_format_ms(lower)}"
+    return f"{_format_ms(lower)}–{_format_ms(upper)}"
+
+
+def _percentile_from_histogram(histogram, total, fraction):
+    """Estimate a percentile by linear interpolation inside the matching bucket"""
+    target = total * fraction
+    seen = 0
+    for bucket in histogram:
+        if bucket['count'] and seen + bucket['count'] >= target:
+            if bucket['upper_ms'] is None:
+                return bucket['lower_ms']
+            position = (target - seen) / bucket['count']
+            return bucket['lower_ms'] + position * (bucket['upper_ms'] - bucket['lower_ms'])
+        seen += bucket['count']
+    return None
+
+
+def latency_summary(queryset, field, buckets=LATENCY_BUCKETS_MS):
+    """
+    Aggregate count, average, p50/p90/p99 and a fixed-bucket histogram of a
+    millisecond field in a single query. Percentiles are exact on PostgreSQL
+    and interpolated from the histogram on other backends.
+    """
+    queryset = queryset.filter(**{f'{field}__isnull': False})
+    bounds = list(zip([0] + list(buckets), list(buckets) + [None]))
+
+    aggregates = {'count': Count('pk'), 'avg': Avg(field), 'min': Min(field), 'max': Max(field)}
+    for index, (lower, upper) in enumerate(bounds):
+        condition = Q(**{f'{field}__gte': lower})
+        if upper is not None:
+            condition &= Q(**{f'{field}__lt': upper})
+        aggregates[f'bucket_{index}'] = Count('pk', filter=condition)
+
+    exact = connections[queryset.db].vendor == 'postgresql'
+    if exact:
+        for percentile in PERCENTILES:
+            aggregates[f'p{percentile}'] = PercentileCont(field, percentile / 100)
+
+    row = queryset.aggregate(**aggregates)
+    total = row['count']
+
+    histogram = []
+    for index, (lower, upper) in enumerate(bounds):
+        count = row[f'bucket_{index}']
+        histogram.append({
+            'label': _bucket_label(lower, upper),
+            'lower_ms': lower,
+            'upper_ms': upper,
+            'count': count,
+            'percentage': round(count / total * 100, 1) if total else 0,
+        })
+
+    summary = {
+        'count': total,
+        'avg_ms': round(row['avg']) if row['avg'] is not None else None,
+        'min_ms': row['min'],
+        'max_ms': row['max'],
+        'exact': exact,
+        'histogram': histogram,
+    }
+    for percentile in PERCENTILES:
+        if exact:
+            value = row[f'p{percentile}']
+        else:
+            value = _percentile_from_histogram(histogram, total, percentile / 100) if total else None
+            if value is not None:
+                value = min(max(value, row['min']), row['max'])
+        summary[f'p{percentile}_ms'] = round(value) if value is not None else None
+
+    return summary
+
+
+def stage_latency_report(queryset):
+    """latency_summary() for every pipeline stage of ChatTurnTiming rows, plus the turn total"""
+    stages = list(queryset.model.STAGES) + ['total']
+    return [
+        {'stage': stage, **latency_summary(queryset, f'{stage}_ms', STAGE_BUCKETS_MS)}
+        for stage in stages
+    ]
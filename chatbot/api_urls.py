@@ -8,5 +8,6 @@ urlpatterns = [
     path('send/', api_views.SendMessageAPIView.as_view(), name='send_message'),
     path('contact/', api_views.SubmitContactAPIView.as_view(), name='submit_contact'),
     path('schedule/', api_views.ScheduleAppointmentAPIView.as_view(), name='schedule_appointment'),
+    path('schedule/slots/', api_views.AvailableSlotsAPIView.as_view(), name='available_slots'),
     path('history/', api_views.GetChatHistoryAPIView.as_view(), name='chat_history'),
 ] 
\ No newline at end of file
@@ -4,13 +4,24 @@ from django.utils.decorators import method_decorator
 from django.views import View
 from django.shortcuts import get_object_or_404
 from django.conf import settings
+from django.db import transaction
 import json
 import requests
 import uuid
 from datetime import datetime
 from lawyers.models import Lawyer
 from leads.models import Lead
+from leads.notifications import notify_consultation_booked, notify_new_lead
 from .models import ChatSession, ChatMessage
+from .instrumentation import TurnTimer, timed_post
+from .language import SUPPORTED_LANGUAGES, detect_session_language
+from .prompts import LANGUAGE_DIRECTIVES, cached_prompt
+from .extraction import extract_contacts, normalize_email, normalize_phone
+from .generation import INTENT_CONTACT, INTENT_SMALL_TALK, detect_intent, generation_params, get_chat_config
+from .routing import (
+    ROUTE_LIGHT, ROUTE_TEMPLATE, build_light_prompt, light_model_options, log_route,
+    mentions_legal_topic, route_message, template_response,
+)
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -24,7 +35,12 @@ class StartChatAPIView(View):
             visitor_name = data.get('visitor_name', 'Anonymous')
             
             # Get lawyer
-            lawyer = get_object_or_404(Lawyer, domain_slug=lawyer_slug)
+            lawyer = get_object_or_404(Lawyer.objects.select_related('user'), domain_slug=lawyer_slug)
+            
+            # Start in the requested or the lawyer's language; the first messages refine it
+            language = data.get('language')
+            if language not in SUPPORTED_LANGUAGES:
+                language = lawyer.primary_language if lawyer.primary_language in SUPPORTED_LANGUAGES else 'ru'
             
             # Create chat session
             session = ChatSession.objects.create(
@@ -32,7 +48,7 @@ class StartChatAPIView(View):
                 visitor_name=visitor_name,
                 visitor_ip=request.META.get('REMOTE_ADDR'),
                 status='active',
-                language='ru',  # Default to Russian
+                language=language,
                 user_agent=request.META.get('HTTP_USER_AGENT', ''),
                 referrer=request.META.get('HTTP_REFERER', '')
             )
@@ -72,126 +88,108 @@ class SendMessageAPIView(View):
     """Send message to AI and get response"""
     
     def post(self, request):
+        timer = TurnTimer(request)
+        session = None
         try:
-            data = json.loads(request.body)
-            session_id = data.get('session_id')
-            user_message = data.get('message', '').strip()
+            with timer.stage('parse'):
+                data = json.loads(request.body)
+                session_id = data.get('session_id')
+                user_message = data.get('message', '').strip()
             
             if not user_message:
                 return JsonResponse({'success': False, 'error': 'Message is required'})
             
             # Get chat session
-            session = get_object_or_404(ChatSession, session_id=session_id)
-            lawyer = session.lawyer
+            with timer.stage('session_lookup'):
+                session = get_object_or_404(
+                    ChatSession.objects.select_related('lawyer__user', 'lawyer__chat_config'), session_id=session_id
+                )
+                lawyer = session.lawyer
             
             # Save user message
-            user_chat_message = ChatMessage.objects.create(
-                session=session,
-                message_type='user',
-                content=user_message
-            )
+            with timer.stage('persist'):
+                user_chat_message = ChatMessage.objects.create(
+                    session=session,
+                    message_type='user',
+                    content=user_message
+                )
             
-            # Enhanced keyword detection for different types of requests
-            explicit_appointment_keywords = ['записаться', 'встретиться', 'назначить встречу', 'прийти к вам', 'личная консультация', 'очная консультация']
-            legal_keywords = ['закон', 'право', 'суд', 'договор', 'иск', 'развод', 'наследство', 'трудовой', 'административный', 'уголовный', 'гражданский', 'алименты', 'собственность', 'штраф', 'налог', 'регистрация', 'лицензия', 'аренда', 'купля', 'продажа']
-            
-            # Only consider explicit appointment requests, not general contact questions
-            asking_for_appointment = any(keyword in user_message.lower() for keyword in explicit_appointment_keywords)
-            asking_legal_question = any(keyword in user_message.lower() for keyword in legal_keywords)
-            
-            # Determine conversation context
-            conversation_context = "general"
-            if asking_for_appointment:
-                conversation_context = "appointment"
-            elif asking_legal_question:
-                conversation_context = "legal_consultation"
-            
-            # Update session with legal category if detected
-            if asking_legal_question and not session.legal_category:
-                # Try to determine specific legal category
-                if any(word in user_message.lower() for word in ['развод', 'алименты', 'брак', 'семья']):
-                    session.legal_category = 'Семейное право'
-                elif any(word in user_message.lower() for word in ['работа', 'трудовой', 'зарплата', 'увольнение']):
-                    session.legal_category = 'Трудовое право'
-                elif any(word in user_message.lower() for word in ['договор', 'сделка', 'покупка', 'продажа']):
-                    session.legal_category = 'Гражданское право'
-                elif any(word in user_message.lower() for word in ['штраф', 'административный', 'нарушение']):
-                    session.legal_category = 'Административное право'
-                elif any(word in user_message.lower() for word in ['наследство', 'завещание', 'наследник']):
-                    session.legal_category = 'Наследственное право'
+            with timer.stage('classify'):
+                conversation_context, legal_category = self.classify_message(user_message, session)
+                decision = route_message(user_message, conversation_context, in_legal_thread=bool(session.legal_category))
+                intent = INTENT_SMALL_TALK if decision.route == ROUTE_TEMPLATE else detect_intent(user_message, conversation_context)
+                # The user message is already saved and counted on the session
+                language = detect_session_language(session, user_message, session.user_message_count)
+            
+            session_updates = []
+            if legal_category:
+                session.legal_category = legal_category
+                session_updates.append('legal_category')
+            if language:
+                session.language = language
+                session_updates.append('language')
+            if intent == INTENT_CONTACT:
+                # Keep contacts the visitor typed into the chat, normalized
+                contact = extract_contacts(user_message)
+                for field, value in (('visitor_phone', contact.phone), ('visitor_email', contact.email), ('visitor_name', contact.name)):
+                    if value and not getattr(session, field):
+                        setattr(session, field, value)
+                        session_updates.append(field)
+            if session_updates:
+                with timer.stage('persist'):
+                    session.save(update_fields=session_updates + ['last_activity'])
+            
+            # Small talk is answered locally without calling the model
+            if decision.route == ROUTE_TEMPLATE:
+                ai_message = template_response(decision.template, lawyer, session.language)
+                with timer.stage('persist'):
+                    ChatMessage.objects.create(
+                        session=session,
+                        message_type='assistant',
+                        content=ai_message,
+                        ai_model='template'
+                    )
+                timer.save(session, route=decision.route, intent=intent, tokens_used=0)
+                log_route(decision, session, latency_ms=round(timer.total_ms), tokens=0)
+                return JsonResponse({'success': True, 'message': ai_message, 'should_collect_contact': False})
+            
+            # Token cap and temperature follow the intent; light turns also get a compact prompt
+            with timer.stage('prompt_build'):
+                generation = generation_params(intent, get_chat_config(lawyer))
+                if decision.route == ROUTE_LIGHT:
+                    system_prompt = build_light_prompt(lawyer)
+                    light = light_model_options()
+                    generation.update(
+                        model=light['model'],
+                        max_tokens=min(generation['max_tokens'], light['max_tokens']),
+                        history_size=2,
+                    )
                 else:
-                    session.legal_category = 'Общая консультация'
-                session.save()
+                    system_prompt = cached_prompt(
+                        'consultation', lawyer, session.language,
+                        lambda: self.build_system_prompt(lawyer, session.language)
+                    )
             
-            # Prepare enhanced system prompt for DeepSeek
-            system_prompt = f"""Вы - профессиональный юридический консультант и помощник юриста {lawyer.user.get_full_name()} в Кыргызстане. Вы обладаете глубокими знаниями в области права КР и можете предоставлять квалифицированные консультации.
-
-ИНФОРМАЦИЯ О ЮРИСТЕ:
-- Имя: {lawyer.user.get_full_name()}
-- Опыт работы: {lawyer.years_experience} лет
-- Специализации: {', '.join(lawyer.specialties) if lawyer.specialties else 'Общая юридическая практика'}
-- Контакты: {lawyer.user.email}
-- Стоимость консультации: {lawyer.consultation_fee if lawyer.consultation_fee > 0 else 'Первая консультация бесплатно'} сом
-
-ГЛАВНЫЙ ПРИНЦИП РАБОТЫ:
-ВСЕГДА СНАЧАЛА ПРЕДОСТАВЛЯЙТЕ ПОЛЕЗНУЮ ЮРИДИЧЕСКУЮ ИНФОРМАЦИЮ И СОВЕТЫ, ОТВЕЧАЙТЕ НА ВОПРОС КЛИЕНТА МАКСИМАЛЬНО ПОДРОБНО И ТОЛЬКО ПОТОМ при необходимости предлагайте личную встречу.
-
-ВАШИ ВОЗМОЖНОСТИ:
-1. ОСНОВНАЯ ЗАДАЧА - ЮРИДИЧЕСКОЕ КОНСУЛЬТИРОВАНИЕ:
-   - ОБЯЗАТЕЛЬНО объясняйте правовые нормы КР простым языком
-   - ВСЕГДА анализируйте правовые ситуации и давайте конкретные рекомендации
-   - ПОДРОБНО разъясняйте процедуры и требования законодательства
-   - Помогайте с составлением документов (общие рекомендации с примерами)
-   - Давайте детальные консультации по семейному, трудовому, гражданскому, административному праву
-
-2. ПРАКТИЧЕСКАЯ ПОМОЩЬ:
-   - ДЕТАЛЬНО объясняйте пошаговые действия для решения правовых вопросов
-   - КОНКРЕТНО рассказывайте о необходимых документах и сроках
-   - ОБЯЗАТЕЛЬНО предупреждайте о возможных рисках и последствиях
-   - Давайте практические советы по взаимодействию с госорганами
-
-3. ЗАПИСЬ НА КОНСУЛЬТАЦИЮ (ТОЛЬКО КОГДА ДЕЙСТВИТЕЛЬНО НЕОБХОДИМО):
-   - Предлагайте личную встречу ТОЛЬКО в следующих случаях:
-     * Нужен анализ большого количества документов
-     * Сложное судебное дело требующее детального изучения
-     * Клиент просит о встрече
-     * Дело требует представительства в суде
-   - НЕ спрашивайте контакты сразу - сначала дайте полную консультацию
-   - Объясняйте конкретные преимущества очной консультации
-
-ОБЯЗАТЕЛЬНЫЕ ПРАВИЛА:
-- ВСЕГДА отвечайте профессионально, но доступным языком
-- ОБЯЗАТЕЛЬНО давайте конкретные и практичные советы по вопросу
-- Ссылайтесь на соответствующие статьи законов КР когда это уместно
-- СНАЧАЛА максимально помогите онлайн, потом предлагайте встречу
-- Всегда предупреждайте о важности соблюдения сроков
-- Будьте максимально внимательны к деталям дела клиента
-
-ОГРАНИЧЕНИЯ:
-- Не давайте советы по уголовным делам без очной консультации
-- При конфликте интересов направляйте к юристу
-- Не гарантируйте 100% результат без изучения документов
-
-ВАЖНО: Ваша цель - максимально помочь клиенту прямо сейчас, дать ему полезную информацию и конкретные советы. Встреча нужна только если онлайн-консультация недостаточна."""
-
             # Call DeepSeek API
             try:
-                response = self.get_ai_response(system_prompt, user_message, session)
+                response = self.get_ai_response(system_prompt, user_message, session, timer, **generation)
                 ai_message = response.get('content', 'Извините, произошла ошибка. Пожалуйста, свяжитесь с нами напрямую.')
                 
                 # Save AI response
-                ChatMessage.objects.create(
-                    session=session,
-                    message_type='assistant', 
-                    content=ai_message,
-                    ai_model='deepseek-chat',
-                    response_time_ms=response.get('response_time', 0),
-                    tokens_used=response.get('tokens_used', 0)
-                )
+                with timer.stage('persist'):
+                    ChatMessage.objects.create(
+                        session=session,
+                        message_type='assistant', 
+                        content=ai_message,
+                        ai_model=response['model'],
+                        response_time_ms=response.get('response_time', 0),
+                        tokens_used=response.get('tokens_used', 0)
+                    )
                 
                 # Check if we need to collect contact info - only for explicit appointment requests
                 # Also ensure we've had at least a couple exchanges before suggesting appointments
-                message_count = ChatMessage.objects.filter(session=session, message_type='user').count()
+                asking_for_appointment = conversation_context == 'appointment'
+                message_count = session.user_message_count
                 should_collect_contact = (asking_for_appointment and not session.visitor_phone) or (
                     message_count >= 3 and 'записаться' in ai_message.lower() and not session.visitor_phone
                 )
@@ -209,6 +207,11 @@ class SendMessageAPIView(View):
                         'fields': ['name', 'phone', 'email']
                     }
                 
+                timer.save(
+                    session, route=decision.route, intent=intent,
+                    max_tokens=generation['max_tokens'], tokens_used=response.get('tokens_used')
+                )
+                log_route(decision, session, response.get('response_time'), response.get('tokens_used'), response['model'])
                 return JsonResponse(response_data)
                 
             except Exception as ai_error:
@@ -229,13 +232,16 @@ class SendMessageAPIView(View):
                     # Use simple rule-based fallback for common legal questions
                     fallback_message = self.get_simple_legal_response(user_message, lawyer)
                 
-                ChatMessage.objects.create(
-                    session=session,
-                    message_type='assistant',
-                    content=fallback_message,
-                    ai_model='fallback'
-                )
+                with timer.stage('persist'):
+                    ChatMessage.objects.create(
+                        session=session,
+                        message_type='assistant',
+                        content=fallback_message,
+                        ai_model='fallback'
+                    )
                 
+                timer.save(session, outcome='fallback', route=decision.route, intent=intent, max_tokens=generation['max_tokens'])
+                log_route(decision, session, latency_ms=round(timer.total_ms), model='fallback')
                 return JsonResponse({
                     'success': True,
                     'message': fallback_message,
@@ -248,10 +254,103 @@ class SendMessageAPIView(View):
                 })
                 
         except Exception as e:
+            if session is not None:
+                # Failed turns are part of the latency data too
+                timer.save(session, outcome='error')
             return JsonResponse({'success': False, 'error': str(e)}, status=400)
     
-    def get_ai_response(self, system_prompt, user_message, session):
+    def classify_message(self, user_message, session):
+        """Detect the conversation context and, for new legal questions, the legal category"""
+        message_lower = user_message.lower()
+        
+        # Enhanced keyword detection for different types of requests
+        explicit_appointment_keywords = ['записаться', 'встретиться', 'назначить встречу', 'прийти к вам', 'личная консультация', 'очная консультация']
+        
+        # Only consider explicit appointment requests, not general contact questions
+        asking_for_appointment = any(keyword in message_lower for keyword in explicit_appointment_keywords)
+        asking_legal_question = mentions_legal_topic(message_lower)
+        
+        # Determine conversation context
+        conversation_context = "general"
+        if asking_for_appointment:
+            conversation_context = "appointment"
+        elif asking_legal_question:
+            conversation_context = "legal_consultation"
+        
+        # Determine a legal category for the session if not known yet
+        legal_category = ''
+        if asking_legal_question and not session.legal_category:
+            if any(word in message_lower for word in ['развод', 'алименты', 'брак', 'семья']):
+                legal_category = 'Семейное право'
+            elif any(word in message_lower for word in ['работа', 'трудовой', 'зарплата', 'увольнение']):
+                legal_category = 'Трудовое право'
+            elif any(word in message_lower for word in ['договор', 'сделка', 'покупка', 'продажа']):
+                legal_category = 'Гражданское право'
+            elif any(word in message_lower for word in ['штраф', 'административный', 'нарушение']):
+                legal_category = 'Административное право'
+            elif any(word in message_lower for word in ['наследство', 'завещание', 'наследник']):
+                legal_category = 'Наследственное право'
+            else:
+                legal_category = 'Общая консультация'
+        
+        return conversation_context, legal_category
+    
+    def build_system_prompt(self, lawyer, language='ru'):
+        """Build the consultation system prompt for DeepSeek, with a response-language directive"""
+        return f"""Вы - профессиональный юридический консультант и помощник юриста {lawyer.user.get_full_name()} в Кыргызстане. Вы обладаете глубокими знаниями в области права КР и можете предоставлять квалифицированные консультации.
+
+ИНФОРМАЦИЯ О ЮРИСТЕ:
+- Имя: {lawyer.user.get_full_name()}
+- Опыт работы: {lawyer.years_experience} лет
+- Специализации: {', '.join(lawyer.specialties) if lawyer.specialties else 'Общая юридическая практика'}
+- Контакты: {lawyer.user.email}
+- Стоимость консультации: {lawyer.consultation_fee if lawyer.consultation_fee > 0 else 'Первая консультация бесплатно'} сом
+
+ГЛАВНЫЙ ПРИНЦИП РАБОТЫ:
+ВСЕГДА СНАЧАЛА ПРЕДОСТАВЛЯЙТЕ ПОЛЕЗНУЮ ЮРИДИЧЕСКУЮ ИНФОРМАЦИЮ И СОВЕТЫ, ОТВЕЧАЙТЕ НА ВОПРОС КЛИЕНТА МАКСИМАЛЬНО ПОДРОБНО И ТОЛЬКО ПОТОМ при необходимости предлагайте личную встречу.
+
+ВАШИ ВОЗМОЖНОСТИ:
+1. ОСНОВНАЯ ЗАДАЧА - ЮРИДИЧЕСКОЕ КОНСУЛЬТИРОВАНИЕ:
+   - ОБЯЗАТЕЛЬНО объясняйте правовые нормы КР простым языком
+   - ВСЕГДА анализируйте правовые ситуации и давайте конкретные рекомендации
+   - ПОДРОБНО разъясняйте процедуры и требования законодательства
+   - Помогайте с составлением документов (общие рекомендации с примерами)
+   - Давайте детальные консультации по семейному, трудовому, гражданскому, административному праву
+
+2. ПРАКТИЧЕСКАЯ ПОМОЩЬ:
+   - ДЕТАЛЬНО объясняйте пошаговые действия для решения правовых вопросов
+   - КОНКРЕТНО рассказывайте о необходимых документах и сроках
+   - ОБЯЗАТЕЛЬНО предупреждайте о возможных рисках и последствиях
+   - Давайте практические советы по взаимодействию с госорганами
+
+3. ЗАПИСЬ НА КОНСУЛЬТАЦИЮ (ТОЛЬКО КОГДА ДЕЙСТВИТЕЛЬНО НЕОБХОДИМО):
+   - Предлагайте личную встречу ТОЛЬКО в следующих случаях:
+     * Нужен анализ большого количества документов
+     * Сложное судебное дело требующее детального изучения
+     * Клиент просит о встрече
+     * Дело требует представительства в суде
+   - НЕ спрашивайте контакты сразу - сначала дайте полную консультацию
+   - Объясняйте конкретные преимущества очной консультации
+
+ОБЯЗАТЕЛЬНЫЕ ПРАВИЛА:
+- ВСЕГДА отвечайте профессионально, но доступным языком
+- ОБЯЗАТЕЛЬНО давайте конкретные и практичные советы по вопросу
+- Ссылайтесь на соответствующие статьи законов КР когда это уместно
+- СНАЧАЛА максимально помогите онлайн, потом предлагайте встречу
+- Всегда предупреждайте о важности соблюдения сроков
+- Будьте максимально внимательны к деталям дела клиента
+
+ОГРАНИЧЕНИЯ:
+- Не давайте советы по уголовным делам без очной консультации
+- При конфликте интересов направляйте к юристу
+- Не гарантируйте 100% результат без изучения документов
+
+ВАЖНО: Ваша цель - максимально помочь клиенту прямо сейчас, дать ему полезную информацию и конкретные советы. Встреча нужна только если онлайн-консультация недостаточна.""" + LANGUAGE_DIRECTIVES.get(language, '')
+    
+    def get_ai_response(self, system_prompt, user_message, session, timer=None,
+                        model='deepseek-chat', max_tokens=300, temperature=0.7, history_size=6):
         """Get response from DeepSeek API"""
+        timer = timer or TurnTimer()
         start_time = datetime.now()
         
         # Check if API key is configured
@@ -264,31 +363,33 @@ class SendMessageAPIView(View):
         }
         
         # Get conversation history for context
-        recent_messages = ChatMessage.objects.filter(
-            session=session
-        ).order_by('-created_at')[:6]  # Last 6 messages for context
-        
-        messages = [{'role': 'system', 'content': system_prompt}]
-        
-        for msg in reversed(recent_messages):
-            if msg.message_type == 'user':
-                messages.append({'role': 'user', 'content': msg.content})
-            elif msg.message_type == 'assistant' and msg.ai_model != 'system':
-                messages.append({'role': 'assistant', 'content': msg.content})
-        
-        # Add current user message
-        messages.append({'role': 'user', 'content': user_message})
+        with timer.stage('prompt_build'):
+            recent_messages = ChatMessage.objects.filter(
+                session=session
+            ).order_by('-created_at')[:history_size]  # Recent messages for context
+            
+            messages = [{'role': 'system', 'content': system_prompt}]
+            
+            for msg in reversed(recent_messages):
+                if msg.message_type == 'user':
+                    messages.append({'role': 'user', 'content': msg.content})
+                elif msg.message_type == 'assistant' and msg.ai_model != 'system':
+                    messages.append({'role': 'assistant', 'content': msg.content})
+            
+            # Add current user message
+            messages.append({'role': 'user', 'content': user_message})
         
         payload = {
-            'model': 'deepseek-chat',
+            'model': model,
             'messages': messages,
-            'max_tokens': 300,
-            'temperature': 0.7,
+            'max_tokens': max_tokens,
+            'temperature': temperature,
             'stream': False
         }
         
         try:
-            response = requests.post(
+            response = timed_post(
+                timer,
                 settings.DEEPSEEK_API_URL,
                 headers=headers,
                 json=payload,
@@ -303,6 +404,7 @@ class SendMessageAPIView(View):
             
             return {
                 'content': result['choices'][0]['message']['content'],
+                'model': model,
                 'response_time': response_time,
                 'tokens_used': result.get('usage', {}).get('total_tokens', 0)
             }
@@ -438,13 +540,14 @@ class SubmitContactAPIView(View):
             session_id = data.get('session_id')
             name = data.get('name', '').strip()
             phone = data.get('phone', '').strip()
-            email = data.get('email', '').strip()
+            email = normalize_email(data.get('email', ''))
+            phone = normalize_phone(phone) or phone
             
             if not all([session_id, name, phone]):
                 return JsonResponse({'success': False, 'error': 'Name and phone are required'})
             
             # Get chat session
-            session = get_object_or_404(ChatSession, session_id=session_id)
+            session = get_object_or_404(ChatSession.objects.select_related('lawyer__user'), session_id=session_id)
             lawyer = session.lawyer
             
             # Update session with contact info
@@ -452,23 +555,26 @@ class SubmitContactAPIView(View):
             session.visitor_phone = phone
             session.visitor_email = email
             session.consultation_requested = True
-            session.save()
             
-            # Create lead
-            lead = Lead.objects.create(
-                lawyer=lawyer,
-                name=name,
-                phone=phone,
-                email=email,
-                legal_category='Общая консультация',
-                case_description=f'Запрос на консультацию через чат-бот. Сессия: {session_id}',
-                source='website_chat',
-                status='new',
-                priority='medium',
-                ip_address=request.META.get('REMOTE_ADDR', ''),
-                user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                referrer=request.META.get('HTTP_REFERER', '')
-            )
+            # Create lead, or reuse the one this phone number already has; the lawyer's
+            # notification is queued in the same transaction
+            with transaction.atomic():
+                lead, created = Lead.objects.upsert_by_phone(lawyer, phone, {
+                    'name': name,
+                    'email': email,
+                    'legal_category': 'Общая консультация',
+                    'case_description': f'Запрос на консультацию через чат-бот. Сессия: {session_id}',
+                    'source': 'website_chat',
+                    'status': 'new',
+                    'priority': 'medium',
+                    'ip_address': request.META.get('REMOTE_ADDR', ''),
+                    'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+                    'referrer_url': request.META.get('HTTP_REFERER', ''),
+                })
+                session.lead = lead
+                session.save()
+                if created:
+                    notify_new_lead(lead, lawyer)
             
             # Send confirmation message
             confirmation_message = f"""Отлично! Ваши контакты сохранены.
@@ -500,6 +606,56 @@ class SubmitContactAPIView(View):
             return JsonResponse({'success': False, 'error': str(e)}, status=400)
 
 
+# Chat bookings are one-hour consultations
+APPOINTMENT_DURATION_MINUTES = 60
+
+
+def slot_payload(slot, zone):
+    """A slot in the date/time format ScheduleAppointmentAPIView accepts"""
+    local = slot.astimezone(zone)
+    return {'date': local.strftime('%Y-%m-%d'), 'time': local.strftime('%H:%M')}
+
+
+def slot_conflict_response(lawyer, zone, requested):
+    """409 for a taken slot, with the next free ones from the cached availability index"""
+    # Import here to avoid circular imports
+    from leads.availability import next_free_slots
+    
+    return JsonResponse({
+        'success': False,
+        'error': 'This time is not available',
+        'available_slots': [
+            slot_payload(slot, zone) for slot in next_free_slots(lawyer, 5, APPOINTMENT_DURATION_MINUTES, after=requested)
+        ],
+    }, status=409)
+
+
+class AvailableSlotsAPIView(View):
+    """Next free consultation slots with the session's lawyer"""
+    max_count = 20
+    
+    def get(self, request):
+        # Import here to avoid circular imports
+        from leads.availability import next_free_slots, office_schedule
+        
+        session_id = request.GET.get('session_id')
+        if not session_id:
+            return JsonResponse({'success': False, 'error': 'Session ID required'})
+        try:
+            count = min(max(int(request.GET.get('count', 5)), 1), self.max_count)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'count must be an integer'}, status=400)
+        
+        session = get_object_or_404(ChatSession.objects.select_related('lawyer'), session_id=session_id)
+        zone = office_schedule(session.lawyer).zone
+        slots = next_free_slots(session.lawyer, count, APPOINTMENT_DURATION_MINUTES)
+        return JsonResponse({
+            'success': True,
+            'duration_minutes': APPOINTMENT_DURATION_MINUTES,
+            'slots': [slot_payload(slot, zone) for slot in slots],
+        })
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class ScheduleAppointmentAPIView(View):
     """Handle appointment scheduling from chat"""
@@ -516,57 +672,71 @@ class ScheduleAppointmentAPIView(View):
                 return JsonResponse({'success': False, 'error': 'Session ID, time and date are required'})
             
             # Get chat session
-            session = get_object_or_404(ChatSession, session_id=session_id)
+            session = get_object_or_404(ChatSession.objects.select_related('lawyer__user'), session_id=session_id)
             lawyer = session.lawyer
             
             # Import here to avoid circular imports
-            from leads.models import Consultation
+            from leads.availability import is_slot_free, office_schedule
+            from leads.booking import SlotUnavailable, book_consultation
             from datetime import datetime
             
-            # Parse appointment datetime
+            # Parse appointment datetime, as local time in the lawyer's office time zone
             appointment_datetime_str = f"{appointment_date} {appointment_time}"
+            zone = office_schedule(lawyer).zone
             try:
-                appointment_datetime = datetime.strptime(appointment_datetime_str, "%Y-%m-%d %H:%M")
+                appointment_datetime = datetime.strptime(appointment_datetime_str, "%Y-%m-%d %H:%M").replace(tzinfo=zone)
             except ValueError:
                 return JsonResponse({'success': False, 'error': 'Invalid date/time format'})
             
+            if not is_slot_free(lawyer, appointment_datetime, APPOINTMENT_DURATION_MINUTES):
+                return slot_conflict_response(lawyer, zone, appointment_datetime)
+            
             # Create or get lead from session
             if session.visitor_phone and session.visitor_name:
-                # Try to find existing lead or create new one
+                # Import here to avoid circular imports
                 from leads.models import Lead
-                lead, created = Lead.objects.get_or_create(
-                    lawyer=lawyer,
-                    phone=session.visitor_phone,
-                    defaults={
-                        'name': session.visitor_name,
-                        'email': session.visitor_email or '',
-                        'legal_category': session.legal_category or 'Общая консультация',
-                        'case_description': f'Консультация через чат-бот. Сессия: {session_id}',
-                        'source': 'website_chat',
-                        'status': 'new',
-                        'priority': 'medium',
-                        'ip_address': request.META.get('REMOTE_ADDR', ''),
-                        'user_agent': request.META.get('HTTP_USER_AGENT', ''),
-                        'referrer': request.META.get('HTTP_REFERER', '')
-                    }
-                )
-                
-                # Create consultation appointment
-                consultation = Consultation.objects.create(
-                    lawyer=lawyer,
-                    lead=lead,
-                    scheduled_time=appointment_datetime,
-                    duration_minutes=60,  # Default 1 hour
-                    consultation_type=consultation_type,
-                    meeting_method='in_person',  # Default
-                    status='scheduled',
-                    agenda=f'Консультация по вопросу: {session.legal_category or "Общие правовые вопросы"}',
-                    notes=f'Запись через чат-бот. Сессия: {session_id}'
-                )
                 
-                # Update session
-                session.consultation_requested = True
-                session.save()
+                # Reuse or create the lead and book the consultation together, so a lost slot leaves no
+                # orphan lead; a rival booking may have taken the slot since the check above
+                try:
+                    with transaction.atomic():
+                        lead, created = Lead.objects.upsert_by_phone(
+                            lawyer,
+                            session.visitor_phone,
+                            {
+                                'name': session.visitor_name,
+                                'email': session.visitor_email or '',
+                                'legal_category': session.legal_category or 'Общая консультация',
+                                'case_description': f'Консультация через чат-бот. Сессия: {session_id}',
+                                'source': 'website_chat',
+                                'status': 'new',
+                                'priority': 'medium',
+                                'ip_address': request.META.get('REMOTE_ADDR', ''),
+                                'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+                                'referrer_url': request.META.get('HTTP_REFERER', '')
+                            }
+                        )
+                        consultation = book_consultation(
+                            lawyer,
+                            appointment_datetime,
+                            APPOINTMENT_DURATION_MINUTES,
+                            lead=lead,
+                            consultation_type=consultation_type,
+                            meeting_method='in_person',  # Default
+                            status='scheduled',
+                            agenda=f'Консультация по вопросу: {session.legal_category or "Общие правовые вопросы"}',
+                            lawyer_notes=f'Запись через чат-бот. Сессия: {session_id}'
+                        )
+                        if created:
+                            notify_new_lead(lead, lawyer)
+                        notify_consultation_booked(consultation, lawyer)
+                        
+                        # Update session
+                        session.lead = lead
+                        session.consultation_requested = True
+                        session.save()
+                except SlotUnavailable:
+                    return slot_conflict_response(lawyer, zone, appointment_datetime)
                 
                 # Send confirmation message
                 confirmation_message = f"""✅ Отлично! Консультация успешно назначена.
@@ -623,7 +793,7 @@ class GetChatHistoryAPIView(View):
             return JsonResponse({'success': False, 'error': 'Session ID required'})
         
         try:
-            session = get_object_or_404(ChatSession, session_id=session_id)
+            session = get_object_or_404(ChatSession.objects.select_related('lawyer__user'), session_id=session_id)
             messages = ChatMessage.objects.filter(session=session).order_by('created_at')
             
             message_data = []
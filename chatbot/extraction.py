@@ -0,0 +1,90 @@
+import re
+from collections import namedtuple
+
+
+Contact = namedtuple('Contact', ['phone', 'email', 'name'])
+
+KYRGYZSTAN_CODE = '996'
+
+# Name introductions; the first word may be lower-case, a second word only counts when capitalised.
+# "Я — ..." only introduces a capitalised name, so "я - юрист" is not read as one
+_NAME_WORD = r'[^\W\d_]{2,}'
+_CAPITAL = r'[A-ZА-ЯЁӨҮҢ]'
+_CAPITALISED_WORD = rf'{_CAPITAL}[^\W\d_]+'
+_NAME_INTRO = (
+    r'(?i:меня\s+зовут|мо[её]\s+имя|'
+    r'менин\s+атым|атым|'
+    r'my\s+name\s+is)'
+    rf'|[Яя]\s*[-—](?=\s*{_CAPITAL})'
+)
+
+# One pass over the message finds every phone, email and name introduction
+CONTACT_RE = re.compile(
+    r'(?P<email>[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,})'
+    r'|(?P<phone>(?<![\w+])\+?\d[\d\s().\-]{6,}\d(?!\w))'
+    rf'|\b(?:{_NAME_INTRO})[\s:,]+(?P<name>{_NAME_WORD}(?:\s+{_CAPITALISED_WORD})?)'
+)
+
+_NON_DIGIT_RE = re.compile(r'\D')
+
+
+def normalize_phone(value):
+    """
+    Normalize a phone number to E.164, assuming Kyrgyzstan for local formats:
+    '0555 12-34-56' / '555 123 456' / '996555123456' -> '+996555123456'.
+    Numbers with an explicit '+' keep their country code. Returns None when
+    the value cannot be a phone number.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    digits = _NON_DIGIT_RE.sub('', value)
+
+    if value.startswith('+') or value.startswith('00'):
+        digits = digits[2:] if value.startswith('00') else digits
+        if digits.startswith(KYRGYZSTAN_CODE) and len(digits) != 12:
+            return None
+        return f'+{digits}' if 8 <= len(digits) <= 15 else None
+    if digits.startswith(KYRGYZSTAN_CODE) and len(digits) == 12:
+        return f'+{digits}'
+    if digits.startswith('0') and len(digits) == 10:
+        return f'+{KYRGYZSTAN_CODE}{digits[1:]}'
+    if len(digits) == 9 and not digits.startswith('0'):
+        return f'+{KYRGYZSTAN_CODE}{digits}'
+    return None
+
+
+def normalize_email(value):
+    return value.strip().lower() if value else ''
+
+
+def _leading_phone(candidate):
+    """
+    Phone from the longest run of leading digit groups that normalizes, so a
+    number written right after it ('0555 123 456 10 раз') is not swallowed
+    """
+    groups = candidate.split()
+    for end in range(len(groups), 0, -1):
+        phone = normalize_phone(' '.join(groups[:end]))
+        if phone:
+            return phone
+    return None
+
+
+def extract_contacts(text):
+    """First normalized phone, email and introduced name found in a message"""
+    phone = email = name = None
+    for match in CONTACT_RE.finditer(text or ''):
+        if match.group('email') and not email:
+            email = normalize_email(match.group('email'))
+        elif match.group('phone') and not phone:
+            phone = _leading_phone(match.group('phone'))
+        elif match.group('name') and not name:
+            name = ' '.join(word[:1].upper() + word[1:] for word in match.group('name').split())
+    return Contact(phone, email, name)
+
+
+def has_contact(text):
+    """True when the message contains a phone number or an email address"""
+    contact = extract_contacts(text)
+    return bool(contact.phone or contact.email)
@@ -0,0 +1,105 @@
+from .extraction import has_contact
+from .routing import mentions_legal_topic
+
+
+INTENT_SMALL_TALK = 'small_talk'
+INTENT_GENERAL = 'general'
+INTENT_APPOINTMENT = 'appointment'
+INTENT_CONTACT = 'contact'
+INTENT_LEGAL = 'legal_consultation'
+
+INTENT_CHOICES = [
+    (INTENT_SMALL_TALK, 'Small Talk'),
+    (INTENT_GENERAL, 'General'),
+    (INTENT_APPOINTMENT, 'Appointment'),
+    (INTENT_CONTACT, 'Contact Details'),
+    (INTENT_LEGAL, 'Legal Consultation'),
+]
+
+# Token caps and temperatures per intent. Scheduling and contact turns need a
+# sentence or two; only detailed legal explanations get the configured maximum.
+# None means "use the lawyer's ChatConfiguration value".
+DEFAULT_POLICY = {
+    INTENT_SMALL_TALK: {'max_tokens': 80, 'temperature': 0.7},
+    INTENT_GENERAL: {'max_tokens': 200, 'temperature': 0.6},
+    INTENT_APPOINTMENT: {'max_tokens': 160, 'temperature': 0.3},
+    INTENT_CONTACT: {'max_tokens': 120, 'temperature': 0.3},
+    INTENT_LEGAL: {'max_tokens': None, 'temperature': None},
+}
+
+# ChatConfiguration field defaults, used when a lawyer has no configuration row
+CONFIG_DEFAULTS = {'max_tokens': 500, 'temperature': 0.7}
+
+MAX_TOKENS_LIMIT = 4000
+
+CONTACT_KEYWORDS = [
+    'мой телефон', 'мой номер', 'моя почта', 'мой email', 'перезвоните', 'позвоните мне', 'свяжитесь со мной',
+    'менин номерим', 'менин телефоним', 'my phone', 'my number', 'my email', 'call me back',
+]
+
+
+def detect_intent(message, conversation_context=None):
+    """Classify a turn for the generation policy; `conversation_context` comes from the keyword classifier"""
+    if conversation_context == INTENT_APPOINTMENT:
+        return INTENT_APPOINTMENT
+    text = message.lower()
+    if any(keyword in text for keyword in CONTACT_KEYWORDS) or has_contact(message):
+        return INTENT_CONTACT
+    if conversation_context == INTENT_LEGAL or mentions_legal_topic(text):
+        return INTENT_LEGAL
+    return INTENT_GENERAL
+
+
+def validate_policy_overrides(overrides):
+    """Raise ValueError unless `overrides` is {intent: {'max_tokens': int, 'temperature': float}}"""
+    if not isinstance(overrides, dict):
+        raise ValueError('Generation policy must be an object keyed by intent')
+    for intent, values in overrides.items():
+        if intent not in DEFAULT_POLICY:
+            raise ValueError(f"Unknown intent: {intent}")
+        if not isinstance(values, dict) or set(values) - {'max_tokens', 'temperature'}:
+            raise ValueError(f"{intent}: only max_tokens and temperature can be set")
+        max_tokens = values.get('max_tokens')
+        if max_tokens is not None and (not isinstance(max_tokens, int) or not 1 <= max_tokens <= MAX_TOKENS_LIMIT):
+            raise ValueError(f"{intent}: max_tokens must be an integer between 1 and {MAX_TOKENS_LIMIT}")
+        temperature = values.get('temperature')
+        if temperature is not None and (not isinstance(temperature, (int, float)) or not 0 <= temperature <= 2):
+            raise ValueError(f"{intent}: temperature must be between 0 and 2")
+
+
+def generation_params(intent, config=None):
+    """
+    max_tokens and temperature for an intent: the built-in policy, capped by
+    and falling back to the lawyer's own max_tokens/temperature, with
+    per-intent overrides from ChatConfiguration.generation_policy on top.
+    A policy that does not validate is ignored rather than failing the turn.
+    """
+    params = dict(DEFAULT_POLICY.get(intent, DEFAULT_POLICY[INTENT_GENERAL]))
+    baseline = {
+        'max_tokens': config.max_tokens if config else CONFIG_DEFAULTS['max_tokens'],
+        'temperature': config.temperature if config else CONFIG_DEFAULTS['temperature'],
+    }
+    for key, value in params.items():
+        if value is None:
+            params[key] = baseline[key]
+    # The built-in caps never exceed what the lawyer allows
+    params['max_tokens'] = min(params['max_tokens'], baseline['max_tokens'])
+
+    policy = config.generation_policy if config else None
+    try:
+        validate_policy_overrides(policy or {})
+    except ValueError:
+        policy = None
+    overrides = (policy or {}).get(intent, {})
+    params.update({key: value for key, value in overrides.items() if value is not None})
+    return params
+
+
+def get_chat_config(lawyer):
+    """The lawyer's ChatConfiguration, or None; free when select_related('chat_config') was used"""
+    from .models import ChatConfiguration
+
+    try:
+        return lawyer.chat_config
+    except ChatConfiguration.DoesNotExist:
+        return None
@@ -0,0 +1,87 @@
+import time
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+
+
+class TurnTimer:
+    """
+    Collects monotonic per-stage timings for one chat turn. Stages entered more
+    than once (e.g. persisting the user message and the AI reply) accumulate.
+    """
+
+    def __init__(self, request=None):
+        self.started = time.perf_counter()
+        self.stages = {}
+        if request is not None:
+            self.record_queueing(request)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name, ms):
+        self.stages[name] = self.stages.get(name, 0) + max(ms, 0)
+
+    def record_queueing(self, request):
+        """Time spent queued in front of Django, from the proxy's X-Request-Start header (t=<epoch ms>)"""
+        header = request.META.get('HTTP_X_REQUEST_START', '')
+        try:
+            queued_at_ms = float(header.lstrip('t=')) if header else None
+        except ValueError:
+            return
+        if queued_at_ms:
+            # nginx sends seconds and some proxies microseconds instead of milliseconds
+            if queued_at_ms < 1e11:
+                queued_at_ms *= 1000
+            elif queued_at_ms > 1e14:
+                queued_at_ms /= 1000
+            self.add('queue', time.time() * 1000 - queued_at_ms)
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def save(self, session, outcome='ai', **extra):
+        """Persist the turn as a compact ChatTurnTiming row; `extra` sets non-stage columns such as route"""
+        if not getattr(settings, 'CHAT_TURN_TIMING_ENABLED', True):
+            return None
+
+        from .models import ChatTurnTiming
+
+        fields = {
+            f'{name}_ms': round(ms) for name, ms in self.stages.items()
+            if name in ChatTurnTiming.STAGES
+        }
+        return ChatTurnTiming.objects.create(
+            session_id=session.pk,
+            lawyer_id=session.lawyer_id,
+            outcome=outcome,
+            total_ms=round(self.total_ms),
+            **fields,
+            **extra
+        )
+
+
+def timed_post(timer, url, **kwargs):
+    """
+    requests.post() that records upstream connect, time-to-first-byte and total
+    time on the timer. The body is read eagerly so `upstream_total` covers the
+    full download; `response.elapsed` measures request sent -> headers parsed.
+    """
+    start = time.perf_counter()
+    try:
+        response = requests.post(url, stream=True, **kwargs)
+        headers_ms = (time.perf_counter() - start) * 1000
+        ttfb_ms = response.elapsed.total_seconds() * 1000
+        timer.add('upstream_ttfb', ttfb_ms)
+        timer.add('upstream_connect', headers_ms - ttfb_ms)
+        response.content  # consume the streamed body
+        return response
+    finally:
+        timer.add('upstream_total', (time.perf_counter() - start) * 1000)
@@ -0,0 +1,114 @@
+import math
+import re
+from collections import Counter
+
+
+SUPPORTED_LANGUAGES = ['ru', 'ky', 'en']
+
+# Letters that exist in Kyrgyz Cyrillic but not in Russian
+KYRGYZ_LETTERS = frozenset('ңөү')
+
+# Detection only runs on the first few user messages of a session
+DETECTION_MESSAGES = 3
+
+# Below this many letters a message ("ок", "да") says nothing about its language
+MIN_LETTERS = 4
+
+# Average per-trigram log-likelihood ratio needed to switch between ru and ky
+MIN_SCORE = 0.35
+
+# Seed texts for the character trigram profiles: typical visitor questions
+SEED_TEXTS = {
+    'ru': """
+        Здравствуйте, мне нужна юридическая помощь. Я хочу развестись, у нас есть дети.
+        Сколько стоит консультация? Как правильно написать заявление в суд? Когда будет суд по моему делу?
+        На работе не платят зарплату, что мне делать? У меня вопрос по договору купли-продажи квартиры.
+        Как вступить в наследство после смерти отца? Как с вами связаться? Спасибо большое за помощь.
+        Можно прийти завтра в десять часов? Меня зовут Анна, вот мой телефон. Извините, я не поняла,
+        объясните ещё раз. Какие документы нужны для регистрации земли? Мне выписали штраф, я не согласен.
+        Подскажите пожалуйста, что делать если арендатор не платит. Меня уволили без предупреждения.
+        Нужно ли нотариально заверять доверенность? Какой срок исковой давности по долгам?
+    """,
+    'ky': """
+        Саламатсызбы, мага юридикалык жардам керек. Мен ажырашкым келет, балдарыбыз бар.
+        Консультация канча турат? Сотко арызды кантип туура жазса болот? Менин ишим боюнча сот качан болот?
+        Жумушта айлык бербей жатышат, эмне кылсам болот? Батир сатып алуу келишими боюнча суроом бар.
+        Атам каза болгондон кийин мураска кантип кирсе болот? Сиздер менен кантип байланышсам болот?
+        Чоң рахмат, жардам бердиңиз. Эртең саат ондо келсем болобу? Менин атым Айгүл, телефонум мына.
+        Кечиресиз, түшүнгөн жокмун, кайра айтып бериңизчи. Жерди каттоо үчүн кандай документтер керек?
+        Мага айып пул салышты, мен макул эмесмин. Ижарачы акча төлөбөсө эмне кылыш керек?
+        Мени эскертүүсүз жумуштан бошотушту. Ишеним катты нотариуска күбөлөндүрүү керекпи?
+    """,
+}
+
+_WORD_RE = re.compile(r'[^\W\d_]+')
+
+
+def _trigrams(text):
+    for word in _WORD_RE.findall(text.lower()):
+        padded = f' {word} '
+        for index in range(len(padded) - 2):
+            yield padded[index:index + 3]
+
+
+def _build_profile(text):
+    """Add-one smoothed log probabilities of character trigrams"""
+    counts = Counter(_trigrams(text))
+    total = sum(counts.values()) + len(counts) + 1
+    unseen = math.log(1 / total)
+    return {trigram: math.log((count + 1) / total) for trigram, count in counts.items()}, unseen
+
+
+# Built once at import; scoring is a dict lookup per trigram
+PROFILES = {language: _build_profile(text) for language, text in SEED_TEXTS.items()}
+
+
+def _log_ratio(text):
+    """Average per-trigram log P(ky) - log P(ru)"""
+    ky_profile, ky_unseen = PROFILES['ky']
+    ru_profile, ru_unseen = PROFILES['ru']
+    score = 0.0
+    count = 0
+    for trigram in _trigrams(text):
+        score += ky_profile.get(trigram, ky_unseen) - ru_profile.get(trigram, ru_unseen)
+        count += 1
+    return score / count if count else 0.0
+
+
+def detect_language(text):
+    """
+    Return 'ru', 'ky' or 'en' for a chat message, or None when it is too short
+    or too ambiguous to tell. Latin script means English; the Kyrgyz-only
+    letters ң/ө/ү decide outright; otherwise a character trigram model trained
+    on the seed texts separates Kyrgyz from Russian.
+    """
+    letters = [char for char in text.lower() if char.isalpha()]
+    if len(letters) < MIN_LETTERS:
+        return None
+
+    latin = sum(1 for char in letters if 'a' <= char <= 'z')
+    if latin * 2 > len(letters):
+        return 'en'
+    if KYRGYZ_LETTERS.intersection(letters):
+        return 'ky'
+
+    score = _log_ratio(text)
+    if score >= MIN_SCORE:
+        return 'ky'
+    if score <= -MIN_SCORE:
+        return 'ru'
+    return None
+
+
+def detect_session_language(session, message, message_number):
+    """
+    Language to switch the session to after this user message, or None to
+    keep it. `message_number` is the message's 1-based position among the
+    session's user messages; only the first DETECTION_MESSAGES count.
+    """
+    if message_number > DETECTION_MESSAGES:
+        return None
+    language = detect_language(message)
+    if language and language != session.language:
+        return language
+    return None
@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, Sum
+from django.utils import timezone
+
+from chatbot.analytics import stage_latency_report
+from chatbot.models import ChatTurnTiming
+
+
+class Command(BaseCommand):
+    help = 'Print per-stage latency percentiles and histograms of recent chat turns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Only include turns from the last N days')
+        parser.add_argument('--lawyer', type=int, help='Only include turns of this lawyer id')
+        parser.add_argument('--outcome', choices=[choice for choice, _ in ChatTurnTiming.OUTCOME_CHOICES])
+        parser.add_argument('--route', choices=[choice for choice, _ in ChatTurnTiming._meta.get_field('route').choices])
+        parser.add_argument('--intent', choices=[choice for choice, _ in ChatTurnTiming._meta.get_field('intent').choices])
+        parser.add_argument('--histograms', action='store_true', help='Also print bucket counts per stage')
+
+    def handle(self, *args, **options):
+        timings = ChatTurnTiming.objects.filter(created_at__gte=timezone.now() - timedelta(days=options['days']))
+        if options['lawyer']:
+            timings = timings.filter(lawyer_id=options['lawyer'])
+        if options['outcome']:
+            timings = timings.filter(outcome=options['outcome'])
+        if options['route']:
+            timings = timings.filter(route=options['route'])
+        if options['intent']:
+            timings = timings.filter(intent=options['intent'])
+
+        self.stdout.write(f"{'stage':<18}{'turns':>8}{'avg':>8}{'p50':>8}{'p90':>8}{'p99':>8}")
+        for row in stage_latency_report(timings):
+            cells = [row['count']] + [row[key] if row[key] is not None else '-' for key in ('avg_ms', 'p50_ms', 'p90_ms', 'p99_ms')]
+            self.stdout.write(f"{row['stage']:<18}" + ''.join(f'{cell:>8}' for cell in cells))
+            if options['histograms'] and row['count']:
+                for bucket in row['histogram']:
+                    if bucket['count']:
+                        self.stdout.write(f"    {bucket['label']:<14}{bucket['count']:>8}  {bucket['percentage']}%")
+
+        # Per-route and per-intent totals show where generation time and tokens are spent
+        for field in ('route', 'intent'):
+            rows = timings.exclude(**{field: ''}).values(field).annotate(
+                turns=Count('pk'), avg_ms=Avg('total_ms'), avg_cap=Avg('max_tokens'),
+                avg_tokens=Avg('tokens_used'), tokens=Sum('tokens_used')
+            ).order_by(field)
+            if not rows:
+                continue
+            self.stdout.write('')
+            self.stdout.write(f"{field:<18}{'turns':>8}{'avg ms':>10}{'avg cap':>10}{'avg tok':>10}{'tokens':>10}")
+            for row in rows:
+                cells = [round(row[key]) if row[key] is not None else '-' for key in ('avg_ms', 'avg_cap', 'avg_tokens', 'tokens')]
+                self.stdout.write(f"{row[field]:<18}{row['turns']:>8}" + ''.join(f'{cell:>10}' for cell in cells))
+
+        if not ChatTurnTiming.objects.exists():
+            self.stdout.write(self.style.WARNING('No turn timings recorded yet (is CHAT_TURN_TIMING_ENABLED on?)'))
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chatbot.reaper import idle_session_count, reap_idle_sessions
+
+
+class Command(BaseCommand):
+    help = 'End idle chat sessions in bounded batches and create leads for those with contact details'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--idle-minutes', type=int, default=getattr(settings, 'CHAT_SESSION_IDLE_MINUTES', 30),
+            help='End sessions without activity for this many minutes',
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Sessions ended per transaction')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many sessions are idle')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            idle = idle_session_count(options['idle_minutes'])
+            self.stdout.write(f'{idle} chat sessions idle for more than {options["idle_minutes"]} minutes')
+            return
+
+        totals = reap_idle_sessions(
+            idle_minutes=options['idle_minutes'],
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Ended {totals["ended"]} idle chat sessions, created {totals["leads_created"]} leads'
+        ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from chatbot import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index over chat transcripts'
+
+    def handle(self, *args, **options):
+        search.install()
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Rebuilt the chat transcript search index'))
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Substr
+
+from chatbot.analytics import AI_MESSAGE_TYPES
+from chatbot.models import ChatSession, ChatMessage
+
+
+def _count(messages, **filters):
+    """Correlated COUNT(*) over the session's messages"""
+    return Coalesce(
+        Subquery(
+            messages.filter(**filters).order_by().values('session').annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized message counters and last-message snapshot on chat sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Sessions updated per statement')
+        parser.add_argument('--lawyer', type=int, help='Only repair sessions of this lawyer id')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        sessions = ChatSession.objects.order_by('pk')
+        if options['lawyer']:
+            sessions = sessions.filter(lawyer_id=options['lawyer'])
+
+        messages = ChatMessage.objects.filter(session=OuterRef('pk'))
+        latest = messages.order_by('-created_at', '-pk')
+
+        repaired = 0
+        last_pk = 0
+        while True:
+            batch = list(sessions.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+
+            with transaction.atomic():
+                repaired += ChatSession.objects.filter(pk__in=batch).update(
+                    user_message_count=_count(messages, message_type='user'),
+                    ai_message_count=_count(messages, message_type__in=AI_MESSAGE_TYPES),
+                    total_tokens=Coalesce(
+                        Subquery(
+                            messages.order_by().values('session').annotate(total=Sum('tokens_used')).values('total'),
+                            output_field=IntegerField(),
+                        ),
+                        Value(0),
+                    ),
+                    last_message_preview=Coalesce(Substr(Subquery(latest.values('content')[:1]), 1, 200), Value('')),
+                    last_message_at=Subquery(latest.values('created_at')[:1]),
+                )
+            last_pk = batch[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Recomputed counters for {repaired} chat sessions'))
@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-19 06:02
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_local_time_buckets(apps, schema_editor):
+    """Fill local hour/weekday buckets for existing rows in bounded batches"""
+    ChatSession = apps.get_model('chatbot', 'ChatSession')
+    batch = []
+    for obj in ChatSession.objects.filter(local_hour__isnull=True).only('id', 'started_at').iterator(chunk_size=1000):
+        local = timezone.localtime(obj.started_at)
+        obj.local_hour, obj.local_weekday = local.hour, local.weekday()
+        batch.append(obj)
+        if len(batch) >= 1000:
+            ChatSession.objects.bulk_update(batch, ['local_hour', 'local_weekday'])
+            batch = []
+    if batch:
+        ChatSession.objects.bulk_update(batch, ['local_hour', 'local_weekday'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0001_initial'),
+        ('lawyers', '0002_remove_lawfirm_email_remove_lawfirm_phone_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='local_hour',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='Local Hour'),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='local_weekday',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='Local Weekday'),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['lawyer', 'local_hour'], name='chat_sess_lawyer_hour_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['lawyer', 'local_weekday', 'local_hour'], name='chat_sess_lawyer_wday_idx'),
+        ),
+        migrations.RunPython(backfill_local_time_buckets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-19 06:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0002_local_time_buckets'),
+        ('lawyers', '0002_remove_lawfirm_email_remove_lawfirm_phone_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['session', 'created_at'], name='chat_msg_session_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['session', 'message_type'], name='chat_msg_session_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['lawyer', '-started_at'], name='chat_sess_lawyer_started_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['lawyer', 'last_activity'], name='chat_sess_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(condition=models.Q(('consultation_requested', True)), fields=['lawyer', 'started_at'], name='chat_sess_consult_req_idx'),
+        ),
+    ]
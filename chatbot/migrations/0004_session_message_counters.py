@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-19 06:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0003_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='ai_message_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='AI Messages'),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Last Message At'),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='last_message_preview',
+            field=models.CharField(blank=True, editable=False, max_length=200, verbose_name='Last Message'),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='total_tokens',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Total Tokens'),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='user_message_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='User Messages'),
+        ),
+    ]
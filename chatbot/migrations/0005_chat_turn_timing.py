@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-19 06:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0004_session_message_counters'),
+        ('lawyers', '0002_remove_lawfirm_email_remove_lawfirm_phone_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatTurnTiming',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('outcome', models.CharField(choices=[('ai', 'AI Response'), ('fallback', 'Fallback Response'), ('error', 'Error')], default='ai', max_length=10, verbose_name='Outcome')),
+                ('queue_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='Queueing')),
+                ('parse_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='Request Parsing')),
+                ('session_lookup_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='Session Lookup')),
+                ('classify_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='Classification')),
+                ('prompt_build_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='Prompt Build')),
+                ('upstream_connect_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='Upstream Connect')),
+                ('upstream_ttfb_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='Upstream Time to First Byte')),
+                ('upstream_total_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='Upstream Total')),
+                ('persist_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='Persistence')),
+                ('total_ms', models.PositiveIntegerField(default=0, verbose_name='Total')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('lawyer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_turn_timings', to='lawyers.lawyer')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='turn_timings', to='chatbot.chatsession')),
+            ],
+            options={
+                'verbose_name': 'Chat Turn Timing',
+                'verbose_name_plural': 'Chat Turn Timings',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['lawyer', 'created_at'], name='chat_timing_lawyer_idx'), models.Index(fields=['created_at'], name='chat_timing_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,135 @@
+# Generated by Django 5.2 on 2026-10-19 06:11
+
+from datetime import date, time
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Frozen copy of chatbot.schedule.compile_office_hours as of this migration;
+# the live one may change later without changing what this step did
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def _parse_minute(value):
+    """'09:30' -> 570; '24:00' is accepted as end of day"""
+    if value in ('24:00', '24:00:00'):
+        return MINUTES_PER_DAY
+    parsed = time.fromisoformat(value)
+    return parsed.hour * 60 + parsed.minute
+
+
+def _subtract(intervals, start, end):
+    """Remove [start, end) from a list of [start, end) intervals"""
+    result = []
+    for low, high in intervals:
+        if end <= low or start >= high:
+            result.append([low, high])
+            continue
+        if low < start:
+            result.append([low, start])
+        if end < high:
+            result.append([end, high])
+    return result
+
+
+def _merge(intervals):
+    merged = []
+    for low, high in sorted(intervals):
+        if merged and low <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], high)
+        else:
+            merged.append([low, high])
+    return merged
+
+
+def compile_office_hours(office_hours, default_timezone=None):
+    """
+    Compile the office_hours JSON into per-weekday minute intervals.
+
+    Input format (all keys optional):
+        {
+            "timezone": "Asia/Bishkek",
+            "monday": {"enabled": true, "start": "09:00", "end": "18:00",
+                       "breaks": [{"start": "13:00", "end": "14:00"}]},
+            ...
+            "holidays": ["2026-03-21", "2026-08-31"]
+        }
+
+    A day whose end is not after its start runs past midnight into the next
+    day. Raises ValueError on malformed times, dates or time zones.
+    """
+    office_hours = office_hours or {}
+    zone = office_hours.get('timezone') or default_timezone or settings.TIME_ZONE
+    try:
+        ZoneInfo(zone)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone: {zone}")
+
+    week = [[] for _ in WEEKDAYS]
+    for index, day in enumerate(WEEKDAYS):
+        day_schedule = office_hours.get(day)
+        if not day_schedule or not day_schedule.get('enabled', False):
+            continue
+
+        start = _parse_minute(day_schedule.get('start', '09:00'))
+        end = _parse_minute(day_schedule.get('end', '18:00'))
+        if end > start:
+            hours, spill = [[start, end]], []
+        else:
+            hours, spill = [[start, MINUTES_PER_DAY]], [[0, end]]
+
+        for pause in day_schedule.get('breaks', []):
+            pause_start = _parse_minute(pause['start'])
+            pause_end = _parse_minute(pause['end'])
+            if spill and pause_start < start:
+                # After midnight: the break falls in the part spilling into the next day
+                spill = _subtract(spill, pause_start, pause_end)
+            elif spill and pause_end <= pause_start:
+                # The break itself spans midnight
+                hours = _subtract(hours, pause_start, MINUTES_PER_DAY)
+                spill = _subtract(spill, 0, pause_end)
+            else:
+                hours = _subtract(hours, pause_start, pause_end)
+
+        week[index].extend(hours)
+        week[(index + 1) % 7].extend(spill)
+
+    holidays = sorted({date.fromisoformat(value).isoformat() for value in office_hours.get('holidays', [])})
+
+    return {
+        'timezone': zone,
+        'week': [_merge(intervals) for intervals in week],
+        'holidays': holidays,
+    }
+
+
+def compile_existing_office_hours(apps, schema_editor):
+    """Compile office hours of existing configurations; malformed ones are compiled lazily"""
+    ChatConfiguration = apps.get_model('chatbot', 'ChatConfiguration')
+    for config in ChatConfiguration.objects.only('id', 'office_hours').iterator(chunk_size=500):
+        try:
+            config.office_hours_compiled = compile_office_hours(config.office_hours)
+        except (ValueError, TypeError, KeyError, AttributeError):
+            continue
+        config.save(update_fields=['office_hours_compiled'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0005_chat_turn_timing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatconfiguration',
+            name='office_hours_compiled',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Compiled Office Hours'),
+        ),
+        migrations.RunPython(compile_existing_office_hours, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 06:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0006_compiled_office_hours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatturntiming',
+            name='route',
+            field=models.CharField(blank=True, choices=[('template', 'Template'), ('light', 'Light Model'), ('full', 'Full Model')], max_length=10, verbose_name='Route'),
+        ),
+        migrations.AddField(
+            model_name='chatturntiming',
+            name='tokens_used',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Tokens Used'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-19 06:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0007_turn_route'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatconfiguration',
+            name='generation_policy',
+            field=models.JSONField(blank=True, default=dict, help_text='Per-intent overrides, e.g. {"appointment": {"max_tokens": 200, "temperature": 0.3}}', verbose_name='Generation Policy'),
+        ),
+        migrations.AddField(
+            model_name='chatturntiming',
+            name='intent',
+            field=models.CharField(blank=True, choices=[('small_talk', 'Small Talk'), ('general', 'General'), ('appointment', 'Appointment'), ('contact', 'Contact Details'), ('legal_consultation', 'Legal Consultation')], max_length=20, verbose_name='Intent'),
+        ),
+        migrations.AddField(
+            model_name='chatturntiming',
+            name='max_tokens',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Max Tokens'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-19 06:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0009_normalize_visitor_contacts'),
+        ('lawyers', '0002_remove_lawfirm_email_remove_lawfirm_phone_and_more'),
+        ('leads', '0004_lead_phone_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='lead',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='chat_sessions', to='leads.lead'),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['status', 'last_activity'], name='chat_sess_status_activity_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+from django.db import migrations
+
+
+# Frozen copy of the search table DDL and backfill as of this migration;
+# chatbot.search may change later without changing what this step did
+
+POSTGRES_INSTALL = [
+    """
+    CREATE TABLE IF NOT EXISTS chatbot_message_search (
+        message_id bigint PRIMARY KEY,
+        session_id bigint NOT NULL,
+        lawyer_id bigint NOT NULL,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS chatbot_message_search_document_gin ON chatbot_message_search USING GIN (document)",
+    "CREATE INDEX IF NOT EXISTS chatbot_message_search_lawyer_idx ON chatbot_message_search (lawyer_id)",
+    """
+    INSERT INTO chatbot_message_search (message_id, session_id, lawyer_id, document)
+    SELECT m.id, m.session_id, s.lawyer_id, to_tsvector('russian', m.content)
+    FROM chatbot_chatmessage m JOIN chatbot_chatsession s ON s.id = m.session_id
+    WHERE m.message_type IN ('user')
+    ON CONFLICT (message_id) DO NOTHING
+    """,
+]
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS chatbot_message_fts USING fts5(
+        content, scope, session_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT OR REPLACE INTO chatbot_message_fts (rowid, content, scope, session_id)
+    SELECT m.id, m.content, 'lawyer' || s.lawyer_id, m.session_id
+    FROM chatbot_chatmessage m JOIN chatbot_chatsession s ON s.id = m.session_id
+    WHERE m.message_type IN ('user')
+    """,
+]
+
+UNINSTALL = {
+    'postgresql': ["DROP TABLE IF EXISTS chatbot_message_search"],
+    'sqlite': ["DROP TABLE IF EXISTS chatbot_message_fts"],
+}
+
+
+def create_search_index(apps, schema_editor):
+    """Create the backend's transcript search table and index every visitor message; other backends have none"""
+    vendor = schema_editor.connection.vendor
+    for statement in {'postgresql': POSTGRES_INSTALL, 'sqlite': SQLITE_INSTALL}.get(vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    for statement in UNINSTALL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0010_session_lead_and_idle_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
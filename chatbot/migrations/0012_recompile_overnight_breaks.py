@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+def _runs_overnight_with_breaks(office_hours):
+    for day in WEEKDAYS:
+        schedule = office_hours.get(day)
+        if not isinstance(schedule, dict) or not schedule.get('enabled') or not schedule.get('breaks'):
+            continue
+        if schedule.get('end', '18:00') <= schedule.get('start', '09:00'):
+            return True
+    return False
+
+
+def clear_stale_compiled_hours(apps, schema_editor):
+    """
+    Overnight days used to keep their after-midnight breaks. Drop those
+    compiled schedules: ChatConfiguration.schedule compiles on the fly until
+    the configuration is saved again.
+    """
+    ChatConfiguration = apps.get_model('chatbot', 'ChatConfiguration')
+    stale = [
+        config.pk
+        for config in ChatConfiguration.objects.only('id', 'office_hours').iterator(chunk_size=500)
+        if isinstance(config.office_hours, dict) and _runs_overnight_with_breaks(config.office_hours)
+    ]
+    ChatConfiguration.objects.filter(pk__in=stale).update(office_hours_compiled={})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0011_message_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_stale_compiled_hours, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,17 @@
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.functional import cached_property
 import uuid
+from .analytics import AI_MESSAGE_TYPES, local_time_buckets
+from .extraction import normalize_email, normalize_phone
+from .generation import INTENT_CHOICES, validate_policy_overrides
+from .routing import ROUTE_CHOICES
+from .schedule import OfficeSchedule, compile_office_hours
 
 
 class ChatSession(models.Model):
@@ -33,6 +43,9 @@ class ChatSession(models.Model):
         choices=[('phone', _('Phone')), ('email', _('Email')), ('whatsapp', _('WhatsApp'))],
         blank=True
     )
+    lead = models.ForeignKey(
+        'leads.Lead', on_delete=models.SET_NULL, related_name='chat_sessions', blank=True, null=True
+    )
     
     # Metadata
     user_agent = models.TextField(_('User Agent'), blank=True)
@@ -43,15 +56,63 @@ class ChatSession(models.Model):
     ended_at = models.DateTimeField(blank=True, null=True)
     last_activity = models.DateTimeField(auto_now=True)
     
+    # Local-time buckets of started_at for peak-hour analysis
+    local_hour = models.PositiveSmallIntegerField(_('Local Hour'), blank=True, null=True, editable=False)
+    local_weekday = models.PositiveSmallIntegerField(_('Local Weekday'), blank=True, null=True, editable=False)
+    
+    # Denormalized message statistics (maintained by F() updates when messages are created)
+    user_message_count = models.PositiveIntegerField(_('User Messages'), default=0, editable=False)
+    ai_message_count = models.PositiveIntegerField(_('AI Messages'), default=0, editable=False)
+    total_tokens = models.PositiveIntegerField(_('Total Tokens'), default=0, editable=False)
+    last_message_preview = models.CharField(_('Last Message'), max_length=200, blank=True, editable=False)
+    last_message_at = models.DateTimeField(_('Last Message At'), blank=True, null=True, editable=False)
+    
+    # Never written by save(), so a stale in-memory session cannot overwrite concurrent increments
+    COUNTER_FIELDS = ['user_message_count', 'ai_message_count', 'total_tokens', 'last_message_preview', 'last_message_at']
+    
     class Meta:
         verbose_name = _('Chat Session')
         verbose_name_plural = _('Chat Sessions')
         ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['lawyer', '-started_at'], name='chat_sess_lawyer_started_idx'),
+            models.Index(
+                fields=['lawyer', 'last_activity'],
+                name='chat_sess_active_idx',
+                condition=models.Q(status='active'),
+            ),
+            models.Index(
+                fields=['lawyer', 'started_at'],
+                name='chat_sess_consult_req_idx',
+                condition=models.Q(consultation_requested=True),
+            ),
+            models.Index(fields=['lawyer', 'local_hour'], name='chat_sess_lawyer_hour_idx'),
+            models.Index(fields=['lawyer', 'local_weekday', 'local_hour'], name='chat_sess_lawyer_wday_idx'),
+            models.Index(fields=['status', 'last_activity'], name='chat_sess_status_activity_idx'),
+        ]
     
     def __str__(self):
         name = self.visitor_name or f"Anonymous ({self.visitor_ip})"
         return f"{self.lawyer.full_name} - {name}"
     
+    def save(self, *args, **kwargs):
+        if self.local_hour is None:
+            self.local_hour, self.local_weekday = local_time_buckets(self.started_at)
+        # Store contacts normalized (E.164 phones, lower-case emails) for exact lead matching
+        self.visitor_phone = normalize_phone(self.visitor_phone) or self.visitor_phone
+        self.visitor_email = normalize_email(self.visitor_email)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+    
+    @property
+    def message_count(self):
+        """Total visitor and AI messages in the session"""
+        return self.user_message_count + self.ai_message_count
+    
     @property
     def duration(self):
         """Calculate session duration"""
@@ -94,9 +155,75 @@ class ChatMessage(models.Model):
         verbose_name = _('Chat Message')
         verbose_name_plural = _('Chat Messages')
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['session', 'created_at'], name='chat_msg_session_created_idx'),
+            models.Index(fields=['session', 'message_type'], name='chat_msg_session_type_idx'),
+        ]
     
     def __str__(self):
         return f"{self.session} - {self.message_type}: {self.content[:50]}..."
+    
+    def get_session_counter_updates(self):
+        """F() expressions that account for this message on its session"""
+        updates = {
+            'total_tokens': F('total_tokens') + (self.tokens_used or 0),
+            'last_message_preview': self.content[:200],
+            'last_message_at': self.created_at,
+            'last_activity': self.created_at,
+        }
+        if self.message_type == 'user':
+            updates['user_message_count'] = F('user_message_count') + 1
+        elif self.message_type in AI_MESSAGE_TYPES:
+            updates['ai_message_count'] = F('ai_message_count') + 1
+        return updates
+
+
+class ChatTurnTiming(models.Model):
+    """Per-stage latency breakdown of a single chat turn (all values in milliseconds)"""
+    OUTCOME_CHOICES = [
+        ('ai', _('AI Response')),
+        ('fallback', _('Fallback Response')),
+        ('error', _('Error')),
+    ]
+    
+    # Pipeline stages in execution order; each has a matching `<stage>_ms` column
+    STAGES = [
+        'queue', 'parse', 'session_lookup', 'classify', 'prompt_build',
+        'upstream_connect', 'upstream_ttfb', 'upstream_total', 'persist',
+    ]
+    
+    session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='turn_timings')
+    lawyer = models.ForeignKey('lawyers.Lawyer', on_delete=models.CASCADE, related_name='chat_turn_timings')
+    outcome = models.CharField(_('Outcome'), max_length=10, choices=OUTCOME_CHOICES, default='ai')
+    route = models.CharField(_('Route'), max_length=10, choices=ROUTE_CHOICES, blank=True)
+    intent = models.CharField(_('Intent'), max_length=20, choices=INTENT_CHOICES, blank=True)
+    max_tokens = models.PositiveIntegerField(_('Max Tokens'), blank=True, null=True)
+    tokens_used = models.PositiveIntegerField(_('Tokens Used'), blank=True, null=True)
+    
+    queue_ms = models.PositiveIntegerField(_('Queueing'), blank=True, null=True)
+    parse_ms = models.PositiveIntegerField(_('Request Parsing'), blank=True, null=True)
+    session_lookup_ms = models.PositiveIntegerField(_('Session Lookup'), blank=True, null=True)
+    classify_ms = models.PositiveIntegerField(_('Classification'), blank=True, null=True)
+    prompt_build_ms = models.PositiveIntegerField(_('Prompt Build'), blank=True, null=True)
+    upstream_connect_ms = models.PositiveIntegerField(_('Upstream Connect'), blank=True, null=True)
+    upstream_ttfb_ms = models.PositiveIntegerField(_('Upstream Time to First Byte'), blank=True, null=True)
+    upstream_total_ms = models.PositiveIntegerField(_('Upstream Total'), blank=True, null=True)
+    persist_ms = models.PositiveIntegerField(_('Persistence'), blank=True, null=True)
+    total_ms = models.PositiveIntegerField(_('Total'), default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = _('Chat Turn Timing')
+        verbose_name_plural = _('Chat Turn Timings')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['lawyer', 'created_at'], name='chat_timing_lawyer_idx'),
+            models.Index(fields=['created_at'], name='chat_timing_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.session} - {self.total_ms} ms"
 
 
 class ChatConfiguration(models.Model):
@@ -108,6 +235,12 @@ class ChatConfiguration(models.Model):
     system_prompt = models.TextField(_('System Prompt'), help_text=_('Instructions for the AI assistant'))
     max_tokens = models.PositiveIntegerField(_('Max Tokens'), default=500)
     temperature = models.FloatField(_('Temperature'), default=0.7)
+    generation_policy = models.JSONField(
+        _('Generation Policy'),
+        default=dict,
+        blank=True,
+        help_text=_('Per-intent overrides, e.g. {"appointment": {"max_tokens": 200, "temperature": 0.3}}')
+    )
     
     # Chat Behavior
     collect_contact_info = models.BooleanField(_('Collect Contact Info'), default=True)
@@ -122,6 +255,7 @@ class ChatConfiguration(models.Model):
     # Business Hours
     office_hours_enabled = models.BooleanField(_('Office Hours Enabled'), default=True)
     office_hours = models.JSONField(_('Office Hours'), default=dict, blank=True)
+    office_hours_compiled = models.JSONField(_('Compiled Office Hours'), default=dict, blank=True, editable=False)
     offline_message = models.TextField(_('Offline Message'), blank=True)
     
     # Legal Disclaimers
@@ -163,25 +297,66 @@ class ChatConfiguration(models.Model):
         }
         return messages.get(language, messages['ru'])
     
-    def is_office_hours(self):
-        """Check if current time is within office hours"""
+    def clean(self):
+        super().clean()
+        try:
+            compile_office_hours(self.office_hours)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            raise ValidationError({'office_hours': str(e)})
+        try:
+            validate_policy_overrides(self.generation_policy)
+        except ValueError as e:
+            raise ValidationError({'generation_policy': str(e)})
+    
+    def save(self, *args, **kwargs):
+        self.office_hours_compiled = compile_office_hours(self.office_hours)
+        try:
+            validate_policy_overrides(self.generation_policy or {})
+        except ValueError as e:
+            raise ValidationError({'generation_policy': str(e)})
+        self.__dict__.pop('schedule', None)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'office_hours' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'office_hours_compiled'}
+        super().save(*args, **kwargs)
+    
+    @cached_property
+    def schedule(self):
+        """Compiled OfficeSchedule (compiled on the fly for rows saved before compilation existed)"""
+        return OfficeSchedule(self.office_hours_compiled or compile_office_hours(self.office_hours))
+    
+    def is_office_hours(self, moment=None):
+        """Check if `moment` (default: now) falls within office hours, in the schedule's local time"""
         if not self.office_hours_enabled or not self.office_hours:
             return True
+        return self.schedule.is_open(moment)
+    
+    def next_opening(self, moment=None):
+        """Next local opening time, or None when office hours are off or never open"""
+        if not self.office_hours_enabled or not self.office_hours:
+            return None
+        return self.schedule.next_opening(moment)
+    
+    def get_offline_message(self, language='ru', moment=None):
+        """Offline message quoting the next opening time when one is known"""
+        base_messages = {
+            'ru': "Сейчас мы не на связи. Оставьте ваши контактные данные, и юрист свяжется с вами.",
+            'ky': "Азыр биз байланышта эмеспиз. Байланыш маалыматыңызды калтырыңыз, юрист сиз менен байланышат.",
+            'en': "We are offline right now. Leave your contact details and the lawyer will get back to you.",
+        }
+        message = self.offline_message or base_messages.get(language, base_messages['ru'])
         
-        from django.utils import timezone
-        now = timezone.now()
-        weekday = now.strftime('%A').lower()
-        current_time = now.time()
-        
-        office_schedule = self.office_hours.get(weekday)
-        if not office_schedule or not office_schedule.get('enabled', False):
-            return False
-        
-        from datetime import time
-        start_time = time.fromisoformat(office_schedule.get('start', '09:00'))
-        end_time = time.fromisoformat(office_schedule.get('end', '18:00'))
+        opening = self.next_opening(moment)
+        if opening is None:
+            return message
         
-        return start_time <= current_time <= end_time
+        when = opening.strftime('%d.%m %H:%M')
+        next_opening_messages = {
+            'ru': f"Мы снова на связи {when}.",
+            'ky': f"Биз кайра {when} байланышта болобуз.",
+            'en': f"We will be back on {when}.",
+        }
+        return f"{message}\n\n{next_opening_messages.get(language, next_opening_messages['ru'])}"
 
 
 class ChatFeedback(models.Model):
@@ -248,3 +423,44 @@ class ChatAnalytics(models.Model):
     
     def __str__(self):
         return f"{self.lawyer.full_name} - {self.date}"
+
+
+@receiver(post_save, sender=ChatMessage)
+def update_session_counters(sender, instance, created, **kwargs):
+    """Update the session's denormalized message counters in a single atomic UPDATE"""
+    if not created:
+        return
+    
+    ChatSession.objects.filter(pk=instance.session_id).update(**instance.get_session_counter_updates())
+    
+    # Mirror the change on an already loaded session so callers can read the counters without a query
+    if ChatMessage.session.is_cached(instance):
+        session = instance.session
+        if instance.message_type == 'user':
+            session.user_message_count += 1
+        elif instance.message_type in AI_MESSAGE_TYPES:
+            session.ai_message_count += 1
+        session.total_tokens += instance.tokens_used or 0
+        session.last_message_preview = instance.content[:200]
+        session.last_message_at = session.last_activity = instance.created_at
+
+
+@receiver(post_save, sender=ChatMessage)
+def index_message_for_search(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Add the message to the lawyer's transcript search index as it is written"""
+    # Import here to avoid circular imports
+    from .search import SEARCHABLE_MESSAGE_TYPES, index_messages
+    
+    if raw or instance.message_type not in SEARCHABLE_MESSAGE_TYPES:
+        return
+    if update_fields is not None and 'content' not in update_fields:
+        return
+    index_messages([instance.pk])
+
+
+@receiver(post_delete, sender=ChatMessage)
+def remove_message_from_search(sender, instance, **kwargs):
+    from .search import SEARCHABLE_MESSAGE_TYPES, remove_messages
+    
+    if instance.message_type in SEARCHABLE_MESSAGE_TYPES:
+        remove_messages([instance.pk])
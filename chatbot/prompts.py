@@ -0,0 +1,24 @@
+# Appended to the Russian consultation prompt so the model answers in the visitor's language
+LANGUAGE_DIRECTIVES = {
+    'ru': '',
+    'ky': "\n\nЯЗЫК ОТВЕТА: посетитель пишет на кыргызском языке. Отвечайте только на кыргызском языке.",
+    'en': "\n\nRESPONSE LANGUAGE: the visitor writes in English. Answer in English only.",
+}
+
+# Prompts are rebuilt only when the lawyer profile changes (saving the user saves the profile too)
+_PROMPT_CACHE = {}
+PROMPT_CACHE_SIZE = 1024
+
+
+def cached_prompt(kind, lawyer, language, build):
+    """Return build() for (kind, lawyer, language), cached until lawyer.updated_at changes"""
+    key = (kind, lawyer.pk, language)
+    cached = _PROMPT_CACHE.get(key)
+    if cached and cached[0] == lawyer.updated_at:
+        return cached[1]
+
+    prompt = build()
+    if len(_PROMPT_CACHE) >= PROMPT_CACHE_SIZE:
+        _PROMPT_CACHE.clear()
+    _PROMPT_CACHE[key] = (lawyer.updated_at, prompt)
+    return prompt
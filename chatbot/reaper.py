@@ -0,0 +1,196 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.utils import timezone
+
+from .analytics import local_time_buckets
+from .extraction import normalize_phone
+from .models import ChatMessage, ChatSession
+
+
+# Leads carry at most this much of the visitor's side of the conversation
+CASE_DESCRIPTION_LENGTH = 1000
+
+# Lead source used by the chat API for chat-originated leads (counted as chat leads in analytics)
+CHAT_LEAD_SOURCE = 'website_chat'
+
+
+def session_lead_fields(session, user_messages, now=None, source=CHAT_LEAD_SOURCE):
+    """Lead field values for a chat session, including those Lead.save() would otherwise set"""
+    local_hour, local_weekday = local_time_buckets(now)
+    phone_e164 = normalize_phone(session.visitor_phone)
+    return {
+        'name': session.visitor_name or f"Chat Visitor ({session.visitor_ip})",
+        'email': session.visitor_email or '',
+        'phone': phone_e164 or session.visitor_phone or '',
+        'phone_e164': phone_e164,
+        'case_description': ' '.join(user_messages)[:CASE_DESCRIPTION_LENGTH],
+        'legal_category': session.legal_category or '',
+        'source': source,
+        'ip_address': session.visitor_ip,
+        'user_agent': session.user_agent,
+        'local_hour': local_hour,
+        'local_weekday': local_weekday,
+    }
+
+
+def build_lead_from_session(session, user_messages, now=None, source=CHAT_LEAD_SOURCE):
+    """Unsaved Lead for a chat session, complete enough for bulk_create"""
+    # Import here to avoid circular imports
+    from leads.models import Lead
+
+    return Lead(lawyer_id=session.lawyer_id, **session_lead_fields(session, user_messages, now, source))
+
+
+def _user_messages(session_ids):
+    """Visitor messages of several sessions in one query, oldest first"""
+    messages = defaultdict(list)
+    rows = ChatMessage.objects.filter(
+        session_id__in=session_ids, message_type='user'
+    ).order_by('session_id', 'created_at').values_list('session_id', 'content')
+    for session_id, content in rows:
+        messages[session_id].append(content)
+    return messages
+
+
+def _create_leads(new_leads, lawyers, batch_size):
+    """
+    Insert the batch's new leads, keyed by (lawyer_id, phone) or
+    ('session', pk); returns the leads this call created. A phone taken by a
+    concurrent upsert_by_phone since the lookup fails the bulk insert, and the
+    batch then falls back to upserting lead by lead.
+    """
+    # Import here to avoid circular imports
+    from leads.models import Lead
+
+    try:
+        with transaction.atomic():
+            return Lead.objects.bulk_create(list(new_leads.values()), batch_size=batch_size)
+    except IntegrityError:
+        pass
+
+    created_leads = []
+    for key, lead in new_leads.items():
+        if key[0] == 'session':
+            lead.save()
+            created = True
+        else:
+            fields = {
+                field.attname: getattr(lead, field.attname) for field in Lead._meta.concrete_fields
+                if not field.primary_key and field.attname not in ('lawyer_id', 'phone', 'phone_e164')
+            }
+            lead, created = Lead.objects.upsert_by_phone(lawyers[key[0]], key[1], fields)
+            new_leads[key] = lead
+        if created:
+            created_leads.append(lead)
+    return created_leads
+
+
+def _reap_batch(cutoff, batch_size, now):
+    """End one batch of idle sessions and create their leads; returns (ended, leads_created)"""
+    # Import here to avoid circular imports
+    from lawyers.models import Lawyer
+    from leads.models import Lead
+    from leads.notifications import notify_new_lead
+    from leads.search import index_leads
+
+    with transaction.atomic():
+        idle = ChatSession.objects.filter(status='active', last_activity__lt=cutoff).order_by('last_activity')
+        connection = connections[router.db_for_write(ChatSession)]
+        if connection.features.has_select_for_update_skip_locked:
+            # Parallel reapers take disjoint batches instead of waiting on each other
+            idle = idle.select_for_update(skip_locked=True)
+        batch = list(idle.only(
+            'id', 'lawyer_id', 'visitor_name', 'visitor_email', 'visitor_phone', 'visitor_ip',
+            'legal_category', 'consultation_requested', 'user_agent', 'lead_id',
+        )[:batch_size])
+        if not batch:
+            return 0, 0
+
+        # Re-check the idle condition so a visitor who wrote meanwhile keeps their session
+        batch_ids = [session.pk for session in batch]
+        ended = ChatSession.objects.filter(
+            pk__in=batch_ids, status='active', last_activity__lt=cutoff
+        ).update(status='ended', ended_at=now)
+        if not ended:
+            return 0, 0
+
+        # Only sessions this update ended become leads; the rest are still in use
+        ended_ids = set(ChatSession.objects.filter(
+            pk__in=batch_ids, status='ended', ended_at=now, lead__isnull=True
+        ).order_by().values_list('pk', flat=True))
+        converting = [session for session in batch if session.pk in ended_ids and session.is_lead]
+        if not converting:
+            return ended, 0
+
+        # One lead per lawyer and phone: reuse existing leads and share new ones within the batch
+        lead_keys = {}
+        for session in converting:
+            phone = normalize_phone(session.visitor_phone)
+            lead_keys[session.pk] = (session.lawyer_id, phone) if phone else ('session', session.pk)
+        existing = {}
+        phones = {phone for kind, phone in lead_keys.values() if kind != 'session'}
+        if phones:
+            rows = Lead.objects.filter(
+                lawyer_id__in={session.lawyer_id for session in converting}, phone_e164__in=phones
+            ).order_by().values_list('lawyer_id', 'phone_e164', 'pk')
+            existing = {(lawyer_id, phone): pk for lawyer_id, phone, pk in rows}
+
+        messages = _user_messages([session.pk for session in converting])
+        new_leads = {}
+        for session in converting:
+            key = lead_keys[session.pk]
+            if key not in existing and key not in new_leads:
+                new_leads[key] = build_lead_from_session(session, messages.get(session.pk, []), now)
+        if not new_leads:
+            leads = []
+        else:
+            lawyers = Lawyer.objects.select_related('user').in_bulk({lead.lawyer_id for lead in new_leads.values()})
+            leads = _create_leads(new_leads, lawyers, batch_size)
+            for lead in leads:
+                notify_new_lead(lead, lawyers[lead.lawyer_id])
+
+        # Link sessions to their leads when the backend returns primary keys from bulk inserts
+        if all(lead.pk for lead in new_leads.values()):
+            for session in converting:
+                key = lead_keys[session.pk]
+                session.lead_id = existing[key] if key in existing else new_leads[key].pk
+            ChatSession.objects.bulk_update(converting, ['lead'], batch_size=batch_size)
+            # bulk_create skips the post_save receiver that indexes leads for search
+            index_leads([lead.pk for lead in leads])
+        return ended, len(leads)
+
+
+def reap_idle_sessions(idle_minutes=None, batch_size=500, now=None, max_batches=None):
+    """
+    End active chat sessions idle for more than `idle_minutes` and turn those
+    with contact details into leads, one bounded batch per transaction.
+    Returns {'ended': n, 'leads_created': n}.
+    """
+    now = now or timezone.now()
+    if idle_minutes is None:
+        idle_minutes = getattr(settings, 'CHAT_SESSION_IDLE_MINUTES', 30)
+    cutoff = now - timedelta(minutes=idle_minutes)
+
+    totals = {'ended': 0, 'leads_created': 0}
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ended, leads_created = _reap_batch(cutoff, batch_size, now)
+        if not ended:
+            break
+        totals['ended'] += ended
+        totals['leads_created'] += leads_created
+        batches += 1
+    return totals
+
+
+def idle_session_count(idle_minutes=None, now=None):
+    """How many sessions the reaper would end right now"""
+    now = now or timezone.now()
+    if idle_minutes is None:
+        idle_minutes = getattr(settings, 'CHAT_SESSION_IDLE_MINUTES', 30)
+    return ChatSession.objects.filter(
+        status='active', last_activity__lt=now - timedelta(minutes=idle_minutes)
+    ).count()
@@ -0,0 +1,152 @@
+import logging
+import re
+from collections import namedtuple
+
+from django.conf import settings
+
+
+logger = logging.getLogger('chatbot.routing')
+
+# Routes, cheapest first
+ROUTE_TEMPLATE = 'template'
+ROUTE_LIGHT = 'light'
+ROUTE_FULL = 'full'
+
+ROUTE_CHOICES = [
+    (ROUTE_TEMPLATE, 'Template'),
+    (ROUTE_LIGHT, 'Light Model'),
+    (ROUTE_FULL, 'Full Model'),
+]
+
+RouteDecision = namedtuple('RouteDecision', ['route', 'reason', 'template'])
+
+# Stems that mark a substantive legal question, matched as prefixes at the start
+# of a word so every case form counts ("аренде", "наследстве", "уволили").
+# Entries are regex fragments; the short ones spell out their endings so that
+# e.g. "судьба", "искать" and "сотовый" do not match.
+LEGAL_KEYWORDS = [
+    'закон', 'право', r'суд(?!ьб|н|ак)', 'договор', r'иск(?:а|у|ом|е|и|ов\w*)?\b', 'развод', 'наследств',
+    'наследник', 'завещан', 'трудов', 'увол', 'административн', 'уголовн', 'гражданск', 'алимент',
+    'собственност', 'приватизац', 'штраф', 'налог', 'регистрац', 'зарегистр', 'лицензи', 'аренд', 'продаж',
+    'ипотек', 'доверенност', 'нотари', 'претензи',
+    # Kyrgyz
+    'мыйзам', 'укук', r'сот(?:ко|то|ту|тун|тон|тор\w*)?\b', 'келишим', r'доо\s+арыз', 'ажыраш', 'мурас',
+    r'айып\s+пул', 'менчик', 'салык', 'ижара', r'жумуштан\s+бошот', 'бошотул',
+]
+
+# English keywords only match whole words (plural allowed), so 'law' is not found in 'lawyer'
+LEGAL_WORDS = ['law', 'court', 'contract', 'divorce', 'inheritance', 'lawsuit', 'alimony', 'lease']
+
+_LEGAL_RE = re.compile(
+    r'(?<!\w)(?:%s)|\b(?:%s)s?\b' % ('|'.join(LEGAL_KEYWORDS), '|'.join(LEGAL_WORDS))
+)
+
+# Whole-message small talk answered from local templates
+SMALL_TALK = {
+    'greeting': {
+        'привет', 'здравствуйте', 'здравствуй', 'добрый день', 'добрый вечер', 'доброе утро', 'доброй ночи',
+        'салам', 'саламатсызбы', 'салам алейкум', 'ассалому алейкум', 'кутман күн', 'кутман кеч',
+        'hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening',
+    },
+    'thanks': {
+        'спасибо', 'спасибо большое', 'большое спасибо', 'благодарю', 'спс', 'ок спасибо', 'понятно спасибо',
+        'рахмат', 'чоң рахмат', 'ыраазымын', 'thanks', 'thank you', 'thanks a lot',
+    },
+    'goodbye': {
+        'пока', 'до свидания', 'всего доброго', 'всего хорошего', 'кош', 'кош болуңуз', 'саламатта калыңыз',
+        'bye', 'goodbye', 'see you',
+    },
+}
+
+TEMPLATE_RESPONSES = {
+    'greeting': {
+        'ru': "Здравствуйте! Я помощник юриста {name}. Опишите, пожалуйста, ваш вопрос — я постараюсь помочь.",
+        'ky': "Саламатсызбы! Мен юрист {name}дын жардамчысымын. Сурооңузду жазыңыз, жардам берүүгө аракет кылам.",
+        'en': "Hello! I'm {name}'s legal assistant. Please describe your question and I'll do my best to help.",
+    },
+    'thanks': {
+        'ru': "Пожалуйста! Если появятся ещё вопросы — пишите, я на связи.",
+        'ky': "Эч нерсе эмес! Дагы суроолоруңуз болсо, жазыңыз.",
+        'en': "You're welcome! If you have more questions, just write here.",
+    },
+    'goodbye': {
+        'ru': "Всего доброго! Если понадобится помощь юриста {name}, возвращайтесь в этот чат.",
+        'ky': "Кош болуңуз! Юрист {name}дын жардамы керек болсо, бул чатка кайрылыңыз.",
+        'en': "Goodbye! If you need {name}'s help, come back to this chat any time.",
+    },
+}
+
+# Short non-legal messages go to the light model
+LIGHT_MAX_WORDS = 6
+
+_PUNCTUATION_RE = re.compile(r'[^\w\s]+')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def mentions_legal_topic(text):
+    """Whether lower-cased `text` contains a legal keyword"""
+    return _LEGAL_RE.search(text) is not None
+
+
+def normalize(message):
+    """Lower-case, drop punctuation and emoji, collapse whitespace"""
+    message = _PUNCTUATION_RE.sub(' ', message.lower())
+    return _WHITESPACE_RE.sub(' ', message).strip()
+
+
+def route_message(message, conversation_context=None, in_legal_thread=False):
+    """
+    Pick the cheapest route able to answer the message. Pure small talk gets a
+    template; short non-legal messages outside a legal discussion go to the
+    light model; everything else goes to the full model with the full prompt.
+    """
+    if not getattr(settings, 'CHAT_ROUTING_ENABLED', True):
+        return RouteDecision(ROUTE_FULL, 'routing_disabled', None)
+
+    text = normalize(message)
+    for template, phrases in SMALL_TALK.items():
+        if text in phrases:
+            return RouteDecision(ROUTE_TEMPLATE, template, template)
+
+    if conversation_context in ('appointment', 'legal_consultation'):
+        return RouteDecision(ROUTE_FULL, conversation_context, None)
+    if mentions_legal_topic(text):
+        return RouteDecision(ROUTE_FULL, 'legal_keywords', None)
+    if in_legal_thread:
+        return RouteDecision(ROUTE_FULL, 'legal_thread', None)
+    if len(text.split()) <= LIGHT_MAX_WORDS:
+        return RouteDecision(ROUTE_LIGHT, 'short_message', None)
+    return RouteDecision(ROUTE_FULL, 'long_message', None)
+
+
+def template_response(template, lawyer, language='ru'):
+    responses = TEMPLATE_RESPONSES[template]
+    return responses.get(language, responses['ru']).format(name=lawyer.full_name)
+
+
+def light_model_options():
+    """Model and token cap for the light route"""
+    return {
+        'model': getattr(settings, 'CHAT_LIGHT_MODEL', 'deepseek-chat'),
+        'max_tokens': getattr(settings, 'CHAT_LIGHT_MAX_TOKENS', 120),
+    }
+
+
+def build_light_prompt(lawyer):
+    """Compact system prompt for small talk and short non-legal turns"""
+    fee = lawyer.consultation_fee if lawyer.consultation_fee > 0 else 'первая консультация бесплатно'
+    return (
+        f"Вы - вежливый помощник юриста {lawyer.full_name} в Кыргызстане. "
+        f"Отвечайте коротко (1-3 предложения) на языке собеседника. "
+        f"Стоимость консультации: {fee} сом. "
+        f"Если посетитель задаёт правовой вопрос, попросите описать ситуацию подробнее."
+    )
+
+
+def log_route(decision, session, latency_ms=None, tokens=None, model=None):
+    """One structured log line per routed turn, for latency and token comparisons"""
+    logger.info(
+        "chat route=%s reason=%s session=%s model=%s latency_ms=%s tokens=%s",
+        decision.route, decision.reason, session.session_id, model or '-',
+        latency_ms if latency_ms is not None else '-', tokens if tokens is not None else '-',
+    )
@@ -0,0 +1,163 @@
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+from django.utils import timezone
+
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def _parse_minute(value):
+    """'09:30' -> 570; '24:00' is accepted as end of day"""
+    if value in ('24:00', '24:00:00'):
+        return MINUTES_PER_DAY
+    parsed = time.fromisoformat(value)
+    return parsed.hour * 60 + parsed.minute
+
+
+def _subtract(intervals, start, end):
+    """Remove [start, end) from a list of [start, end) intervals"""
+    result = []
+    for low, high in intervals:
+        if end <= low or start >= high:
+            result.append([low, high])
+            continue
+        if low < start:
+            result.append([low, start])
+        if end < high:
+            result.append([end, high])
+    return result
+
+
+def _merge(intervals):
+    merged = []
+    for low, high in sorted(intervals):
+        if merged and low <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], high)
+        else:
+            merged.append([low, high])
+    return merged
+
+
+def compile_office_hours(office_hours, default_timezone=None):
+    """
+    Compile the office_hours JSON into per-weekday minute intervals.
+
+    Input format (all keys optional):
+        {
+            "timezone": "Asia/Bishkek",
+            "monday": {"enabled": true, "start": "09:00", "end": "18:00",
+                       "breaks": [{"start": "13:00", "end": "14:00"}]},
+            ...
+            "holidays": ["2026-03-21", "2026-08-31"]
+        }
+
+    A day whose end is not after its start runs past midnight into the next
+    day. Raises ValueError on malformed times, dates or time zones.
+    """
+    office_hours = office_hours or {}
+    zone = office_hours.get('timezone') or default_timezone or settings.TIME_ZONE
+    try:
+        ZoneInfo(zone)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone: {zone}")
+
+    week = [[] for _ in WEEKDAYS]
+    for index, day in enumerate(WEEKDAYS):
+        day_schedule = office_hours.get(day)
+        if not day_schedule or not day_schedule.get('enabled', False):
+            continue
+
+        start = _parse_minute(day_schedule.get('start', '09:00'))
+        end = _parse_minute(day_schedule.get('end', '18:00'))
+        if end > start:
+            hours, spill = [[start, end]], []
+        else:
+            hours, spill = [[start, MINUTES_PER_DAY]], [[0, end]]
+
+        for pause in day_schedule.get('breaks', []):
+            pause_start = _parse_minute(pause['start'])
+            pause_end = _parse_minute(pause['end'])
+            if spill and pause_start < start:
+                # After midnight: the break falls in the part spilling into the next day
+                spill = _subtract(spill, pause_start, pause_end)
+            elif spill and pause_end <= pause_start:
+                # The break itself spans midnight
+                hours = _subtract(hours, pause_start, MINUTES_PER_DAY)
+                spill = _subtract(spill, 0, pause_end)
+            else:
+                hours = _subtract(hours, pause_start, pause_end)
+
+        week[index].extend(hours)
+        week[(index + 1) % 7].extend(spill)
+
+    holidays = sorted({date.fromisoformat(value).isoformat() for value in office_hours.get('holidays', [])})
+
+    return {
+        'timezone': zone,
+        'week': [_merge(intervals) for intervals in week],
+        'holidays': holidays,
+    }
+
+
+class OfficeSchedule:
+    """
+    Compiled office hours. Open/closed is a single lookup in a minute-of-week
+    bitmap; local time is always taken in the schedule's own time zone.
+    """
+
+    def __init__(self, compiled):
+        self.zone = ZoneInfo(compiled['timezone'])
+        self.week = compiled['week']
+        self.holidays = frozenset(compiled['holidays'])
+
+        self.minutes = bytearray(7 * MINUTES_PER_DAY)
+        for weekday, intervals in enumerate(self.week):
+            offset = weekday * MINUTES_PER_DAY
+            for start, end in intervals:
+                self.minutes[offset + start:offset + end] = b'\x01' * (end - start)
+
+    @classmethod
+    def from_office_hours(cls, office_hours, default_timezone=None):
+        return cls(compile_office_hours(office_hours, default_timezone))
+
+    def _local(self, moment):
+        return (moment or timezone.now()).astimezone(self.zone)
+
+    def is_open(self, moment=None):
+        local = self._local(moment)
+        if local.date().isoformat() in self.holidays:
+            return False
+        return bool(self.minutes[local.weekday() * MINUTES_PER_DAY + local.hour * 60 + local.minute])
+
+    def next_opening(self, moment=None):
+        """Aware datetime of the next opening after `moment`, or None if never open"""
+        if not any(self.week):
+            return None
+
+        local = self._local(moment)
+        current_minute = local.hour * 60 + local.minute
+        # Holidays can only push the opening out by as many days as there are holidays
+        for days_ahead in range(8 + len(self.holidays)):
+            day = local.date() + timedelta(days=days_ahead)
+            if day.isoformat() in self.holidays:
+                continue
+            for start, end in self.week[day.weekday()]:
+                # An interval starting at midnight that continues yesterday's is not an opening
+                if start == 0 and self._continues_previous_day(day):
+                    continue
+                if days_ahead == 0 and start <= current_minute:
+                    continue
+                opening = datetime.combine(day, time(start // 60, start % 60))
+                return opening.replace(tzinfo=self.zone)
+        return None
+
+    def _continues_previous_day(self, day):
+        previous = day - timedelta(days=1)
+        if previous.isoformat() in self.holidays:
+            return False
+        intervals = self.week[previous.weekday()]
+        return bool(intervals) and intervals[-1][1] == MINUTES_PER_DAY
@@ -0,0 +1,276 @@
+# Full-text search over chat transcripts, scoped per lawyer. PostgreSQL keeps a
+# tsvector per message (Russian stemming, GIN index) in chatbot_message_search;
+# SQLite keeps an FTS5 table, chatbot_message_fts, whose `scope` column holds a
+# per-lawyer token so the lawyer filter is part of the index lookup. Messages
+# are indexed as they are written (see the ChatMessage receivers) and the
+# rebuild_chat_search_index command rebuilds everything.
+
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+
+from django.db import connections, router
+from django.db.models import Count, Min
+from django.utils import timezone
+from django.utils.html import escape
+
+from .models import ChatMessage, ChatSession
+
+
+SessionHit = namedtuple('SessionHit', ['session', 'rank', 'hits', 'snippet', 'message_id'])
+
+# Highlight markers that survive HTML escaping; swapped for <mark> afterwards
+HIGHLIGHT_START, HIGHLIGHT_STOP = '⟦', '⟧'
+
+SNIPPET_WORDS = 16
+
+# Only the visitor's side of a conversation is indexed: it is what lawyers search
+# for, and it keeps assistant replies out of the index and off the write path
+SEARCHABLE_MESSAGE_TYPES = ('user',)
+_SEARCHABLE_SQL = ', '.join(f"'{message_type}'" for message_type in SEARCHABLE_MESSAGE_TYPES)
+
+INDEX_BATCH_SIZE = 500
+
+
+POSTGRES_INSTALL = [
+    """
+    CREATE TABLE IF NOT EXISTS chatbot_message_search (
+        message_id bigint PRIMARY KEY,
+        session_id bigint NOT NULL,
+        lawyer_id bigint NOT NULL,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS chatbot_message_search_document_gin ON chatbot_message_search USING GIN (document)",
+    "CREATE INDEX IF NOT EXISTS chatbot_message_search_lawyer_idx ON chatbot_message_search (lawyer_id)",
+]
+POSTGRES_UNINSTALL = ["DROP TABLE IF EXISTS chatbot_message_search"]
+
+POSTGRES_INDEX = f"""
+    INSERT INTO chatbot_message_search (message_id, session_id, lawyer_id, document)
+    SELECT m.id, m.session_id, s.lawyer_id, to_tsvector('russian', m.content)
+    FROM chatbot_chatmessage m JOIN chatbot_chatsession s ON s.id = m.session_id
+    WHERE m.message_type IN ({_SEARCHABLE_SQL}) {{where}}
+    ON CONFLICT (message_id) DO UPDATE SET document = EXCLUDED.document
+"""
+
+POSTGRES_SESSIONS = """
+    SELECT ms.session_id, sum(ts_rank_cd(ms.document, q)) AS rank, count(*) AS hits
+    FROM chatbot_message_search ms
+        JOIN chatbot_chatsession s ON s.id = ms.session_id,
+        websearch_to_tsquery('russian', %s) q
+    WHERE ms.lawyer_id = %s AND ms.document @@ q {dates}
+    GROUP BY ms.session_id
+    ORDER BY rank DESC, ms.session_id DESC
+    LIMIT %s OFFSET %s
+"""
+
+# Headlines are computed for the best message of each session on the page only
+POSTGRES_SNIPPETS = f"""
+    SELECT best.session_id, best.message_id,
+        ts_headline('russian', m.content, q,
+            'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxWords={SNIPPET_WORDS}, MinWords=6')
+    FROM (
+        SELECT DISTINCT ON (ms.session_id) ms.session_id, ms.message_id
+        FROM chatbot_message_search ms, websearch_to_tsquery('russian', %s) q
+        WHERE ms.session_id = ANY(%s) AND ms.document @@ q
+        ORDER BY ms.session_id, ts_rank_cd(ms.document, q) DESC
+    ) best
+        JOIN chatbot_chatmessage m ON m.id = best.message_id,
+        websearch_to_tsquery('russian', %s) q
+"""
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS chatbot_message_fts USING fts5(
+        content, scope, session_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+]
+SQLITE_UNINSTALL = ["DROP TABLE IF EXISTS chatbot_message_fts"]
+
+SQLITE_INDEX = f"""
+    INSERT OR REPLACE INTO chatbot_message_fts (rowid, content, scope, session_id)
+    SELECT m.id, m.content, 'lawyer' || s.lawyer_id, m.session_id
+    FROM chatbot_chatmessage m JOIN chatbot_chatsession s ON s.id = m.session_id
+    WHERE m.message_type IN ({_SEARCHABLE_SQL}) {{where}}
+"""
+
+# LIMIT -1 keeps SQLite from flattening the subquery, which bm25() does not allow
+SQLITE_SESSIONS = """
+    SELECT f.session_id, sum(f.score) AS rank, count(*) AS hits
+    FROM (
+        SELECT session_id, -bm25(chatbot_message_fts, 1.0, 0.0) AS score
+        FROM chatbot_message_fts WHERE chatbot_message_fts MATCH %s LIMIT -1
+    ) f JOIN chatbot_chatsession s ON s.id = f.session_id
+    WHERE 1 = 1 {dates}
+    GROUP BY f.session_id
+    ORDER BY rank DESC, f.session_id DESC
+    LIMIT %s OFFSET %s
+"""
+
+SQLITE_SNIPPETS = f"""
+    SELECT session_id, rowid,
+        snippet(chatbot_message_fts, 0, '{HIGHLIGHT_START}', '{HIGHLIGHT_STOP}', '…', {SNIPPET_WORDS}),
+        -bm25(chatbot_message_fts, 1.0, 0.0) AS score
+    FROM chatbot_message_fts
+    WHERE chatbot_message_fts MATCH %s AND session_id IN ({{placeholders}})
+    ORDER BY score DESC
+"""
+
+
+def _connection():
+    return connections[router.db_for_write(ChatSession)]
+
+
+def _execute(statements, params=None):
+    with _connection().cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement, params)
+
+
+def install(schema_editor=None):
+    """Create the backend's transcript search table; a no-op on backends without full-text support"""
+    vendor = (schema_editor.connection if schema_editor else _connection()).vendor
+    statements = {'postgresql': POSTGRES_INSTALL, 'sqlite': SQLITE_INSTALL}.get(vendor, [])
+    if schema_editor:
+        for statement in statements:
+            schema_editor.execute(statement)
+    else:
+        _execute(statements)
+
+
+def uninstall(schema_editor):
+    vendor = schema_editor.connection.vendor
+    for statement in {'postgresql': POSTGRES_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}.get(vendor, []):
+        schema_editor.execute(statement)
+
+
+# Incremental maintenance
+
+def _batches(ids):
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), INDEX_BATCH_SIZE):
+        yield ids[start:start + INDEX_BATCH_SIZE]
+
+
+def index_messages(message_ids):
+    """(Re)index the given messages with one statement per batch"""
+    vendor = _connection().vendor
+    for batch in _batches(message_ids):
+        if vendor == 'postgresql':
+            _execute([POSTGRES_INDEX.format(where='AND m.id = ANY(%s)')], [batch])
+        elif vendor == 'sqlite':
+            placeholders = ', '.join(['%s'] * len(batch))
+            _execute([SQLITE_INDEX.format(where=f'AND m.id IN ({placeholders})')], batch)
+
+
+def remove_messages(message_ids):
+    vendor = _connection().vendor
+    for batch in _batches(message_ids):
+        if vendor == 'postgresql':
+            _execute(['DELETE FROM chatbot_message_search WHERE message_id = ANY(%s)'], [batch])
+        elif vendor == 'sqlite':
+            placeholders = ', '.join(['%s'] * len(batch))
+            _execute([f'DELETE FROM chatbot_message_fts WHERE rowid IN ({placeholders})'], batch)
+
+
+def rebuild_index():
+    """Re-index every message from scratch"""
+    vendor = _connection().vendor
+    if vendor == 'postgresql':
+        _execute(['TRUNCATE chatbot_message_search', POSTGRES_INDEX.format(where='')])
+    elif vendor == 'sqlite':
+        _execute(['DELETE FROM chatbot_message_fts', SQLITE_INDEX.format(where='')])
+
+
+# Querying
+
+def highlight(snippet):
+    """HTML-escape a snippet and turn the highlight markers into <mark> tags"""
+    return escape(snippet).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_STOP, '</mark>')
+
+
+def _date_filter(date_from, date_to):
+    """SQL and params restricting sessions by local start date (inclusive)"""
+    ops = _connection().ops
+    sql, params = '', []
+    if date_from:
+        sql += ' AND s.started_at >= %s'
+        params.append(ops.adapt_datetimefield_value(timezone.make_aware(datetime.combine(date_from, time.min))))
+    if date_to:
+        sql += ' AND s.started_at < %s'
+        params.append(ops.adapt_datetimefield_value(
+            timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+        ))
+    return sql, params
+
+
+def _fallback_search(lawyer, text, date_from, date_to, offset, limit):
+    """icontains over the lawyer's messages for backends without a full-text table"""
+    messages = ChatMessage.objects.filter(
+        session__lawyer=lawyer, message_type__in=SEARCHABLE_MESSAGE_TYPES, content__icontains=text
+    )
+    if date_from:
+        messages = messages.filter(session__started_at__date__gte=date_from)
+    if date_to:
+        messages = messages.filter(session__started_at__date__lte=date_to)
+    rows = list(
+        messages.values('session_id').annotate(hits=Count('pk'), message_id=Min('pk'))
+        .order_by('-hits', '-session_id')[offset:offset + limit]
+    )
+    contents = ChatMessage.objects.in_bulk([row['message_id'] for row in rows])
+    ranked = [(row['session_id'], float(row['hits']), row['hits']) for row in rows]
+    snippets = {row['session_id']: (row['message_id'], contents[row['message_id']].content[:200]) for row in rows}
+    return ranked, snippets
+
+
+def search_sessions(lawyer, text, date_from=None, date_to=None, offset=0, limit=20):
+    """
+    A lawyer's chat sessions whose transcript matches `text`, ranked by the sum
+    of their message scores, each with a highlighted snippet of the best
+    message. Fetch limit + 1 to know whether another page follows.
+    """
+    # Import here to avoid circular imports
+    from leads.search import fts5_query
+
+    text = text.strip()
+    if not text:
+        return []
+    vendor = _connection().vendor
+    dates_sql, date_params = _date_filter(date_from, date_to)
+    snippets = {}
+
+    if vendor == 'postgresql':
+        with _connection().cursor() as cursor:
+            cursor.execute(
+                POSTGRES_SESSIONS.format(dates=dates_sql), [text, lawyer.pk] + date_params + [limit, offset]
+            )
+            ranked = cursor.fetchall()
+            if ranked:
+                cursor.execute(POSTGRES_SNIPPETS, [text, [row[0] for row in ranked], text])
+                snippets = {session_id: (message_id, snippet) for session_id, message_id, snippet in cursor.fetchall()}
+    elif vendor == 'sqlite':
+        query = fts5_query(text)
+        if not query:
+            return []
+        match = f'scope : "lawyer{lawyer.pk}" AND content : ({query})'
+        with _connection().cursor() as cursor:
+            cursor.execute(SQLITE_SESSIONS.format(dates=dates_sql), [match] + date_params + [limit, offset])
+            ranked = cursor.fetchall()
+            if ranked:
+                session_ids = [row[0] for row in ranked]
+                placeholders = ', '.join(['%s'] * len(session_ids))
+                cursor.execute(SQLITE_SNIPPETS.format(placeholders=placeholders), [match] + session_ids)
+                for session_id, message_id, snippet, _score in cursor.fetchall():
+                    snippets.setdefault(session_id, (message_id, snippet))
+    else:
+        ranked, snippets = _fallback_search(lawyer, text, date_from, date_to, offset, limit)
+
+    sessions = ChatSession.objects.in_bulk([row[0] for row in ranked])
+    hits = []
+    for session_id, rank, count in ranked:
+        if session_id in sessions:
+            message_id, snippet = snippets.get(session_id, (None, ''))
+            hits.append(SessionHit(sessions[session_id], rank, count, highlight(snippet), message_id))
+    return hits
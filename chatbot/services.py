@@ -4,6 +4,11 @@ import time
 from django.conf import settings
 from django.utils.translation import gettext as _
 from .models import ChatSession, ChatMessage, ChatConfiguration
+from .extraction import extract_contacts, has_contact
+from .generation import detect_intent, generation_params
+from .language import detect_session_language
+from .prompts import cached_prompt
+from .routing import ROUTE_LIGHT, ROUTE_TEMPLATE, build_light_prompt, light_model_options, log_route, route_message, template_response
 from lawyers.models import Lawyer
 from django.utils import timezone
 
@@ -104,16 +109,23 @@ SAMPLE RESPONSES:
         
         return system_prompts.get(language, system_prompts['ru'])
     
-    def send_message(self, session, user_message, config=None):
-        """Send message to DeepSeek AI and get response"""
+    def send_message(self, session, user_message, config=None, light=False, intent=None):
+        """Send message to DeepSeek AI and get response; `light` uses the compact prompt and token cap"""
         start_time = time.time()
         
         try:
             if not config:
                 config = session.lawyer.chat_config
             
+            # Intent-aware token cap and temperature
+            generation = generation_params(intent or detect_intent(user_message), config)
+            model, max_tokens, temperature = config.ai_model, generation['max_tokens'], generation['temperature']
+            if light:
+                options = light_model_options()
+                model, max_tokens = options['model'], min(options['max_tokens'], max_tokens)
+            
             # Get conversation history
-            messages = self.get_conversation_history(session, config)
+            messages = self.get_conversation_history(session, config, light=light)
             
             # Add user message
             messages.append({
@@ -123,10 +135,10 @@ SAMPLE RESPONSES:
             
             # Prepare API request
             payload = {
-                "model": config.ai_model,
+                "model": model,
                 "messages": messages,
-                "max_tokens": config.max_tokens,
-                "temperature": config.temperature,
+                "max_tokens": max_tokens,
+                "temperature": temperature,
                 "stream": False
             }
             
@@ -146,6 +158,7 @@ SAMPLE RESPONSES:
             
             # Calculate response time
             response_time_ms = int((time.time() - start_time) * 1000)
+            tokens_used = result.get('usage', {}).get('total_tokens', 0)
             
             # Save user message
             ChatMessage.objects.create(
@@ -159,9 +172,9 @@ SAMPLE RESPONSES:
                 session=session,
                 message_type='ai',
                 content=ai_response,
-                ai_model=config.ai_model,
+                ai_model=model,
                 response_time_ms=response_time_ms,
-                tokens_used=result.get('usage', {}).get('total_tokens', 0)
+                tokens_used=tokens_used
             )
             
             # Update session activity
@@ -170,7 +183,9 @@ SAMPLE RESPONSES:
             return {
                 'success': True,
                 'response': ai_response,
-                'response_time_ms': response_time_ms
+                'response_time_ms': response_time_ms,
+                'tokens_used': tokens_used,
+                'model': model
             }
             
         except requests.exceptions.RequestException as e:
@@ -186,19 +201,25 @@ SAMPLE RESPONSES:
                 'response': self.get_fallback_response(session.language)
             }
     
-    def get_conversation_history(self, session, config):
+    def get_conversation_history(self, session, config, light=False):
         """Get conversation history for context"""
         messages = []
         
         # Add system prompt
-        system_prompt = self.get_system_prompt(session.lawyer, session.language)
+        if light:
+            system_prompt = build_light_prompt(session.lawyer)
+        else:
+            system_prompt = cached_prompt(
+                'service', session.lawyer, session.language,
+                lambda: self.get_system_prompt(session.lawyer, session.language)
+            )
         messages.append({
             "role": "system",
             "content": system_prompt
         })
         
-        # Add recent conversation history (last 10 messages)
-        recent_messages = session.messages.order_by('created_at')[-10:]
+        # Add recent conversation history (last 10 messages, 2 for light turns)
+        recent_messages = reversed(session.messages.order_by('-created_at')[:2 if light else 10])
         
         for msg in recent_messages:
             if msg.message_type == 'user':
@@ -214,6 +235,30 @@ SAMPLE RESPONSES:
         
         return messages
     
+    def send_template_response(self, session, user_message, template):
+        """Answer small talk from a local template without calling the API"""
+        response = template_response(template, session.lawyer, session.language)
+        
+        ChatMessage.objects.create(
+            session=session,
+            message_type='user',
+            content=user_message
+        )
+        ChatMessage.objects.create(
+            session=session,
+            message_type='ai',
+            content=response,
+            ai_model='template'
+        )
+        
+        return {
+            'success': True,
+            'response': response,
+            'response_time_ms': 0,
+            'tokens_used': 0,
+            'model': 'template'
+        }
+    
     def get_fallback_response(self, language='ru'):
         """Get fallback response when AI is unavailable"""
         fallback_responses = {
@@ -249,8 +294,7 @@ SAMPLE RESPONSES:
             return 'contact_sharing'
         
         # Check for phone number or email in message
-        import re
-        if re.search(r'\+?\d{10,}', message) or re.search(r'\S+@\S+\.\S+', message):
+        if has_contact(message):
             return 'contact_provided'
         
         return 'general_inquiry'
@@ -298,7 +342,7 @@ class ChatbotService:
         
         # Check office hours if enabled
         if config.office_hours_enabled and not config.is_office_hours():
-            offline_response = config.offline_message or self.ai_service.get_fallback_response(session.language)
+            offline_response = config.get_offline_message(session.language)
             
             ChatMessage.objects.create(
                 session=session,
@@ -312,11 +356,33 @@ class ChatbotService:
                 'is_offline': True
             }
         
+        # Switch the session language from the first messages, before prompts are picked
+        # (the message is not saved yet, so it is number user_message_count + 1)
+        language = detect_session_language(session, message, session.user_message_count + 1)
+        if language:
+            session.language = language
+            session.save(update_fields=['language', 'last_activity'])
+        
         # Analyze message intent
         intent = self.ai_service.analyze_intent(message, session.language)
         
+        # Route the turn: templates for small talk, a light call for short non-legal messages
+        decision = route_message(
+            message,
+            'appointment' if intent == 'consultation_request' else None,
+            in_legal_thread=bool(session.legal_category)
+        )
+        
         # Process message with AI
-        result = self.ai_service.send_message(session, message, config)
+        if decision.route == ROUTE_TEMPLATE:
+            result = self.ai_service.send_template_response(session, message, decision.template)
+        else:
+            result = self.ai_service.send_message(
+                session, message, config,
+                light=decision.route == ROUTE_LIGHT,
+                intent=detect_intent(message, 'appointment' if intent == 'consultation_request' else None)
+            )
+        log_route(decision, session, result.get('response_time_ms'), result.get('tokens_used'), result.get('model'))
         
         # Handle lead capture based on intent
         if intent == 'contact_provided':
@@ -328,33 +394,15 @@ class ChatbotService:
         return result
     
     def extract_contact_info(self, session, message):
-        """Extract contact information from message"""
-        import re
+        """Extract normalized contact information from message"""
+        contact = extract_contacts(message)
         
-        # Extract phone number
-        phone_match = re.search(r'\+?(\d{10,})', message)
-        if phone_match and not session.visitor_phone:
-            session.visitor_phone = phone_match.group()
-        
-        # Extract email
-        email_match = re.search(r'\S+@\S+\.\S+', message)
-        if email_match and not session.visitor_email:
-            session.visitor_email = email_match.group()
-        
-        # Extract name (simple heuristic)
-        if not session.visitor_name:
-            # Look for "меня зовут", "my name is", etc.
-            name_patterns = [
-                r'меня зовут (\w+)',
-                r'my name is (\w+)',
-                r'менин атым (\w+)'
-            ]
-            
-            for pattern in name_patterns:
-                match = re.search(pattern, message, re.IGNORECASE)
-                if match:
-                    session.visitor_name = match.group(1)
-                    break
+        if contact.phone and not session.visitor_phone:
+            session.visitor_phone = contact.phone
+        if contact.email and not session.visitor_email:
+            session.visitor_email = contact.email
+        if contact.name and not session.visitor_name:
+            session.visitor_name = contact.name
         
         session.save()
     
@@ -365,30 +413,23 @@ class ChatbotService:
         session.save()
         
         # Create lead if contact info was collected
-        if session.is_lead:
+        if session.is_lead and session.lead_id is None:
             self.create_lead_from_session(session)
     
     def create_lead_from_session(self, session):
         """Create lead from chat session"""
         from leads.models import Lead
+        from .reaper import session_lead_fields
         
         # Extract case description from conversation
         conversation = session.messages.filter(
             message_type='user'
-        ).values_list('content', flat=True)
+        ).order_by('created_at').values_list('content', flat=True)
         
-        case_description = ' '.join(conversation)
-        
-        lead = Lead.objects.create(
-            lawyer=session.lawyer,
-            name=session.visitor_name or f"Chat Visitor ({session.visitor_ip})",
-            email=session.visitor_email or '',
-            phone=session.visitor_phone or '',
-            case_description=case_description[:1000],  # Limit length
-            legal_category=session.legal_category or '',
-            source='chatbot',
-            ip_address=session.visitor_ip,
-            user_agent=session.user_agent
-        )
+        fields = session_lead_fields(session, conversation, source='chatbot')
+        del fields['phone_e164']
+        lead, created = Lead.objects.upsert_by_phone(session.lawyer, fields.pop('phone'), fields)
+        session.lead = lead
+        session.save(update_fields=['lead'])
         
         return lead 
\ No newline at end of file
@@ -1,3 +1,769 @@
-from django.test import TestCase
+import json
+from datetime import datetime, timedelta
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+import requests
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from adylai.admin import EstimatedCountPaginator
+from adylai.testing import QueryBudgetMixin
+from leads.availability import next_free_slots
+from leads.models import Consultation, Lead
+from .models import ChatAnalytics, ChatConfiguration, ChatFeedback, ChatMessage, ChatSession, ChatTurnTiming
+
+
+def deepseek_response(content='Ответ ассистента'):
+    """Stand-in for a successful DeepSeek chat completion"""
+    response = mock.Mock(status_code=200, elapsed=timedelta(milliseconds=5))
+    response.json.return_value = {
+        'choices': [{'message': {'content': content}}],
+        'usage': {'total_tokens': 42},
+    }
+    return response
+
+
+class ChatbotQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Chatbot dashboards and chat API endpoints stay within fixed query budgets"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lawyer', password='secret', first_name='Айбек', last_name='Юристов')
+        cls.lawyer = cls.user.lawyer_profile
+        for index in range(5):
+            session = ChatSession.objects.create(lawyer=cls.lawyer, visitor_name=f'Гость {index}')
+            ChatMessage.objects.create(session=session, message_type='user', content='Нужна помощь с договором')
+            ChatMessage.objects.create(session=session, message_type='assistant', content='Конечно', response_time_ms=1200)
+        cls.session = session
+
+    def post_json(self, budget, name, payload):
+        return self.assertQueryBudget(
+            budget, 'post', reverse(name), data=json.dumps(payload), content_type='application/json'
+        )
+
+    def test_dashboards(self):
+        self.client.force_login(self.user)
+        for name, budget in [('chatbot:dashboard', 7), ('chatbot:configuration', 7), ('chatbot:analytics', 9)]:
+            with self.subTest(name=name):
+                response = self.assertQueryBudget(budget, 'get', reverse(name))
+                self.assertEqual(response.status_code, 200)
+
+    def test_start_chat(self):
+        response = self.post_json(4, 'chatbot_api:start_chat', {'lawyer_slug': self.lawyer.domain_slug})
+        self.assertTrue(response.json()['success'])
+
+    @override_settings(DEEPSEEK_API_KEY='test-key')
+    @mock.patch('chatbot.instrumentation.requests.post', return_value=deepseek_response())
+    def test_send_message(self, post):
+        payload = {'session_id': str(self.session.session_id), 'message': 'Как расторгнуть договор аренды?'}
+        # Includes indexing the visitor's message for transcript search
+        response = self.post_json(9, 'chatbot_api:send_message', payload)
+        self.assertTrue(response.json()['success'])
+        post.assert_called_once()
+
+    def test_submit_contact(self):
+        payload = {'session_id': str(self.session.session_id), 'name': 'Азамат', 'phone': '+996700123456'}
+        # The lead upsert's savepoint pair keeps concurrent submissions from duplicating the lead;
+        # one more statement writes its search document, and the outbox transaction adds a savepoint pair
+        response = self.post_json(11, 'chatbot_api:submit_contact', payload)
+        self.assertTrue(response.json()['success'])
+
+    def schedule_payload(self):
+        session = ChatSession.objects.create(lawyer=self.lawyer, visitor_name='Азамат', visitor_phone='+996700123456')
+        local = next_free_slots(self.lawyer, 1, 60)[0].astimezone(timezone.get_current_timezone())
+        return {
+            'session_id': str(session.session_id),
+            'appointment_date': local.strftime('%Y-%m-%d'),
+            'appointment_time': local.strftime('%H:%M'),
+        }
+    
+    def test_schedule_rejects_taken_slot(self):
+        cache.clear()
+        payload = self.schedule_payload()
+        # Booking adds the lawyer-row lock, the overlap check and two savepoint pairs (booking, outbox);
+        # the availability lookup reads the version and the index from the database cache
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.post_json(19, 'chatbot_api:schedule_appointment', payload).json()['success'])
+        
+        # A rejected booking rebuilds the index the booking retired, stores it in the
+        # database cache, and answers the slot check and the alternatives from it
+        response = self.post_json(12, 'chatbot_api:schedule_appointment', payload)
+        self.assertEqual(response.status_code, 409)
+        slots = response.json()['available_slots']
+        self.assertEqual(len(slots), 5)
+        self.assertNotIn({'date': payload['appointment_date'], 'time': payload['appointment_time']}, slots)
+    
+    def test_schedule_loses_race(self):
+        cache.clear()
+        payload = self.schedule_payload()
+        # A rival booking that the cached index has not seen yet (its on-commit invalidation never runs here)
+        lead = Lead.objects.create(lawyer=self.lawyer, name='Соперник', phone='+996700999999')
+        start = next_free_slots(self.lawyer, 1, 60)[0]
+        Consultation.objects.create(lawyer=self.lawyer, lead=lead, scheduled_time=start, duration_minutes=60)
+        
+        response = self.post_json(20, 'chatbot_api:schedule_appointment', payload)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Consultation.objects.filter(lawyer=self.lawyer).count(), 1)
+    
+    def test_chat_history(self):
+        response = self.assertQueryBudget(
+            2, 'get', reverse('chatbot_api:chat_history'), {'session_id': str(self.session.session_id)}
+        )
+        self.assertEqual(len(response.json()['messages']), 2)
+
+
+class ScheduleAppointmentLeadTests(TestCase):
+    """Booking from the chat creates or reuses the visitor's lead in the booking transaction"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lawyer = User.objects.create_user('booker', email='booker@example.com').lawyer_profile
+
+    def schedule(self, start):
+        session = ChatSession.objects.create(lawyer=self.lawyer, visitor_name='Азамат', visitor_phone='+996700123456')
+        local = start.astimezone(timezone.get_current_timezone())
+        payload = {
+            'session_id': str(session.session_id),
+            'appointment_date': local.strftime('%Y-%m-%d'),
+            'appointment_time': local.strftime('%H:%M'),
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('chatbot_api:schedule_appointment'), data=json.dumps(payload), content_type='application/json'
+            )
+        session.refresh_from_db()
+        return response, session
+
+    def test_new_lead_is_linked_and_announced(self):
+        from leads.models import OutboxMessage
+
+        cache.clear()
+        response, session = self.schedule(next_free_slots(self.lawyer, 1, 60)[0])
+        self.assertTrue(response.json()['success'])
+        lead = Lead.objects.get(lawyer=self.lawyer)
+        self.assertEqual(session.lead, lead)
+        self.assertEqual(OutboxMessage.objects.filter(kind='new_lead').count(), 1)
+
+        # A second booking reuses the lead without announcing it again
+        response, session = self.schedule(next_free_slots(self.lawyer, 1, 60)[0])
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(session.lead, lead)
+        self.assertEqual(OutboxMessage.objects.filter(kind='new_lead').count(), 1)
+
+    def test_lost_slot_leaves_no_lead(self):
+        cache.clear()
+        start = next_free_slots(self.lawyer, 1, 60)[0]
+        rival = Lead.objects.create(lawyer=self.lawyer, name='Соперник', phone='+996700999999')
+        Consultation.objects.create(lawyer=self.lawyer, lead=rival, scheduled_time=start, duration_minutes=60)
+
+        response, session = self.schedule(start)
+        self.assertEqual(response.status_code, 409)
+        self.assertIsNone(session.lead)
+        self.assertFalse(Lead.objects.filter(phone_e164='+996700123456').exists())
+
+
+class LatencySummaryTests(TestCase):
+    """Off PostgreSQL, percentiles are interpolated inside histogram buckets and kept within min/max"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.session = ChatSession.objects.create(lawyer=User.objects.create_user('lawyer').lawyer_profile)
+
+    def summary(self, *latencies):
+        from .analytics import latency_summary
+
+        for latency in latencies:
+            ChatMessage.objects.create(session=self.session, message_type='ai', content='Ответ', response_time_ms=latency)
+        return latency_summary(ChatMessage.objects.filter(session=self.session), 'response_time_ms')
+
+    def test_interpolated_percentiles(self):
+        summary = self.summary(100, 200, 300, 400, 1500)
+        self.assertFalse(summary['exact'])
+        self.assertEqual((summary['count'], summary['avg_ms']), (5, 500))
+        self.assertEqual([bucket['count'] for bucket in summary['histogram'][:4]], [4, 0, 1, 0])
+        self.assertEqual(summary['histogram'][0]['percentage'], 80.0)
+        # p50 falls 2.5/4 of the way through 0–500ms; p90 halfway through 1–2s
+        self.assertEqual(summary['p50_ms'], 312)
+        self.assertEqual(summary['p90_ms'], 1500)
+
+    def test_open_ended_bucket(self):
+        summary = self.summary(45000)
+        self.assertEqual(summary['histogram'][-1]['label'], '≥30s')
+        self.assertEqual(summary['histogram'][-1]['count'], 1)
+
+    def test_clamped_to_observed_range(self):
+        summary = self.summary(100, 200, 300, 400, 1500)
+        self.assertEqual((summary['min_ms'], summary['max_ms']), (100, 1500))
+        # p99 interpolates to 1950ms but never exceeds the observed maximum
+        self.assertEqual(summary['p99_ms'], 1500)
+        # The open bucket yields its lower bound, raised to the observed minimum
+        ChatMessage.objects.filter(session=self.session).delete()
+        self.assertEqual(self.summary(45000)['p50_ms'], 45000)
+
+    def test_empty(self):
+        summary = self.summary()
+        self.assertEqual(summary['count'], 0)
+        self.assertIsNone(summary['p50_ms'])
+        self.assertIsNone(summary['avg_ms'])
+
+
+class LocalTimeBucketTests(TestCase):
+    """Sessions are bucketed by local wall-clock hour and weekday, DST transitions included"""
+
+    def test_buckets_across_dst(self):
+        from .analytics import local_time_buckets
+
+        utc = ZoneInfo('UTC')
+        with timezone.override('Europe/Berlin'):
+            # Clocks jump from 02:00 to 03:00 on Sunday 31 March 2024
+            self.assertEqual(local_time_buckets(datetime(2024, 3, 31, 0, 30, tzinfo=utc)), (1, 6))
+            self.assertEqual(local_time_buckets(datetime(2024, 3, 31, 1, 30, tzinfo=utc)), (3, 6))
+
+    def test_local_day_start_across_dst(self):
+        from .analytics import local_day_start
+
+        noon = datetime(2024, 3, 31, 12, 0, tzinfo=ZoneInfo('UTC'))
+        with timezone.override('Europe/Berlin'), mock.patch('django.utils.timezone.now', return_value=noon):
+            today, yesterday, tomorrow = local_day_start(), local_day_start(1), local_day_start(-1)
+        utc = ZoneInfo('UTC')
+        self.assertEqual(yesterday, datetime(2024, 3, 29, 23, 0, tzinfo=utc))
+        self.assertEqual(today, datetime(2024, 3, 30, 23, 0, tzinfo=utc))
+        # The DST day is only 23 hours long
+        self.assertEqual(tomorrow, datetime(2024, 3, 31, 22, 0, tzinfo=utc))
+
+    def test_peak_hours_and_heatmap(self):
+        from .analytics import peak_hours, weekday_hour_heatmap
+
+        lawyer = User.objects.create_user('lawyer').lawyer_profile
+        bishkek = ZoneInfo('Asia/Bishkek')
+        # Monday 10:xx twice, Monday 14:00 and Tuesday 10:00, in local time
+        for moment in [datetime(2024, 6, 3, 10, 5), datetime(2024, 6, 3, 10, 50), datetime(2024, 6, 3, 14), datetime(2024, 6, 4, 10)]:
+            ChatSession.objects.create(lawyer=lawyer, started_at=moment.replace(tzinfo=bishkek))
+        sessions = ChatSession.objects.filter(lawyer=lawyer)
+
+        self.assertEqual(peak_hours(sessions, limit=2), [
+            {'hour': 10, 'label': '10:00–11:00', 'count': 3},
+            {'hour': 14, 'label': '14:00–15:00', 'count': 1},
+        ])
+        heatmap = weekday_hour_heatmap(sessions)
+        self.assertEqual([row['total'] for row in heatmap], [3, 1, 0, 0, 0, 0, 0])
+        self.assertEqual(heatmap[0]['cells'][10], {'hour': 10, 'count': 2, 'level': 4})
+        self.assertEqual(heatmap[0]['cells'][14]['level'], 2)
+        self.assertEqual(heatmap[1]['cells'][10]['level'], 2)
+
+
+class SessionCounterTests(TestCase):
+    """Session message counters follow every saved message and can be rebuilt from the messages"""
+
+    def test_counters_and_recompute(self):
+        from django.core.management import call_command
+
+        session = ChatSession.objects.create(lawyer=User.objects.create_user('lawyer').lawyer_profile)
+        ChatMessage.objects.create(session=session, message_type='user', content='Вопрос по аренде')
+        ChatMessage.objects.create(session=session, message_type='ai', content='Ответ ' * 50, tokens_used=30)
+        ChatMessage.objects.create(session=session, message_type='system', content='Служебное', tokens_used=5)
+        # The loaded session is kept in step without a query
+        self.assertEqual((session.user_message_count, session.ai_message_count, session.total_tokens), (1, 1, 35))
+
+        session.refresh_from_db()
+        self.assertEqual(session.message_count, 2)
+        self.assertEqual(session.total_tokens, 35)
+        self.assertEqual(session.last_message_preview, 'Служебное')
+
+        # A full save does not overwrite counters with stale values
+        stale = ChatSession.objects.get(pk=session.pk)
+        ChatMessage.objects.create(session=session, message_type='user', content='Ещё вопрос')
+        stale.visitor_name = 'Айгуль'
+        stale.save()
+        session.refresh_from_db()
+        self.assertEqual((session.user_message_count, session.visitor_name), (2, 'Айгуль'))
+
+        ChatSession.objects.filter(pk=session.pk).update(user_message_count=0, ai_message_count=9, total_tokens=0)
+        call_command('recompute_chat_counters', stdout=mock.Mock())
+        session.refresh_from_db()
+        self.assertEqual((session.user_message_count, session.ai_message_count, session.total_tokens), (2, 1, 35))
+        self.assertEqual(session.last_message_preview, 'Ещё вопрос')
+
+
+@override_settings(DEEPSEEK_API_KEY='test-key')
+class TurnTimingTests(TestCase):
+    """Every chat turn, failed ones included, leaves one ChatTurnTiming row with its stage breakdown"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.session = ChatSession.objects.create(lawyer=User.objects.create_user('lawyer').lawyer_profile)
+
+    def send(self, message='Как расторгнуть договор аренды?', **headers):
+        return self.client.post(
+            reverse('chatbot_api:send_message'),
+            data=json.dumps({'session_id': str(self.session.session_id), 'message': message}),
+            content_type='application/json', **headers,
+        )
+
+    @mock.patch('chatbot.instrumentation.requests.post', return_value=deepseek_response())
+    def test_stage_breakdown(self, post):
+        queued_at = (timezone.now() - timedelta(milliseconds=250)).timestamp()
+        self.assertTrue(self.send(HTTP_X_REQUEST_START=f't={queued_at:.3f}').json()['success'])
+        timing = self.session.turn_timings.get()
+        self.assertEqual((timing.outcome, timing.route, timing.intent, timing.tokens_used), ('ai', 'full', 'legal_consultation', 42))
+        # nginx sends seconds; the queueing time comes out in milliseconds
+        self.assertGreaterEqual(timing.queue_ms, 250)
+        for stage in ['parse', 'session_lookup', 'classify', 'prompt_build', 'upstream_ttfb', 'upstream_total', 'persist']:
+            self.assertIsNotNone(getattr(timing, f'{stage}_ms'), stage)
+        self.assertEqual(timing.upstream_ttfb_ms, 5)
+        self.assertGreaterEqual(timing.total_ms, timing.persist_ms + timing.upstream_total_ms)
+
+    @mock.patch('chatbot.instrumentation.requests.post', side_effect=requests.ConnectionError('down'))
+    def test_fallback_turn(self, post):
+        self.assertTrue(self.send().json()['success'])
+        self.assertEqual(self.session.turn_timings.get().outcome, 'fallback')
+
+    @mock.patch('chatbot.api_views.route_message', side_effect=RuntimeError('boom'))
+    def test_failed_turn(self, route):
+        response = self.send()
+        self.assertEqual(response.status_code, 400)
+        timing = self.session.turn_timings.get()
+        self.assertEqual(timing.outcome, 'error')
+        self.assertIsNotNone(timing.classify_ms)
+
+    def test_stage_latency_report(self):
+        from .analytics import stage_latency_report
+        from .instrumentation import TurnTimer
+
+        timer = TurnTimer()
+        timer.add('persist', 3)
+        timer.add('persist', 4)
+        timer.add('upstream_total', 1200)
+        timer.save(self.session)
+        report = {row['stage']: row for row in stage_latency_report(ChatTurnTiming.objects.all())}
+        self.assertEqual(list(report)[-1], 'total')
+        self.assertEqual(report['persist']['max_ms'], 7)
+        self.assertEqual(report['upstream_total']['count'], 1)
+        self.assertEqual(report['queue']['count'], 0)
+
+    @override_settings(CHAT_TURN_TIMING_ENABLED=False)
+    def test_disabled(self):
+        from .instrumentation import TurnTimer
+
+        self.assertIsNone(TurnTimer().save(self.session))
+        self.assertFalse(ChatTurnTiming.objects.exists())
+
+
+class OfficeScheduleTests(TestCase):
+    """Compiled office hours: breaks, overnight days, holidays and the next opening"""
+
+    OFFICE_HOURS = {
+        'timezone': 'Asia/Bishkek',
+        'monday': {'enabled': True, 'start': '09:00', 'end': '18:00', 'breaks': [{'start': '13:00', 'end': '14:00'}]},
+        'tuesday': {'enabled': True, 'start': '09:00', 'end': '18:00'},
+        'friday': {'enabled': True, 'start': '22:00', 'end': '03:00', 'breaks': [{'start': '00:30', 'end': '01:00'}]},
+        'saturday': {'enabled': True, 'start': '22:00', 'end': '02:00', 'breaks': [{'start': '23:30', 'end': '00:30'}]},
+        'holidays': ['2024-06-04'],
+    }
+
+    def at(self, day, hour, minute=0):
+        return datetime(2024, 6, day, hour, minute, tzinfo=ZoneInfo('Asia/Bishkek'))
+
+    def test_compile(self):
+        from .schedule import compile_office_hours
+
+        week = compile_office_hours(self.OFFICE_HOURS)['week']
+        self.assertEqual(week[0], [[540, 780], [840, 1080]])
+        self.assertEqual(week[4], [[1320, 1440]])
+        # Friday's after-midnight break is cut from its spill into Saturday
+        self.assertEqual(week[5], [[0, 30], [60, 180], [1320, 1410]])
+        # Saturday's break across midnight is cut on both sides
+        self.assertEqual(week[6], [[30, 120]])
+        with self.assertRaises(ValueError):
+            compile_office_hours({'timezone': 'Mars/Olympus'})
+
+    def test_is_open(self):
+        from .schedule import OfficeSchedule
+
+        schedule = OfficeSchedule.from_office_hours(self.OFFICE_HOURS)
+        cases = [
+            (self.at(3, 10), True),
+            (self.at(3, 13, 30), False),
+            (self.at(4, 10), False),  # holiday
+            (self.at(8, 0, 15), True),
+            (self.at(8, 0, 45), False),
+            (self.at(8, 23, 45), False),
+            (self.at(9, 0, 45), True),
+            (datetime(2024, 6, 3, 4, tzinfo=ZoneInfo('UTC')), True),  # 10:00 in Bishkek
+        ]
+        for moment, is_open in cases:
+            with self.subTest(moment=moment):
+                self.assertEqual(schedule.is_open(moment), is_open)
+
+    def test_next_opening(self):
+        from .schedule import OfficeSchedule
+
+        schedule = OfficeSchedule.from_office_hours(self.OFFICE_HOURS)
+        self.assertEqual(schedule.next_opening(self.at(3, 13, 30)), self.at(3, 14))
+        # Tuesday is a holiday, so Monday evening waits for Friday night
+        self.assertEqual(schedule.next_opening(self.at(3, 19)), self.at(7, 22))
+        # Friday's hours continuing past midnight are not an opening; the end of the break is
+        self.assertEqual(schedule.next_opening(self.at(7, 23)), self.at(8, 1))
+        self.assertIsNone(OfficeSchedule.from_office_hours({}).next_opening(self.at(3, 10)))
+
+
+class RouteMessageTests(TestCase):
+    """Small talk never reaches the model; legal questions always get the full prompt"""
+
+    def test_routes(self):
+        from .routing import route_message
+
+        cases = [
+            ('Привет!', None, False, 'template'),
+            ('спасибо 🙏', None, True, 'template'),
+            ('а вы работаете в субботу?', None, False, 'light'),
+            ('а сроки?', None, True, 'full'),
+            ('Как подать на развод?', 'legal_consultation', False, 'full'),
+            ('Помогите с разводом', None, False, 'full'),
+            ('I need a lawyer', None, False, 'light'),
+            ('Is this legal under Kyrgyz law?', None, False, 'full'),
+            ('Вопрос по аренде квартиры', None, False, 'full'),
+            ('Как получить долю в наследстве?', None, False, 'full'),
+            ('Меня уволили с работы', None, False, 'full'),
+            ('Жумуштан бошотушту', None, False, 'full'),
+            ('two contracts to check', None, False, 'full'),
+        ]
+        for message, context, in_legal_thread, route in cases:
+            with self.subTest(message=message):
+                self.assertEqual(route_message(message, context, in_legal_thread).route, route)
+
+    def test_legal_keywords_on_word_boundaries(self):
+        from .routing import mentions_legal_topic
+
+        cases = [
+            ('спор по договору аренды', True),
+            ('соттун чечими', True),
+            ('i need a lawyer', False),
+            ('a flawless plan', False),
+            ('the law says', True),
+            ('courts and lawsuits', True),
+            ('подзаконный акт', False),
+            # Inflected Russian and Kyrgyz case forms
+            ('вопрос по аренде квартиры', True),
+            ('как получить долю в наследстве', True),
+            ('меня уволили с работы', True),
+            ('нарушение трудовых прав', True),
+            ('иском в суд', True),
+            ('мурасты бөлүштүрүү', True),
+            ('сотко кайрылуу', True),
+            ('келишимди бузуу', True),
+            ('такова судьба', False),
+            ('искать работу', False),
+            ('сотовый телефон', False),
+        ]
+        for text, expected in cases:
+            with self.subTest(text=text):
+                self.assertEqual(mentions_legal_topic(text), expected)
+
+    @mock.patch('chatbot.instrumentation.requests.post')
+    def test_greeting_skips_model(self, post):
+        user = User.objects.create_user('lawyer', password='secret')
+        session = ChatSession.objects.create(lawyer=user.lawyer_profile)
+        response = self.client.post(
+            reverse('chatbot_api:send_message'),
+            data=json.dumps({'session_id': str(session.session_id), 'message': 'Здравствуйте'}),
+            content_type='application/json',
+        )
+        self.assertTrue(response.json()['success'])
+        post.assert_not_called()
+        self.assertEqual(session.turn_timings.get().route, 'template')
+
+
+class GenerationPolicyTests(TestCase):
+    """Token caps follow the intent, the lawyer's settings and per-intent overrides"""
+
+    def test_generation_params(self):
+        from .generation import generation_params
+        from .models import ChatConfiguration
+
+        config = ChatConfiguration(max_tokens=700, temperature=0.5, generation_policy={'appointment': {'max_tokens': 90}})
+        self.assertEqual(generation_params('legal_consultation', config), {'max_tokens': 700, 'temperature': 0.5})
+        self.assertEqual(generation_params('appointment', config), {'max_tokens': 90, 'temperature': 0.3})
+        self.assertEqual(generation_params('contact'), {'max_tokens': 120, 'temperature': 0.3})
+        self.assertEqual(generation_params('legal_consultation')['max_tokens'], 500)
+        # Built-in caps stay within the lawyer's own max_tokens
+        self.assertEqual(generation_params('general', ChatConfiguration(max_tokens=100))['max_tokens'], 100)
+        # A policy that slipped past validation is ignored
+        config = ChatConfiguration(max_tokens=700, temperature=0.5, generation_policy=['appointment'])
+        self.assertEqual(generation_params('appointment', config), {'max_tokens': 160, 'temperature': 0.3})
+
+    def test_generation_policy_validated_on_save(self):
+        from .models import ChatConfiguration
+
+        config = ChatConfiguration(lawyer=User.objects.create_user('policy').lawyer_profile, generation_policy=['x'])
+        with self.assertRaises(ValidationError):
+            config.save()
+
+    def test_detect_intent(self):
+        from .generation import detect_intent
+
+        cases = [
+            ('Хочу записаться на пятницу', 'appointment', 'appointment'),
+            ('Мой номер 0555 123 456', None, 'contact'),
+            ('Call me back please', None, 'contact'),
+            ('Как оформить наследство?', None, 'legal_consultation'),
+            ('Как получить долю в наследстве?', None, 'legal_consultation'),
+            ('Меня уволили с работы', None, 'legal_consultation'),
+            ('Can a lawyer help me?', None, 'general'),
+            ('Спасибо за ответ', None, 'general'),
+        ]
+        for message, context, intent in cases:
+            with self.subTest(message=message):
+                self.assertEqual(detect_intent(message, context), intent)
+
+    def test_validate_policy_overrides(self):
+        from .generation import validate_policy_overrides
+
+        validate_policy_overrides({'appointment': {'max_tokens': 90, 'temperature': 0.2}})
+        for overrides in [[], {'chitchat': {}}, {'appointment': {'top_p': 1}}, {'contact': {'max_tokens': 0}},
+                          {'contact': {'temperature': 3}}]:
+            with self.subTest(overrides=overrides), self.assertRaises(ValueError):
+                validate_policy_overrides(overrides)
+
+
+class LanguageDetectionTests(TestCase):
+    """Visitor language is told apart locally, without an API call"""
+
+    def test_detect_language(self):
+        from .language import detect_language
+
+        cases = [
+            ('Саламатсызбы', 'ky'),
+            ('Мага жардам керек', 'ky'),
+            ('Үйдү кантип каттатам?', 'ky'),
+            ('Мне нужна помощь', 'ru'),
+            ('Я хочу подать в суд на соседа', 'ru'),
+            ('Hello, I need a lawyer', 'en'),
+            ('ок', None),
+        ]
+        for message, language in cases:
+            with self.subTest(message=message):
+                self.assertEqual(detect_language(message), language)
+
+    def test_detection_window(self):
+        from .language import detect_session_language
+
+        session = ChatSession(language='ru')
+        self.assertEqual(detect_session_language(session, 'Мага жардам керек', 3), 'ky')
+        self.assertIsNone(detect_session_language(session, 'Мага жардам керек', 4))
+        self.assertIsNone(detect_session_language(session, 'Мне нужна помощь', 1))
+
+    def test_api_detects_within_first_three_messages(self):
+        session = ChatSession.objects.create(lawyer=User.objects.create_user('lawyer').lawyer_profile)
+        for content in ['ок', 'да', 'ага']:
+            ChatMessage.objects.create(session=session, message_type='user', content=content)
+        self.client.post(
+            reverse('chatbot_api:send_message'),
+            data=json.dumps({'session_id': str(session.session_id), 'message': 'Саламатсызбы'}),
+            content_type='application/json',
+        )
+        # The fourth message is outside the window on every path
+        session.refresh_from_db()
+        self.assertEqual(session.language, 'ru')
+
+
+class ContactExtractionTests(TestCase):
+    """Phones come out in E.164 (+996 for local formats), emails lower-cased, names title-cased"""
+
+    def test_extract_contacts(self):
+        from .extraction import extract_contacts
+
+        cases = [
+            ('Меня зовут азамат, мой номер 0555 12-34-56', ('+996555123456', None, 'Азамат')),
+            ('звоните +996 (700) 123-456, почта Test@Mail.RU', ('+996700123456', 'test@mail.ru', None)),
+            ('менин атым Айгүл, тел 996 777 11 22 33', ('+996777112233', None, 'Айгүл')),
+            ('My name is John Smith, +7 701 234 5678', ('+77012345678', None, 'John Smith')),
+            ('сумма 1 000 000 сом, дело 2024', (None, None, None)),
+            # A number right after the phone is not swallowed into it
+            ('мой номер 0555 123 456 10 раз звонил', ('+996555123456', None, None)),
+            # "Я - ..." introduces only a capitalised name, not a role
+            ('Я - юрист по образованию', (None, None, None)),
+            ('Я — Айбек, 0700 123 456', ('+996700123456', None, 'Айбек')),
+        ]
+        for message, expected in cases:
+            with self.subTest(message=message):
+                self.assertEqual(tuple(extract_contacts(message)), expected)
+
+
+class ReapIdleSessionsTests(TestCase):
+    """Idle sessions are ended in batches; those with contact details become linked leads"""
+
+    def test_reap_idle_sessions(self):
+        from leads.models import OutboxMessage
+        from .reaper import reap_idle_sessions
+
+        lawyer = User.objects.create_user('reaper', email='reaper@example.com', password='secret').lawyer_profile
+        with_contact = ChatSession.objects.create(lawyer=lawyer, visitor_phone='0555123456')
+        ChatMessage.objects.create(session=with_contact, message_type='user', content='Вопрос по аренде')
+        anonymous = ChatSession.objects.create(lawyer=lawyer)
+        fresh = ChatSession.objects.create(lawyer=lawyer, visitor_phone='0700123456')
+        ChatSession.objects.filter(pk__in=[with_contact.pk, anonymous.pk]).update(
+            last_activity=timezone.now() - timedelta(hours=2)
+        )
+
+        # Three one-session batches (the last one empty), each in its own savepoint
+        with self.assertNumQueries(22):
+            totals = reap_idle_sessions(idle_minutes=30, batch_size=1)
+        self.assertEqual(totals, {'ended': 2, 'leads_created': 1})
+
+        with_contact.refresh_from_db()
+        self.assertEqual(with_contact.status, 'ended')
+        self.assertEqual(with_contact.lead.phone, '+996555123456')
+        self.assertEqual(with_contact.lead.case_description, 'Вопрос по аренде')
+        fresh.refresh_from_db()
+        self.assertEqual(fresh.status, 'active')
+        self.assertIsNone(fresh.lead)
+        notification = OutboxMessage.objects.get()
+        self.assertEqual((notification.kind, notification.recipients), ('new_lead', ['reaper@example.com']))
+
+    def test_active_again_before_update(self):
+        """A visitor who writes between the batch select and the update keeps an open session and no lead"""
+        from django.db.models import QuerySet
+        from leads.models import Lead
+        from .reaper import reap_idle_sessions
+
+        lawyer = User.objects.create_user('reaper', password='secret').lawyer_profile
+        session = ChatSession.objects.create(lawyer=lawyer, visitor_phone='0555123456')
+        ChatSession.objects.filter(pk=session.pk).update(last_activity=timezone.now() - timedelta(hours=2))
+        update = QuerySet.update
+
+        def visitor_writes_first(queryset, **kwargs):
+            if kwargs.get('status') == 'ended':
+                update(ChatSession.objects.filter(pk=session.pk), last_activity=timezone.now())
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', visitor_writes_first):
+            totals = reap_idle_sessions(idle_minutes=30)
+        self.assertEqual(totals, {'ended': 0, 'leads_created': 0})
+        session.refresh_from_db()
+        self.assertEqual(session.status, 'active')
+        self.assertFalse(Lead.objects.exists())
+
+    def test_phone_taken_concurrently(self):
+        """A lead inserted for the same phone after the lookup is reused instead of failing the batch"""
+        from leads.models import Lead
+        from .reaper import _create_leads, build_lead_from_session
+
+        lawyer = User.objects.create_user('reaper', password='secret').lawyer_profile
+        winner = Lead.objects.create(lawyer=lawyer, name='Айбек', phone='+996555123456')
+        first = ChatSession.objects.create(lawyer=lawyer, visitor_phone='0555123456', visitor_email='a@example.com')
+        second = ChatSession.objects.create(lawyer=lawyer, visitor_name='Гость')
+        new_leads = {
+            (lawyer.pk, '+996555123456'): build_lead_from_session(first, ['Вопрос']),
+            ('session', second.pk): build_lead_from_session(second, ['Вопрос']),
+        }
+
+        created = _create_leads(new_leads, {lawyer.pk: lawyer}, batch_size=10)
+        self.assertEqual([lead.name for lead in created], ['Гость'])
+        self.assertEqual(new_leads[(lawyer.pk, '+996555123456')].pk, winner.pk)
+        winner.refresh_from_db()
+        self.assertEqual((winner.name, winner.email), ('Айбек', 'a@example.com'))
+        self.assertEqual(Lead.objects.count(), 2)
+
+
+class TranscriptSearchTests(TestCase):
+    """Transcript search ranks a lawyer's sessions by matching visitor messages and highlights the hit"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lawyer', password='secret')
+        lawyer = cls.user.lawyer_profile
+        cls.inheritance = ChatSession.objects.create(lawyer=lawyer, visitor_name='Айгуль')
+        for content in ['Здравствуйте', 'Вопрос про наследство <b>отца</b>', 'Как оформить наследство?']:
+            ChatMessage.objects.create(session=cls.inheritance, message_type='user', content=content)
+        cls.divorce = ChatSession.objects.create(lawyer=lawyer, visitor_name='Бакыт')
+        ChatMessage.objects.create(session=cls.divorce, message_type='user', content='Развод, и ещё наследство')
+        ChatMessage.objects.create(session=cls.divorce, message_type='assistant', content='Наследство наследство')
+        other = ChatSession.objects.create(lawyer=User.objects.create_user('other').lawyer_profile)
+        ChatMessage.objects.create(session=other, message_type='user', content='Наследство')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def search(self, **params):
+        response = self.client.get(reverse('chatbot:session_search'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_ranked_sessions_with_snippets(self):
+        results = self.search(q='наследство')
+        self.assertEqual([result['visitor'] for result in results], ['Айгуль', 'Бакыт'])
+        self.assertEqual(results[0]['hits'], 2)
+        self.assertIn('<mark>наследство</mark>', results[0]['snippet'])
+        self.assertNotIn('<b>', results[0]['snippet'])
+
+    def test_filters_and_deletes(self):
+        tomorrow = (timezone.localdate() + timedelta(days=1)).isoformat()
+        self.assertEqual(self.search(q='наследство', date_from=tomorrow), [])
+        self.divorce.messages.filter(message_type='user').delete()
+        self.assertEqual([result['visitor'] for result in self.search(q='развод')], [])
+
+    def test_invalid_dates(self):
+        for params in [{'date_from': '2024-02-30'}, {'date_to': '30.02.2024'}]:
+            with self.subTest(**params):
+                response = self.client.get(reverse('chatbot:session_search'), {'q': 'наследство', **params})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(next(iter(params)), response.json()['error'])
+
+
+class AdminChangelistQueryTests(QueryBudgetMixin, TestCase):
+    """Admin changelists run a fixed number of queries however many rows they show"""
+
+    # Session, user, counts, the page and list filter choices; str(obj) labels each row's checkbox
+    QUERIES = {
+        'chatsession': 5, 'chatmessage': 5, 'chatturntiming': 6,
+        'chatconfiguration': 6, 'chatfeedback': 5, 'chatanalytics': 8,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='secret')
+
+    def create_rows(self, start, stop):
+        today = timezone.localdate()
+        for index in range(start, stop):
+            lawyer = User.objects.create_user(f'lawyer{index}', first_name='Айбек').lawyer_profile
+            ChatConfiguration.objects.create(lawyer=lawyer)
+            ChatAnalytics.objects.create(lawyer=lawyer, date=today)
+            session = ChatSession.objects.create(lawyer=lawyer, visitor_name=f'Гость {index}')
+            ChatMessage.objects.create(session=session, message_type='user', content='Нужна помощь')
+            ChatMessage.objects.create(session=session, message_type='assistant', content='Конечно')
+            ChatTurnTiming.objects.create(session=session, lawyer=lawyer, total_ms=900)
+            ChatFeedback.objects.create(session=session, rating=5)
+
+    def test_changelists(self):
+        self.client.force_login(self.admin)
+        # The same count with one row and with five
+        for start, stop in [(0, 1), (1, 5)]:
+            self.create_rows(start, stop)
+            for model, expected in self.QUERIES.items():
+                with self.subTest(model=model, rows=stop):
+                    response = self.assertQueryCount(expected, 'get', reverse(f'admin:chatbot_{model}_changelist'))
+                    self.assertEqual(response.status_code, 200)
+
+    @mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=2_000_000)
+    def test_estimated_count(self, estimate):
+        self.create_rows(0, 3)
+        self.client.force_login(self.admin)
+        url = reverse('admin:chatbot_chatmessage_changelist')
+        response = self.client.get(url)
+        self.assertTrue(response.context['cl'].paginator.is_estimated)
+        self.assertEqual(response.context['cl'].result_count, 2_000_000)
+        self.assertContains(response, 'exact_count=1')
+
+        response = self.client.get(url, {'exact_count': 1, 'message_type': 'user'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertNotContains(response, 'Show exact count')
+        # Page links keep asking for the exact count
+        self.assertIn('exact_count=1', response.context['cl'].get_query_string({'p': 2}))
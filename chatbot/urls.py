@@ -8,6 +8,7 @@ urlpatterns = [
     path('', views.ChatbotDashboardView.as_view(), name='dashboard'),
     path('configuration/', views.ChatConfigurationView.as_view(), name='configuration'),
     path('sessions/', views.ChatSessionListView.as_view(), name='session_list'),
+    path('sessions/search/', views.ChatSessionSearchView.as_view(), name='session_search'),
     path('sessions/<uuid:session_id>/', views.ChatSessionDetailView.as_view(), name='session_detail'),
     
     # Full-page chat interface
@@ -1,10 +1,14 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.views.generic import TemplateView, ListView, DetailView, UpdateView
-from django.db.models import Count, Avg
+from django.views.generic import View, TemplateView, ListView, DetailView, UpdateView
+from django.http import JsonResponse
+from django.utils.dateparse import parse_date
+from django.db.models import Count, Avg, Q
 from django.utils import timezone
 from datetime import datetime, timedelta
 from .models import ChatSession, ChatMessage, ChatConfiguration, ChatFeedback, ChatAnalytics
+from .analytics import AI_MESSAGE_TYPES, latency_summary, local_day_start, peak_hours, weekday_hour_heatmap
+from .search import search_sessions
 from lawyers.models import Lawyer
 
 
@@ -45,17 +49,16 @@ class ChatbotDashboardView(LoginRequiredMixin, TemplateView):
         lawyer = self.request.user.lawyer_profile
         
         # Real chatbot statistics
-        total_sessions = ChatSession.objects.filter(lawyer=lawyer).count()
-        today_sessions = ChatSession.objects.filter(
-            lawyer=lawyer, 
-            started_at__date=timezone.now().date()
-        ).count()
+        session_stats = ChatSession.objects.filter(lawyer=lawyer).aggregate(
+            total=Count('pk'),
+            today=Count('pk', filter=Q(started_at__gte=local_day_start())),
+            consultation_requested=Count('pk', filter=Q(consultation_requested=True)),
+        )
+        total_sessions = session_stats['total']
+        today_sessions = session_stats['today']
         
         # Lead generation from chat
-        leads_generated = ChatSession.objects.filter(
-            lawyer=lawyer, 
-            consultation_requested=True
-        ).count()
+        leads_generated = session_stats['consultation_requested']
         
         # Calculate conversion rate
         conversion_rate = round((leads_generated / total_sessions * 100) if total_sessions > 0 else 0, 1)
@@ -129,6 +132,55 @@ class ChatSessionListView(LoginRequiredMixin, ListView):
         return ChatSession.objects.filter(lawyer=self.request.user.lawyer_profile).order_by('-started_at')
 
 
+class ChatSessionSearchView(LoginRequiredMixin, View):
+    """Ranked transcript search over the lawyer's chat sessions, with highlighted snippets"""
+    page_size = 20
+    
+    def get(self, request):
+        query = request.GET.get('q', '').strip()
+        if not query:
+            return JsonResponse({'error': 'q is required'}, status=400)
+        dates = {}
+        for name in ['date_from', 'date_to']:
+            value = request.GET.get(name)
+            try:
+                dates[name] = parse_date(value) if value else None
+            except ValueError:
+                # Well formed but not a real date, e.g. 2024-02-30
+                dates[name] = None
+            if value and dates[name] is None:
+                return JsonResponse({'error': f'{name} must be a valid YYYY-MM-DD date'}, status=400)
+        date_from, date_to = dates['date_from'], dates['date_to']
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        
+        # One extra row tells whether another page follows
+        hits = search_sessions(
+            request.user.lawyer_profile, query, date_from, date_to,
+            offset=(page - 1) * self.page_size, limit=self.page_size + 1,
+        )
+        return JsonResponse({
+            'query': query,
+            'page': page,
+            'has_next': len(hits) > self.page_size,
+            'results': [
+                {
+                    'session_id': str(hit.session.session_id),
+                    'visitor': hit.session.visitor_name or hit.session.visitor_phone or hit.session.visitor_email,
+                    'started_at': hit.session.started_at.isoformat(),
+                    'status': hit.session.status,
+                    'hits': hit.hits,
+                    'rank': hit.rank,
+                    'snippet': hit.snippet,
+                    'message_id': hit.message_id,
+                }
+                for hit in hits[:self.page_size]
+            ],
+        })
+
+
 class ChatSessionDetailView(LoginRequiredMixin, DetailView):
     """View individual chat session details"""
     model = ChatSession
@@ -154,42 +206,40 @@ class ChatAnalyticsView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         lawyer = self.request.user.lawyer_profile
         
-        # Time periods
-        today = timezone.now().date()
-        week_ago = today - timedelta(days=7)
-        month_ago = today - timedelta(days=30)
+        # Time periods (local midnights, so filters stay index range scans)
+        week_ago = local_day_start(7)
         
         # Real analytics data
-        total_conversations = ChatSession.objects.filter(lawyer=lawyer).count()
-        conversations_this_week = ChatSession.objects.filter(
-            lawyer=lawyer, 
-            started_at__date__gte=week_ago
-        ).count()
+        session_stats = ChatSession.objects.filter(lawyer=lawyer).aggregate(
+            total=Count('pk'),
+            this_week=Count('pk', filter=Q(started_at__gte=week_ago)),
+            consultation_requested=Count('pk', filter=Q(consultation_requested=True)),
+        )
+        total_conversations = session_stats['total']
+        conversations_this_week = session_stats['this_week']
         
         # Lead conversion analytics
-        leads_generated = ChatSession.objects.filter(
-            lawyer=lawyer, 
-            consultation_requested=True
-        ).count()
+        leads_generated = session_stats['consultation_requested']
         
         conversion_rate = round((leads_generated / total_conversations * 100) if total_conversations > 0 else 0, 1)
         
-        # Response time analytics
-        response_times = ChatMessage.objects.filter(
-            session__lawyer=lawyer,
-            message_type='assistant',
-            response_time_ms__isnull=False
-        ).values_list('response_time_ms', flat=True)
-        
-        avg_response_time = sum(response_times) / len(response_times) if response_times else 0
-        avg_response_seconds = round(avg_response_time / 1000, 1)
+        # Response time analytics (aggregated in the database)
+        response_time_stats = latency_summary(
+            ChatMessage.objects.filter(session__lawyer=lawyer, message_type__in=AI_MESSAGE_TYPES),
+            'response_time_ms'
+        )
+        avg_response_seconds = round((response_time_stats['avg_ms'] or 0) / 1000, 1)
         
         # User satisfaction
         feedback = ChatFeedback.objects.filter(session__lawyer=lawyer)
-        avg_satisfaction = feedback.aggregate(avg_rating=Avg('rating'))['avg_rating']
+        feedback_stats = feedback.aggregate(
+            avg_rating=Avg('rating'),
+            total=Count('pk'),
+            positive=Count('pk', filter=Q(rating__gte=4)),
+        )
+        avg_satisfaction = feedback_stats['avg_rating']
         avg_satisfaction = round(avg_satisfaction, 1) if avg_satisfaction else 0
-        positive_feedback_count = feedback.filter(rating__gte=4).count()
-        positive_percentage = round((positive_feedback_count / feedback.count() * 100)) if feedback.count() > 0 else 0
+        positive_percentage = round((feedback_stats['positive'] / feedback_stats['total'] * 100)) if feedback_stats['total'] > 0 else 0
         
         # Most common topics/categories
         common_categories = ChatSession.objects.filter(lawyer=lawyer).exclude(
@@ -206,10 +256,10 @@ class ChatAnalyticsView(LoginRequiredMixin, TemplateView):
                 'percentage': percentage
             })
         
-        # Peak hours analysis (simplified)
-        sessions_by_hour = ChatSession.objects.filter(lawyer=lawyer).extra(
-            select={'hour': 'EXTRACT(hour FROM started_at)'}
-        ).values('hour').annotate(count=Count('id')).order_by('-count')[:3]
+        # Peak hours and weekday heatmap (indexed group-bys on stored local-time buckets)
+        lawyer_sessions = ChatSession.objects.filter(lawyer=lawyer)
+        sessions_by_hour = peak_hours(lawyer_sessions)
+        weekday_heatmap = weekday_hour_heatmap(lawyer_sessions)
         
         context.update({
             'total_conversations': total_conversations,
@@ -217,10 +267,12 @@ class ChatAnalyticsView(LoginRequiredMixin, TemplateView):
             'conversion_rate': conversion_rate,
             'leads_generated': leads_generated,
             'avg_response_time': avg_response_seconds,
+            'response_time_stats': response_time_stats,
             'avg_satisfaction': avg_satisfaction,
             'positive_percentage': positive_percentage,
             'category_data': category_data,
             'peak_hours': sessions_by_hour,
+            'weekday_heatmap': weekday_heatmap,
         })
         return context
 
@@ -65,6 +65,7 @@ class LawyerAdmin(admin.ModelAdmin):
     list_display = ['full_name', 'email', 'years_experience', 'website_published', 'subscription_status', 'created_at']
     list_filter = ['website_published', 'primary_language', 'website_theme', 'years_experience', 'created_at']
     search_fields = ['user__first_name', 'user__last_name', 'user__email', 'license_number', 'domain_slug']
+    list_select_related = ['user', 'subscription']
     date_hierarchy = 'created_at'
     readonly_fields = ['created_at', 'updated_at', 'domain_slug']
     
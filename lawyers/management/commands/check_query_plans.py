@@ -0,0 +1,79 @@
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from chatbot.models import ChatSession, ChatMessage
+from leads.models import Lead, Consultation
+
+
+# Plan lines that mean a whole table is read instead of an index range
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (?!.*\bUSING\b)(\w+)'),
+    'postgresql': re.compile(r'\bSeq Scan on (\w+)'),
+}
+
+
+def hot_queries(lawyer_id, session_id):
+    """Representative per-lawyer dashboard and API queries that must stay index range scans"""
+    now = timezone.now()
+    week_ago = now - timedelta(days=7)
+    tomorrow = now + timedelta(days=1)
+    upcoming = ['scheduled', 'confirmed']
+
+    return [
+        ('recent chat sessions', ChatSession.objects.filter(lawyer_id=lawyer_id).order_by('-started_at')[:20]),
+        ('chat sessions this week', ChatSession.objects.filter(lawyer_id=lawyer_id, started_at__gte=week_ago)),
+        ('chat consultation requests', ChatSession.objects.filter(lawyer_id=lawyer_id, consultation_requested=True)),
+        ('idle active sessions', ChatSession.objects.filter(lawyer_id=lawyer_id, status='active', last_activity__lt=week_ago)),
+        ('sessions by local hour', ChatSession.objects.filter(lawyer_id=lawyer_id, local_hour=10)),
+        ('session transcript', ChatMessage.objects.filter(session_id=session_id).order_by('created_at')),
+        ('session user messages', ChatMessage.objects.filter(session_id=session_id, message_type='user')),
+        ('recent leads', Lead.objects.filter(lawyer_id=lawyer_id).order_by('-created_at')[:20]),
+        ('leads this week', Lead.objects.filter(lawyer_id=lawyer_id, created_at__gte=week_ago)),
+        ('leads by source', Lead.objects.filter(lawyer_id=lawyer_id, source='website_chat')),
+        ('leads by status', Lead.objects.filter(lawyer_id=lawyer_id, status='new')),
+        ('consultations today', Consultation.objects.filter(
+            lawyer_id=lawyer_id, scheduled_time__gte=now, scheduled_time__lt=tomorrow, status__in=upcoming
+        )),
+        ('upcoming consultations', Consultation.objects.filter(
+            lawyer_id=lawyer_id, scheduled_time__gte=tomorrow, status__in=upcoming
+        ).order_by('scheduled_time')[:5]),
+        ('consultations by status', Consultation.objects.filter(lawyer_id=lawyer_id, status='completed')),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the per-lawyer hot queries and fail if any of them falls back to a full table scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every query plan')
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        pattern = FULL_SCAN_PATTERNS.get(vendor)
+        if pattern is None:
+            raise CommandError(f'Query plan checks are not supported on {vendor}')
+
+        failures = []
+        with transaction.atomic():
+            if vendor == 'postgresql':
+                # Small development tables make seq scans cheapest; ask whether an index *can* serve the query
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+
+            for name, queryset in hot_queries(lawyer_id=1, session_id=1):
+                plan = queryset.explain()
+                scanned = pattern.findall(plan)
+                if options['verbose_plans']:
+                    self.stdout.write(f'-- {name}\n{plan}\n')
+                if scanned:
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR(f'FULL SCAN  {name}: {", ".join(scanned)}'))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'OK         {name}'))
+
+        if failures:
+            raise CommandError(f'{len(failures)} hot queries are not served by an index')
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 07:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lawyers', '0002_remove_lawfirm_email_remove_lawfirm_phone_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lawyer',
+            name='calendar_feed_version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Calendar Feed Version'),
+        ),
+    ]
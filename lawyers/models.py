@@ -123,6 +123,9 @@ class Lawyer(models.Model):
     # Office Hours
     office_hours = models.JSONField(_('Office Hours'), default=dict, blank=True)
     
+    # Part of the signed calendar feed URL; bumping it retires every URL issued before
+    calendar_feed_version = models.PositiveIntegerField(_('Calendar Feed Version'), default=1, editable=False)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -1,3 +1,86 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from adylai.testing import QueryBudgetMixin
+from leads.models import Consultation, Lead
+from .models import LawFirm, Subscription
+
+
+class DashboardQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """The lawyer dashboard must not grow queries with the amount of data"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lawyer', password='secret', first_name='Айбек', last_name='Юристов')
+        lawyer = cls.user.lawyer_profile
+        soon = timezone.now() + timedelta(minutes=30)
+        for index in range(5):
+            lead = Lead.objects.create(lawyer=lawyer, name=f'Клиент {index}', phone=f'+99670000000{index}')
+            Consultation.objects.create(lawyer=lawyer, lead=lead, scheduled_time=soon + timedelta(minutes=index))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_dashboard(self):
+        response = self.assertQueryBudget(8, 'get', reverse('lawyers:dashboard'))
+        self.assertEqual(response.status_code, 200)
+
+
+class CheckQueryPlansTests(TestCase):
+    """check_query_plans flags table scans but not index searches or covering index scans"""
+
+    def test_full_scan_patterns(self):
+        from .management.commands.check_query_plans import FULL_SCAN_PATTERNS
+
+        cases = [
+            ('sqlite', 'SCAN chatbot_chatsession', ['chatbot_chatsession']),
+            ('sqlite', 'SEARCH leads_lead USING INDEX lead_lawyer_created_idx (lawyer_id=?)', []),
+            ('sqlite', 'SCAN leads_consultation USING COVERING INDEX consult_upcoming_idx', []),
+            ('sqlite', 'SEARCH chatbot_chatmessage USING INDEX x (session_id=?)\nSCAN leads_lead', ['leads_lead']),
+            ('postgresql', 'Seq Scan on leads_lead  (cost=0.00..1.05 rows=1 width=8)', ['leads_lead']),
+            ('postgresql', 'Index Scan using lead_lawyer_created_idx on leads_lead', []),
+            ('postgresql', 'Bitmap Heap Scan on chatbot_chatsession', []),
+        ]
+        for vendor, plan, scanned in cases:
+            with self.subTest(plan=plan):
+                self.assertEqual(FULL_SCAN_PATTERNS[vendor].findall(plan), scanned)
+
+    def test_hot_queries_use_indexes(self):
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertNotIn('FULL SCAN', out.getvalue())
+
+
+class AdminChangelistQueryTests(QueryBudgetMixin, TestCase):
+    """Admin changelists run a fixed number of queries however many rows they show"""
+
+    # Session, user, counts, the page and list filter choices; str(obj) labels each row's checkbox
+    QUERIES = {'lawyer': 8, 'subscription': 7, 'lawfirm': 7}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='secret')
+
+    def create_rows(self, start, stop):
+        now = timezone.now()
+        for index in range(start, stop):
+            lawyer = User.objects.create_user(f'lawyer{index}', first_name='Айбек').lawyer_profile
+            lawyer.subscription = Subscription.objects.create(starts_at=now, expires_at=now + timedelta(days=30))
+            lawyer.save()
+            LawFirm.objects.create(name=f'Фирма {index}', address='Бишкек')
 
-# Create your tests here.
+    def test_changelists(self):
+        self.client.force_login(self.admin)
+        # The same count with one row and with five
+        for start, stop in [(0, 1), (1, 5)]:
+            self.create_rows(start, stop)
+            for model, expected in self.QUERIES.items():
+                with self.subTest(model=model, rows=stop):
+                    response = self.assertQueryCount(expected, 'get', reverse(f'admin:lawyers_{model}_changelist'))
+                    self.assertEqual(response.status_code, 200)
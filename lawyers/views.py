@@ -43,20 +43,22 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             # Import here to avoid circular imports
             from leads.models import Lead, Consultation
             
-            # Real data from database
-            today = timezone.now().date()
+            # Real data from database (local day bounds keep the scheduled_time index usable)
+            from chatbot.analytics import local_day_start
+            today_start, tomorrow_start = local_day_start(), local_day_start(-1)
             
             # Lead statistics
             total_leads = Lead.objects.filter(lawyer=lawyer).count()
             
-            # Consultation statistics
+            # Consultation statistics (the today list is small, so count it in Python)
             total_consultations = Consultation.objects.filter(lawyer=lawyer).count()
-            today_consultations = Consultation.objects.filter(
+            today_consultations = list(Consultation.objects.filter(
                 lawyer=lawyer,
-                scheduled_time__date=today,
+                scheduled_time__gte=today_start,
+                scheduled_time__lt=tomorrow_start,
                 status__in=['scheduled', 'confirmed']
-            ).order_by('scheduled_time')
-            scheduled_today = today_consultations.count()
+            ).select_related('lead').order_by('scheduled_time'))
+            scheduled_today = len(today_consultations)
             
             # Recent leads (last 3)
             recent_leads = Lead.objects.filter(lawyer=lawyer).order_by('-created_at')[:3]
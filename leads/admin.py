@@ -1,14 +1,38 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db import IntegrityError
+from django.http import HttpResponseRedirect
 from django.utils.translation import gettext_lazy as _
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Lead, Consultation, LeadNote, LeadSource, LeadAnalytics
+from adylai.admin import EstimatedCountAdminMixin, related_filter
+from .booking import OVERLAP_MESSAGE, is_overlap_error
+from .models import Lead, Consultation, LeadNote, LeadSource, LeadAnalytics, OutboxMessage
+from .search import filter_leads
+
+
+class ConsultationOverlapAdminMixin:
+    """
+    Form validation catches overlapping consultations; a concurrent booking
+    that gets in between is refused by the exclusion constraint, reported
+    here as an error message instead of a server error.
+    """
+    
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except IntegrityError as e:
+            if not is_overlap_error(e):
+                raise
+            self.message_user(request, OVERLAP_MESSAGE, messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
 
 
 @admin.register(Lead)
-class LeadAdmin(admin.ModelAdmin):
+class LeadAdmin(ConsultationOverlapAdminMixin, EstimatedCountAdminMixin, admin.ModelAdmin):
     list_display = ['name', 'lawyer', 'status', 'priority', 'source', 'contact_info_display', 'days_since_created_display', 'created_at']
     list_filter = ['status', 'priority', 'source', 'legal_category', 'created_at']
     search_fields = ['name', 'email', 'phone', 'case_description', 'lawyer__user__username']
+    list_select_related = ['lawyer__user']
     readonly_fields = ['created_at', 'updated_at', 'days_since_created']
     
     fieldsets = (
@@ -51,13 +75,21 @@ class LeadAdmin(admin.ModelAdmin):
         else:
             return f"{days} {_('days ago')}"
     days_since_created_display.short_description = _('Age')
+    
+    def get_search_results(self, request, queryset, search_term):
+        # Full-text index (name, contacts, description, notes) instead of icontains scans
+        if not search_term.strip():
+            return queryset, False
+        return filter_leads(queryset, search_term), False
 
 
 @admin.register(Consultation)
-class ConsultationAdmin(admin.ModelAdmin):
+class ConsultationAdmin(ConsultationOverlapAdminMixin, admin.ModelAdmin):
     list_display = ['lead_name', 'lawyer', 'scheduled_time', 'duration_minutes', 'status', 'consultation_type', 'fee']
     list_filter = ['status', 'consultation_type', 'meeting_method', 'scheduled_time']
     search_fields = ['lead__name', 'lawyer__user__username', 'agenda']
+    list_select_related = ['lead', 'lawyer__user']
+    raw_id_fields = ['lead']
     readonly_fields = ['created_at', 'updated_at', 'completed_at', 'end_time']
     
     fieldsets = (
@@ -95,6 +127,8 @@ class LeadNoteAdmin(admin.ModelAdmin):
     list_display = ['lead_name', 'note_type', 'title', 'author', 'is_client_communication', 'created_at']
     list_filter = ['note_type', 'is_client_communication', 'communication_successful', 'created_at']
     search_fields = ['lead__name', 'title', 'content', 'author__username']
+    list_select_related = ['lead', 'author']
+    raw_id_fields = ['lead']
     readonly_fields = ['created_at']
     
     fieldsets = (
@@ -138,9 +172,13 @@ class LeadSourceAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('lawyer__user').with_stats()
+    
     def leads_count_display(self, obj):
         return obj.get_leads_count()
     leads_count_display.short_description = _('Total Leads')
+    leads_count_display.admin_order_field = 'leads_total'
     
     def conversion_rate_display(self, obj):
         rate = obj.get_conversion_rate()
@@ -151,8 +189,9 @@ class LeadSourceAdmin(admin.ModelAdmin):
 @admin.register(LeadAnalytics)
 class LeadAnalyticsAdmin(admin.ModelAdmin):
     list_display = ['lawyer', 'date', 'new_leads', 'qualified_leads', 'converted_leads', 'lead_to_consultation_rate', 'consultation_to_client_rate']
-    list_filter = ['date', 'lawyer']
+    list_filter = ['date', ('lawyer', related_filter('user'))]
     search_fields = ['lawyer__user__username']
+    list_select_related = ['lawyer__user']
     readonly_fields = ['created_at']
     date_hierarchy = 'date'
     
@@ -179,6 +218,20 @@ class LeadAnalyticsAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'subject', 'status', 'attempts', 'available_at', 'created_at', 'sent_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['subject']
+    readonly_fields = ['kind', 'recipients', 'reply_to', 'subject', 'body', 'attempts', 'last_error', 'created_at', 'sent_at']
+    actions = ['retry_now']
+    
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(status='pending', available_at=timezone.now())
+        self.message_user(request, _('%(count)d messages queued for another attempt.') % {'count': updated})
+    retry_now.short_description = _('Retry now')
+
+
 # Inline admin for related models
 class LeadNoteInline(admin.TabularInline):
     model = LeadNote
@@ -7,12 +7,14 @@ urlpatterns = [
     # Lead API
     path('', api_views.LeadListAPIView.as_view(), name='lead_list'),
     path('create/', api_views.CreateLeadAPIView.as_view(), name='create_lead'),
+    path('search/', api_views.LeadSearchAPIView.as_view(), name='search'),
     path('<int:lead_id>/', api_views.LeadDetailAPIView.as_view(), name='lead_detail'),
     path('<int:lead_id>/update/', api_views.UpdateLeadAPIView.as_view(), name='update_lead'),
     
     # Consultation API
     path('consultations/', api_views.ConsultationListAPIView.as_view(), name='consultation_list'),
     path('consultations/create/', api_views.CreateConsultationAPIView.as_view(), name='create_consultation'),
+    path('consultations/availability/', api_views.AvailabilityAPIView.as_view(), name='availability'),
     path('consultations/<int:consultation_id>/', api_views.ConsultationDetailAPIView.as_view(), name='consultation_detail'),
     
     # Analytics API
@@ -1,57 +1,189 @@
+from django.db import transaction
+from django.db.models import Prefetch
 from django.http import JsonResponse
 from django.views.generic import View
+from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
+from .availability import next_free_slots
+from .booking import SlotUnavailable, book_consultation
+from .models import Consultation, Lead, LeadNote, LeadSource
+from .notifications import notify_consultation_booked, notify_new_lead
+from .pagination import ConsultationPagination, LeadPagination
+from .search import search_leads
+from .serializers import (
+    ConsultationSerializer, LeadCreateSerializer, LeadDetailSerializer, LeadSerializer, LeadSourceSerializer,
+    requested_fields,
+)
+
+
+class LawyerLeadsMixin:
+    """Scope querysets to the current lawyer through the user join, without loading the profile"""
+    
+    def get_leads(self):
+        return Lead.objects.filter(lawyer__user=self.request.user)
+    
+    def get_consultations(self):
+        return Consultation.objects.filter(lawyer__user=self.request.user)
 
 
-class LeadListAPIView(APIView):
-    """List leads API"""
+class LeadListAPIView(LawyerLeadsMixin, generics.ListAPIView):
+    """Lawyer's leads, newest first, paged by cursor; filter with ?status= and ?source="""
+    serializer_class = LeadSerializer
+    pagination_class = LeadPagination
+    
+    def get_queryset(self):
+        leads = self.get_leads().select_related('assigned_to')
+        for field in ('status', 'source'):
+            value = self.request.query_params.get(field)
+            if value:
+                leads = leads.filter(**{field: value})
+        return leads
+
+
+class LeadSearchAPIView(APIView):
+    """Ranked full-text search over the current lawyer's leads and notes"""
+    max_page_size = 50
     
     def get(self, request):
-        return Response({'message': 'Leads list API'})
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = min(max(int(request.query_params.get('page_size', 20)), 1), self.max_page_size)
+        except ValueError:
+            return Response({'error': 'page and page_size must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # One extra row tells whether another page follows
+        hits = search_leads(request.user.lawyer_profile, query, offset=(page - 1) * page_size, limit=page_size + 1)
+        return Response({
+            'query': query,
+            'page': page,
+            'has_next': len(hits) > page_size,
+            'results': [
+                {
+                    'id': hit.lead.pk,
+                    'name': hit.lead.name,
+                    'phone': hit.lead.phone,
+                    'email': hit.lead.email,
+                    'legal_category': hit.lead.legal_category,
+                    'status': hit.lead.status,
+                    'source': hit.lead.source,
+                    'created_at': hit.lead.created_at,
+                    'rank': hit.rank,
+                }
+                for hit in hits[:page_size]
+            ],
+        })
 
 
 class CreateLeadAPIView(APIView):
-    """Create lead API"""
+    """Create a lead, or fill in the existing one with the same phone number"""
     
     def post(self, request):
-        return Response({'message': 'Lead created'})
-
-
-class LeadDetailAPIView(APIView):
-    """Lead detail API"""
+        serializer = LeadCreateSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        data = dict(serializer.validated_data)
+        lawyer = request.user.lawyer_profile
+        with transaction.atomic():
+            lead, created = Lead.objects.upsert_by_phone(lawyer, data.pop('phone', ''), defaults=data)
+            if created:
+                notify_new_lead(lead, lawyer)
+        return Response(
+            LeadSerializer(lead, context={'request': request}).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+
+class LeadDetailAPIView(LawyerLeadsMixin, generics.RetrieveAPIView):
+    """Lead with its notes and consultations in three queries"""
+    serializer_class = LeadDetailSerializer
+    lookup_url_kwarg = 'lead_id'
     
-    def get(self, request, lead_id):
-        return Response({'message': f'Lead {lead_id} API'})
-
-
-class UpdateLeadAPIView(APIView):
-    """Update lead API"""
+    def get_queryset(self):
+        # Only join and prefetch what ?fields= asks for
+        fields = requested_fields(self.request)
+        leads = self.get_leads()
+        if fields is None or 'assigned_to' in fields:
+            leads = leads.select_related('assigned_to')
+        if fields is None or 'notes' in fields:
+            leads = leads.prefetch_related(Prefetch('notes', queryset=LeadNote.objects.select_related('author')))
+        if fields is None or 'consultations' in fields:
+            leads = leads.prefetch_related('consultations')
+        return leads
+
+
+class UpdateLeadAPIView(LawyerLeadsMixin, generics.UpdateAPIView):
+    """Update a lead's status, priority, assignment and case details (PUT or PATCH)"""
+    serializer_class = LeadSerializer
+    lookup_url_kwarg = 'lead_id'
     
-    def put(self, request, lead_id):
-        return Response({'message': f'Lead {lead_id} updated'})
+    def get_queryset(self):
+        return self.get_leads().select_related('assigned_to')
 
 
-class ConsultationListAPIView(APIView):
-    """Consultation list API"""
+class ConsultationListAPIView(LawyerLeadsMixin, generics.ListAPIView):
+    """Lawyer's consultations, latest first, paged by cursor; filter with ?status="""
+    serializer_class = ConsultationSerializer
+    pagination_class = ConsultationPagination
     
-    def get(self, request):
-        return Response({'message': 'Consultations list API'})
+    def get_queryset(self):
+        consultations = self.get_consultations().select_related('lead')
+        value = self.request.query_params.get('status')
+        if value:
+            consultations = consultations.filter(status=value)
+        return consultations
 
 
-class CreateConsultationAPIView(APIView):
-    """Create consultation API"""
+class CreateConsultationAPIView(generics.CreateAPIView):
+    """Schedule a consultation for one of the lawyer's leads; 409 with free slots when the time is taken"""
+    serializer_class = ConsultationSerializer
     
-    def post(self, request):
-        return Response({'message': 'Consultation created'})
-
-
-class ConsultationDetailAPIView(APIView):
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = dict(serializer.validated_data)
+        lawyer = request.user.lawyer_profile
+        start = data.pop('scheduled_time')
+        duration = data.pop('duration_minutes', Consultation._meta.get_field('duration_minutes').default)
+        try:
+            with transaction.atomic():
+                consultation = book_consultation(lawyer, start, duration, **data)
+                notify_consultation_booked(consultation, lawyer)
+        except SlotUnavailable:
+            slots = next_free_slots(lawyer, 5, duration, after=start)
+            return Response(
+                {'error': 'This time is not available', 'available_slots': [slot.isoformat() for slot in slots]},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response(self.get_serializer(consultation).data, status=status.HTTP_201_CREATED)
+
+
+class AvailabilityAPIView(APIView):
+    """The current lawyer's next free consultation slots (?count=, ?duration= in minutes)"""
+    max_count = 50
+    
+    def get(self, request):
+        try:
+            count = min(max(int(request.query_params.get('count', 10)), 1), self.max_count)
+            duration = int(request.query_params.get('duration', 60))
+        except ValueError:
+            return Response({'error': 'count and duration must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if duration not in dict(Consultation.DURATION_CHOICES):
+            return Response({'error': 'Unsupported duration'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        slots = next_free_slots(request.user.lawyer_profile, count, duration)
+        return Response({'duration_minutes': duration, 'slots': [slot.isoformat() for slot in slots]})
+
+
+class ConsultationDetailAPIView(LawyerLeadsMixin, generics.RetrieveAPIView):
     """Consultation detail API"""
+    serializer_class = ConsultationSerializer
+    lookup_url_kwarg = 'consultation_id'
     
-    def get(self, request, consultation_id):
-        return Response({'message': f'Consultation {consultation_id} API'})
+    def get_queryset(self):
+        return self.get_consultations().select_related('lead')
 
 
 class LeadAnalyticsAPIView(APIView):
@@ -61,11 +193,13 @@ class LeadAnalyticsAPIView(APIView):
         return Response({'message': 'Lead analytics API'})
 
 
-class LeadSourcesAPIView(APIView):
-    """Lead sources API"""
+class LeadSourcesAPIView(generics.ListAPIView):
+    """The lawyer's tracked lead sources with lead and conversion totals, in one query"""
+    serializer_class = LeadSourceSerializer
+    pagination_class = None
     
-    def get(self, request):
-        return Response({'message': 'Lead sources API'})
+    def get_queryset(self):
+        return LeadSource.objects.filter(lawyer__user=self.request.user).with_stats().order_by('-leads_total', 'name')
 
 
 class PublicLeadCaptureAPIView(APIView):
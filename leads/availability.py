@@ -0,0 +1,177 @@
+# Consultation availability per lawyer. Office hours (from the lawyer's chat
+# configuration) minus active consultations widened by a buffer are flattened
+# into one sorted list of disjoint free intervals, in epoch minutes, over the
+# booking horizon. "Is this slot free" is then a single bisect and "next N
+# free slots" a bisect plus N steps. The index is cached per lawyer under a
+# version number that consultation and office-hours changes bump.
+
+import math
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
+
+from chatbot.schedule import OfficeSchedule, compile_office_hours
+from .versioning import bump_version, versioned_key
+
+
+# Statuses that hold a slot (the same set as the consult_upcoming_idx index)
+ACTIVE_STATUSES = ('scheduled', 'confirmed')
+
+# Longest consultation (Consultation.DURATION_CHOICES), to catch ones that started before now
+MAX_DURATION_MINUTES = 120
+
+# Used when the lawyer has no office hours configured
+DEFAULT_OFFICE_HOURS = {
+    day: {'enabled': True, 'start': '09:00', 'end': '18:00'}
+    for day in ['monday', 'tuesday', 'wednesday', 'thursday', 'friday']
+}
+
+
+def _minutes(moment):
+    """Aware datetime -> whole minutes since the epoch (rounded down)"""
+    return int(moment.timestamp() // 60)
+
+
+def _datetime(minutes):
+    return datetime.fromtimestamp(minutes * 60, tz=timezone.get_current_timezone())
+
+
+def _merge(intervals):
+    merged = []
+    for low, high in sorted(intervals):
+        if merged and low <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], high)
+        else:
+            merged.append([low, high])
+    return merged
+
+
+def _difference(intervals, removed):
+    """Sorted disjoint `intervals` minus sorted disjoint `removed`, in one linear sweep"""
+    result, index = [], 0
+    for low, high in intervals:
+        while index < len(removed) and removed[index][1] <= low:
+            index += 1
+        cursor, scan = low, index
+        while scan < len(removed) and removed[scan][0] < high:
+            if removed[scan][0] > cursor:
+                result.append([cursor, removed[scan][0]])
+            cursor = max(cursor, removed[scan][1])
+            scan += 1
+        if cursor < high:
+            result.append([cursor, high])
+    return result
+
+
+def office_schedule(lawyer):
+    """The lawyer's compiled OfficeSchedule, or the default weekday hours"""
+    try:
+        config = lawyer.chat_config
+    except ObjectDoesNotExist:
+        config = None
+    if config and config.office_hours_enabled and config.office_hours:
+        return config.schedule
+    return OfficeSchedule(compile_office_hours(DEFAULT_OFFICE_HOURS))
+
+
+def _open_intervals(schedule, start, end):
+    """Office-hours intervals, in epoch minutes, clipped to [start, end)"""
+    intervals = []
+    day = _datetime(start).astimezone(schedule.zone).date() - timedelta(days=1)
+    last_day = _datetime(end).astimezone(schedule.zone).date()
+    while day <= last_day:
+        if day.isoformat() not in schedule.holidays:
+            midnight = datetime.combine(day, time.min).replace(tzinfo=schedule.zone)
+            for low, high in schedule.week[day.weekday()]:
+                low = _minutes(midnight + timedelta(minutes=low))
+                high = _minutes(midnight + timedelta(minutes=high))
+                if high > start and low < end:
+                    intervals.append([max(low, start), min(high, end)])
+        day += timedelta(days=1)
+    return _merge(intervals)
+
+
+class AvailabilityIndex:
+    """Sorted disjoint free intervals [start, end) in epoch minutes"""
+
+    def __init__(self, free, horizon_end):
+        self.starts = [low for low, _high in free]
+        self.ends = [high for _low, high in free]
+        self.horizon_end = horizon_end
+
+    def is_free(self, start, duration_minutes):
+        """Whether [start, start + duration) lies inside one free interval"""
+        low = _minutes(start)
+        index = bisect_right(self.starts, low) - 1
+        return index >= 0 and self.ends[index] >= low + duration_minutes
+
+    def next_free_slots(self, count, duration_minutes, after=None, step_minutes=None):
+        """Up to `count` slot starts (aware datetimes) after `after`, on a step-minute grid"""
+        step = step_minutes or settings.CONSULTATION_SLOT_STEP_MINUTES
+        # Round up: a slot that started seconds ago is already in the past
+        after = math.ceil((after or timezone.now()).timestamp() / 60)
+        slots = []
+        index = bisect_right(self.ends, after)
+        while index < len(self.starts) and len(slots) < count:
+            slot = max(self.starts[index], after)
+            slot += -slot % step
+            while slot + duration_minutes <= self.ends[index] and len(slots) < count:
+                slots.append(_datetime(slot))
+                slot += step
+            index += 1
+        return slots
+
+
+def build_index(lawyer, now=None):
+    """Build the lawyer's index from office hours and active consultations: one query"""
+    # Import here to avoid circular imports
+    from .models import Consultation
+
+    now = now or timezone.now()
+    start = _minutes(now)
+    end = start + settings.CONSULTATION_BOOKING_DAYS * 24 * 60
+    buffer = settings.CONSULTATION_BUFFER_MINUTES
+
+    booked = Consultation.objects.filter(
+        lawyer=lawyer,
+        status__in=ACTIVE_STATUSES,
+        scheduled_time__gte=now - timedelta(minutes=MAX_DURATION_MINUTES + buffer),
+        scheduled_time__lt=_datetime(end + buffer),
+    ).values_list('scheduled_time', 'duration_minutes')
+    busy = _merge(
+        [_minutes(scheduled) - buffer, _minutes(scheduled) + duration + buffer] for scheduled, duration in booked
+    )
+    return AvailabilityIndex(_difference(_open_intervals(office_schedule(lawyer), start, end), busy), end)
+
+
+# Caching
+
+def invalidate(lawyer_id):
+    """Retire the lawyer's cached index; readers rebuild on their next lookup"""
+    bump_version('availability', lawyer_id)
+
+
+def get_availability(lawyer):
+    """The lawyer's AvailabilityIndex, from cache when current"""
+    key = versioned_key('availability', lawyer.pk)
+    index = cache.get(key)
+    if index is None:
+        index = build_index(lawyer)
+        cache.set(key, index, settings.AVAILABILITY_CACHE_SECONDS)
+    return index
+
+
+def is_slot_free(lawyer, start, duration_minutes):
+    """Whether a consultation can be booked at `start`; past slots never are"""
+    if start < timezone.now():
+        return False
+    return get_availability(lawyer).is_free(start, duration_minutes)
+
+
+def next_free_slots(lawyer, count=5, duration_minutes=60, after=None):
+    now = timezone.now()
+    return get_availability(lawyer).next_free_slots(count, duration_minutes, max(after or now, now))
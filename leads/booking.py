@@ -0,0 +1,116 @@
+# Race-free consultation booking. On PostgreSQL an exclusion constraint keeps a
+# lawyer's active consultations from overlapping, so two concurrent bookings of
+# one slot cannot both commit. Other backends serialize a lawyer's bookings by
+# writing the lawyer row first (on SQLite that takes the database write lock)
+# and then checking for overlaps before inserting. The constraint is strict
+# overlap; the buffer between consultations is applied by the availability
+# index when offering and pre-checking slots.
+
+from datetime import timedelta
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F
+from django.utils.translation import gettext_lazy as _
+
+from .availability import ACTIVE_STATUSES
+
+
+CONSTRAINT_NAME = 'consult_no_overlap'
+
+OVERLAP_MESSAGE = _('The lawyer already has a consultation at this time.')
+
+_ACTIVE_SQL = ', '.join(f"'{status}'" for status in ACTIVE_STATUSES)
+
+POSTGRES_INSTALL = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    f"""
+    ALTER TABLE leads_consultation ADD CONSTRAINT {CONSTRAINT_NAME}
+    EXCLUDE USING gist (lawyer_id WITH =, tstzrange(scheduled_time, ends_at) WITH &&)
+    WHERE (status IN ({_ACTIVE_SQL}))
+    """,
+]
+POSTGRES_UNINSTALL = [f"ALTER TABLE leads_consultation DROP CONSTRAINT IF EXISTS {CONSTRAINT_NAME}"]
+
+
+class SlotUnavailable(Exception):
+    """The requested consultation time overlaps another active booking"""
+
+
+def install(schema_editor):
+    """Add the exclusion constraint; other backends rely on book_consultation's lock"""
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_INSTALL:
+            schema_editor.execute(statement)
+
+
+def uninstall(schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_UNINSTALL:
+            schema_editor.execute(statement)
+
+
+def overlapping(consultation_model, lawyer_id, start, end):
+    """Active consultations of the lawyer overlapping [start, end)"""
+    return consultation_model._base_manager.filter(
+        lawyer_id=lawyer_id, status__in=ACTIVE_STATUSES, scheduled_time__lt=end, ends_at__gt=start
+    )
+
+
+def find_overlaps(consultation_model, lawyer_id=None):
+    """
+    (earlier_pk, overlapping_pk) for each active consultation that overlaps
+    an earlier active one of the same lawyer; existing double bookings that
+    must be resolved before the exclusion constraint can be added.
+    """
+    active = consultation_model._base_manager.filter(status__in=ACTIVE_STATUSES)
+    if lawyer_id is not None:
+        active = active.filter(lawyer_id=lawyer_id)
+    overlaps = []
+    current_lawyer, kept_pk, kept_until = None, None, None
+    for lawyer, pk, start, end in active.order_by('lawyer_id', 'scheduled_time', 'created_at').values_list(
+        'lawyer_id', 'pk', 'scheduled_time', 'ends_at'
+    ):
+        if lawyer == current_lawyer and start < kept_until:
+            overlaps.append((kept_pk, pk))
+        else:
+            current_lawyer, kept_pk, kept_until = lawyer, pk, end
+    return overlaps
+
+
+def is_overlap_error(error):
+    """Whether an IntegrityError comes from the exclusion constraint"""
+    return CONSTRAINT_NAME in str(error)
+
+
+def book_consultation(lawyer, scheduled_time, duration_minutes, **fields):
+    """
+    Create a consultation unless it overlaps an active one of the same lawyer;
+    raises SlotUnavailable. Safe against concurrent bookings of the same slot.
+    """
+    # Import here to avoid circular imports
+    from lawyers.models import Lawyer
+    from .models import Consultation
+
+    end = scheduled_time + timedelta(minutes=duration_minutes)
+    connection = connections[router.db_for_write(Consultation)]
+
+    if connection.vendor == 'postgresql':
+        try:
+            with transaction.atomic():
+                return Consultation.objects.create(
+                    lawyer=lawyer, scheduled_time=scheduled_time, duration_minutes=duration_minutes, **fields
+                )
+        except IntegrityError as e:
+            if is_overlap_error(e):
+                raise SlotUnavailable() from e
+            raise
+
+    with transaction.atomic():
+        # Writing the lawyer row first queues concurrent bookings for this lawyer
+        # behind each other, so the overlap check below sees committed rivals
+        Lawyer.objects.filter(pk=lawyer.pk).update(updated_at=F('updated_at'))
+        if overlapping(Consultation, lawyer.pk, scheduled_time, end).exists():
+            raise SlotUnavailable()
+        return Consultation.objects.create(
+            lawyer=lawyer, scheduled_time=scheduled_time, duration_minutes=duration_minutes, **fields
+        )
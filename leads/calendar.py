@@ -0,0 +1,202 @@
+# Per-lawyer iCalendar feed of consultations. Calendar apps poll feeds every
+# few minutes, so the rendered feed is cached with its strong ETag and
+# Last-Modified under a per-lawyer version number. Consultation and lead
+# changes bump the version; an unchanged feed answers a conditional poll with
+# 304 from two cache reads without touching the consultation tables. Feed URLs carry a signed
+# token instead of a session, since calendar apps cannot log in. The token
+# includes the lawyer's feed version, so rotating it retires leaked URLs.
+
+import hashlib
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .versioning import bump_version, versioned_key
+
+
+TOKEN_SALT = 'leads.calendar.feed'
+
+# Consultations this far back and ahead are included
+PAST_DAYS = 30
+FUTURE_DAYS = 365
+
+ICS_STATUS = {
+    'scheduled': 'TENTATIVE',
+    'confirmed': 'CONFIRMED',
+    'cancelled': 'CANCELLED',
+    'rescheduled': 'CANCELLED',
+}
+
+
+def _signer():
+    # '.' never appears in the signature, and keeps the token URL-safe
+    return signing.Signer(sep='.', salt=TOKEN_SALT)
+
+
+def feed_token(lawyer):
+    """Signed token identifying the current version of the lawyer's feed"""
+    return _signer().sign(f'{lawyer.pk}-{lawyer.calendar_feed_version}')
+
+
+def parse_token(token):
+    """(lawyer_id, feed_version) a token was issued for, or None if it is forged"""
+    try:
+        lawyer_id, version = _signer().unsign(token).split('-')
+        return int(lawyer_id), int(version)
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def rotate_feed(lawyer):
+    """Issue the lawyer a new feed URL; every earlier one stops working"""
+    # Import here to avoid circular imports
+    from lawyers.models import Lawyer
+
+    Lawyer.objects.filter(pk=lawyer.pk).update(calendar_feed_version=F('calendar_feed_version') + 1)
+    lawyer.refresh_from_db(fields=['calendar_feed_version'])
+    transaction.on_commit(lambda: invalidate(lawyer.pk))
+    return feed_token(lawyer)
+
+
+# Text formatting (RFC 5545)
+
+def _escape(value):
+    return (
+        str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def _fold(line):
+    """Split a content line into 75-octet chunks without cutting a UTF-8 sequence"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+    chunks, start, limit = [], 0, 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1
+        chunks.append(encoded[start:end].decode('utf-8'))
+        start, limit = end, 74
+    return '\r\n '.join(chunks)
+
+
+def _timestamp(moment):
+    return moment.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _event(consultation, domain):
+    lead = consultation.lead
+    description = '\n'.join(
+        line for line in [
+            f'{lead.name} {lead.phone}'.strip(),
+            lead.email,
+            consultation.get_meeting_method_display(),
+            consultation.agenda,
+        ] if line
+    )
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:consultation-{consultation.pk}@{domain}',
+        f'DTSTAMP:{_timestamp(consultation.updated_at)}',
+        f'LAST-MODIFIED:{_timestamp(consultation.updated_at)}',
+        f'DTSTART:{_timestamp(consultation.scheduled_time)}',
+        f'DTEND:{_timestamp(consultation.ends_at)}',
+        f'SUMMARY:{_escape(f"{consultation.get_consultation_type_display()}: {lead.name}")}',
+        f'DESCRIPTION:{_escape(description)}',
+        f'STATUS:{ICS_STATUS.get(consultation.status, "CONFIRMED")}',
+    ]
+    if consultation.location or consultation.meeting_link:
+        lines.append(f'LOCATION:{_escape(consultation.location or consultation.meeting_link)}')
+    lines.append('END:VEVENT')
+    return lines
+
+
+def render_feed(lawyer_id, domain, now=None):
+    """
+    (body, last_modified) for the lawyer's feed: one range query on
+    (lawyer, scheduled_time) joined to the lead.
+    """
+    # Import here to avoid circular imports
+    from .models import Consultation
+
+    now = now or timezone.now()
+    consultations = list(
+        Consultation.objects.filter(
+            lawyer_id=lawyer_id,
+            scheduled_time__gte=now - timedelta(days=PAST_DAYS),
+            scheduled_time__lt=now + timedelta(days=FUTURE_DAYS),
+        ).select_related('lead').order_by('scheduled_time')
+    )
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:-//{domain}//Consultations//RU',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-TIMEZONE:{settings.TIME_ZONE}',
+    ]
+    for consultation in consultations:
+        lines.extend(_event(consultation, domain))
+    lines.append('END:VCALENDAR')
+
+    body = ''.join(f'{_fold(line)}\r\n' for line in lines).encode('utf-8')
+    last_modified = max((consultation.updated_at for consultation in consultations), default=None)
+    return body, last_modified
+
+
+# Caching
+
+def _changed_key(lawyer_id):
+    return f'leads:calendar:changed:{lawyer_id}'
+
+
+def invalidate(lawyer_id):
+    """Retire the lawyer's cached feed and note when; the next poll renders it again"""
+    cache.set(_changed_key(lawyer_id), timezone.now(), timeout=None)
+    bump_version('calendar', lawyer_id)
+
+
+def get_feed(lawyer_id, domain):
+    """
+    Cached {'body', 'etag', 'last_modified', 'feed_version'} for the lawyer's
+    feed. The ETag hashes the body, so a re-render that changes nothing keeps
+    the same one.
+    """
+    # Import here to avoid circular imports
+    from lawyers.models import Lawyer
+
+    key = versioned_key('calendar', lawyer_id, domain)
+    feed = cache.get(key)
+    if feed is None:
+        feed_version = Lawyer.objects.filter(pk=lawyer_id).values_list('calendar_feed_version', flat=True).first()
+        body, last_modified = render_feed(lawyer_id, domain)
+        # A hard delete or a lead edit changes the feed without raising any
+        # consultation's updated_at, so the last invalidation counts as well
+        changed_at = cache.get(_changed_key(lawyer_id))
+        if changed_at and (last_modified is None or changed_at > last_modified):
+            last_modified = changed_at
+        feed = {
+            'body': body,
+            'etag': f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+            'last_modified': last_modified,
+            'feed_version': feed_version,
+        }
+        cache.set(key, feed, settings.CALENDAR_FEED_CACHE_SECONDS)
+    return feed
+
+
+def feed_for_token(token, domain):
+    """The feed a token addresses, or None when it is forged or has been rotated"""
+    issued = parse_token(token)
+    if issued is None:
+        return None
+    lawyer_id, feed_version = issued
+    feed = get_feed(lawyer_id, domain)
+    return feed if feed['feed_version'] == feed_version else None
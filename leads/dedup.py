@@ -0,0 +1,92 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from chatbot.extraction import normalize_phone
+
+
+# Text fields a duplicate fills in on the kept lead when the kept lead has them blank
+FILL_FIELDS = [
+    'email', 'legal_category', 'ip_address', 'user_agent', 'referrer_url',
+    'utm_source', 'utm_medium', 'utm_campaign', 'assigned_to_id', 'estimated_budget',
+]
+
+
+def duplicate_groups(lead_model, lawyer_id=None):
+    """
+    Lists of lead ids sharing a lawyer and normalized phone, oldest first.
+    Phones are normalized here, so this works before phone_e164 is filled.
+    """
+    leads = lead_model._base_manager.exclude(phone='').order_by('created_at', 'pk')
+    if lawyer_id:
+        leads = leads.filter(lawyer_id=lawyer_id)
+
+    groups = defaultdict(list)
+    for pk, lawyer, phone in leads.values_list('pk', 'lawyer_id', 'phone').iterator(chunk_size=2000):
+        phone_e164 = normalize_phone(phone)
+        if phone_e164:
+            groups[(lawyer, phone_e164)].append(pk)
+    return [ids for ids in groups.values() if len(ids) > 1]
+
+
+def merge_leads(keeper, duplicates):
+    """
+    Fold duplicate leads into `keeper`: every related row (consultations,
+    notes, chat sessions) is re-pointed, blank fields and descriptions are
+    carried over, then the duplicates are deleted. Works with historical
+    models inside migrations as well as with the live ones.
+    """
+    lead_model = type(keeper)
+    duplicate_ids = [lead.pk for lead in duplicates]
+
+    with transaction.atomic():
+        for relation in lead_model._meta.related_objects:
+            if relation.one_to_many:
+                relation.related_model._base_manager.filter(
+                    **{f'{relation.field.name}__in': duplicate_ids}
+                ).update(**{relation.field.name: keeper.pk})
+
+        descriptions = [keeper.case_description]
+        for lead in duplicates:
+            for field in FILL_FIELDS:
+                if getattr(keeper, field) in ('', None) and getattr(lead, field) not in ('', None):
+                    setattr(keeper, field, getattr(lead, field))
+            if lead.case_description and lead.case_description not in descriptions:
+                descriptions.append(lead.case_description)
+            if keeper.status == 'new' and lead.status != 'new':
+                keeper.status = lead.status
+            if lead.contacted_at and (not keeper.contacted_at or lead.contacted_at < keeper.contacted_at):
+                keeper.contacted_at = lead.contacted_at
+        keeper.case_description = '\n\n'.join(description for description in descriptions if description)
+
+        lead_model._base_manager.filter(pk__in=duplicate_ids).delete()
+        keeper.save(update_fields=FILL_FIELDS + ['case_description', 'status', 'contacted_at'])
+
+
+def merge_duplicate_leads(lead_model, lawyer_id=None, dry_run=False):
+    """Merge every duplicate group; returns (groups, leads removed)"""
+    groups = duplicate_groups(lead_model, lawyer_id)
+    removed = 0
+    for ids in groups:
+        removed += len(ids) - 1
+        if dry_run:
+            continue
+        leads = {lead.pk: lead for lead in lead_model._base_manager.filter(pk__in=ids)}
+        merge_leads(leads[ids[0]], [leads[pk] for pk in ids[1:]])
+    return len(groups), removed
+
+
+def backfill_phone_e164(lead_model, batch_size=1000):
+    """Fill phone_e164 on leads written without it (bulk inserts, imports); returns rows updated"""
+    batch, updated = [], 0
+    leads = lead_model._base_manager.filter(phone_e164__isnull=True).exclude(phone='').only('id', 'phone')
+    for lead in leads.iterator(chunk_size=batch_size):
+        lead.phone_e164 = normalize_phone(lead.phone)
+        if lead.phone_e164:
+            batch.append(lead)
+        if len(batch) >= batch_size:
+            updated += lead_model._base_manager.bulk_update(batch, ['phone_e164'])
+            batch = []
+    if batch:
+        updated += lead_model._base_manager.bulk_update(batch, ['phone_e164'])
+    return updated
@@ -0,0 +1,170 @@
+import csv
+import tempfile
+from datetime import datetime, time, timedelta
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from openpyxl import Workbook
+
+from .models import Consultation, Lead
+
+
+# Rows fetched per round trip; PostgreSQL streams them through a server-side cursor
+EXPORT_CHUNK_SIZE = 2000
+
+# (values() lookup, column header); choice fields are exported with their labels
+LEAD_EXPORT_COLUMNS = [
+    ('id', 'ID'),
+    ('created_at', 'Created'),
+    ('name', 'Name'),
+    ('phone', 'Phone'),
+    ('email', 'Email'),
+    ('legal_category', 'Legal Category'),
+    ('status', 'Status'),
+    ('priority', 'Priority'),
+    ('source', 'Source'),
+    ('urgency', 'Urgency'),
+    ('estimated_budget', 'Estimated Budget'),
+    ('case_description', 'Case Description'),
+    ('utm_source', 'UTM Source'),
+    ('utm_medium', 'UTM Medium'),
+    ('utm_campaign', 'UTM Campaign'),
+    ('contacted_at', 'First Contact'),
+]
+
+CONSULTATION_EXPORT_COLUMNS = [
+    ('id', 'ID'),
+    ('scheduled_time', 'Scheduled Time'),
+    ('duration_minutes', 'Duration (minutes)'),
+    ('lead__name', 'Client'),
+    ('lead__phone', 'Client Phone'),
+    ('lead__email', 'Client Email'),
+    ('consultation_type', 'Type'),
+    ('status', 'Status'),
+    ('meeting_method', 'Meeting Method'),
+    ('fee', 'Fee'),
+    ('agenda', 'Agenda'),
+    ('outcome', 'Outcome'),
+    ('follow_up_required', 'Follow-up Required'),
+    ('follow_up_date', 'Follow-up Date'),
+    ('created_at', 'Created'),
+]
+
+# Field each export's date range applies to
+DATE_FIELDS = {Lead: 'created_at', Consultation: 'scheduled_time'}
+
+# Spreadsheet apps evaluate cells starting with these characters as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Echo:
+    """File-like object whose write() returns the value, so csv.writer produces strings to stream"""
+
+    def write(self, value):
+        return value
+
+
+def _local_day(value, days=0):
+    """Aware start of a local day, `days` after the given date"""
+    return timezone.make_aware(datetime.combine(value + timedelta(days=days), time.min))
+
+
+def filter_export_queryset(queryset, params):
+    """
+    Apply the export filters from a query dict: status and source (repeatable),
+    date_from and date_to (inclusive local dates). Raises ValueError on bad dates.
+    """
+    model = queryset.model
+    statuses = [status for status in params.getlist('status') if status]
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+    sources = [source for source in params.getlist('source') if source]
+    if sources and model is Lead:
+        queryset = queryset.filter(source__in=sources)
+
+    date_field = DATE_FIELDS[model]
+    for param, lookup, days in [('date_from', 'gte', 0), ('date_to', 'lt', 1)]:
+        if not params.get(param):
+            continue
+        value = parse_date(params[param])
+        if value is None:
+            raise ValueError(f"{param} must be a date in YYYY-MM-DD format")
+        queryset = queryset.filter(**{f'{date_field}__{lookup}': _local_day(value, days)})
+    return queryset
+
+
+def _formatters(model, columns):
+    """Per-column functions turning raw values() output into export cells"""
+    formatters = []
+    for lookup, _header in columns:
+        field = model._meta.get_field(lookup) if '__' not in lookup else None
+        if field is not None and field.choices:
+            labels = {value: str(label) for value, label in field.flatchoices}
+            formatters.append(lambda value, labels=labels: labels.get(value, value))
+        else:
+            formatters.append(_format_value)
+    return formatters
+
+
+def _format_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return timezone.localtime(value).strftime('%Y-%m-%d %H:%M')
+    if isinstance(value, bool):
+        return 'Yes' if value else 'No'
+    return value
+
+
+def _safe_cell(value):
+    """Neutralize formula injection in text cells; phone numbers like +996… stay as they are"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        if not (value[0] == '+' and value[1:].replace(' ', '').isdigit()):
+            return "'" + value
+    return value
+
+
+def export_rows(queryset, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    """Header row, then one row per object, read in chunks so memory stays flat"""
+    yield [header for _lookup, header in columns]
+    formatters = _formatters(queryset.model, columns)
+    rows = queryset.values_list(*[lookup for lookup, _header in columns]).iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield [_safe_cell(formatter(value)) for formatter, value in zip(formatters, row)]
+
+
+def csv_response(queryset, columns, filename):
+    """StreamingHttpResponse writing the export as CSV while rows are fetched"""
+    writer = csv.writer(Echo())
+
+    def content():
+        # BOM so Excel opens UTF-8 (Cyrillic) text correctly
+        yield '\ufeff'
+        for row in export_rows(queryset, columns):
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(content(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def xlsx_response(queryset, columns, filename, title):
+    """
+    XLSX export through openpyxl's write-only workbook, which flushes rows to a
+    temporary file instead of keeping them in memory
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title)
+    for row in export_rows(queryset, columns):
+        sheet.append(row)
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f'{filename}.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from leads.booking import find_overlaps
+from leads.models import Consultation
+
+
+class Command(BaseCommand):
+    help = 'List active consultations that overlap an earlier one of the same lawyer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lawyer', type=int, help='Only check consultations of this lawyer id')
+
+    def handle(self, *args, **options):
+        overlaps = find_overlaps(Consultation, lawyer_id=options['lawyer'])
+        if not overlaps:
+            self.stdout.write(self.style.SUCCESS('No overlapping consultations'))
+            return
+
+        for earlier, later in overlaps:
+            self.stdout.write(f'Consultation {later} overlaps consultation {earlier}')
+        self.stdout.write(f'{len(overlaps)} overlapping consultations; reschedule or cancel them')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from leads.dedup import backfill_phone_e164, merge_duplicate_leads
+from leads.models import Lead
+
+
+class Command(BaseCommand):
+    help = 'Merge leads of the same lawyer sharing a phone number, moving their notes, consultations and chats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lawyer', type=int, help='Only merge leads of this lawyer id')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the duplicates')
+
+    def handle(self, *args, **options):
+        groups, removed = merge_duplicate_leads(Lead, lawyer_id=options['lawyer'], dry_run=options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(f'{groups} phone numbers have duplicate leads; {removed} leads would be merged')
+            return
+
+        backfilled = backfill_phone_e164(Lead)
+        self.stdout.write(self.style.SUCCESS(
+            f'Merged {removed} duplicate leads into {groups}; filled phone_e164 on {backfilled} leads'
+        ))
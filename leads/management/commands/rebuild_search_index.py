@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from leads import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index over leads and their notes'
+
+    def handle(self, *args, **options):
+        search.install()
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Rebuilt the lead search index'))
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from leads.reminders import due_consultations, send_due_reminders
+
+
+class Command(BaseCommand):
+    help = 'Email clients a reminder before their consultation, in batches over one SMTP connection each'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=settings.CONSULTATION_REMINDER_HOURS,
+            help='Remind about consultations starting within this many hours',
+        )
+        parser.add_argument('--batch-size', type=int, default=100, help='Reminders sent per transaction')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many reminders are due')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            due = due_consultations(hours=options['hours']).count()
+            self.stdout.write(f'{due} consultation reminders due within {options["hours"]} hours')
+            return
+
+        totals = send_due_reminders(
+            hours=options['hours'], batch_size=options['batch_size'], max_batches=options['max_batches'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Sent {totals["sent"]} reminders, {totals["failed"]} failed'))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from leads.outbox import send_outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbox emails with bounded concurrency, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Messages leased per batch')
+        parser.add_argument('--concurrency', type=int, help='Parallel SMTP connections (default OUTBOX_CONCURRENCY)')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches')
+        parser.add_argument(
+            '--loop', type=float, metavar='SECONDS',
+            help='Keep running, polling for new messages every SECONDS once the outbox is drained',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            totals = send_outbox(
+                batch_size=options['batch_size'],
+                concurrency=options['concurrency'],
+                max_batches=options['max_batches'],
+            )
+            if totals['sent'] or totals['failed'] or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Sent {totals["sent"]} outbox messages, {totals["failed"]} failed'
+                ))
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-19 06:02
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_local_time_buckets(apps, schema_editor):
+    """Fill local hour/weekday buckets for existing rows in bounded batches"""
+    Lead = apps.get_model('leads', 'Lead')
+    batch = []
+    for obj in Lead.objects.filter(local_hour__isnull=True).only('id', 'created_at').iterator(chunk_size=1000):
+        local = timezone.localtime(obj.created_at)
+        obj.local_hour, obj.local_weekday = local.hour, local.weekday()
+        batch.append(obj)
+        if len(batch) >= 1000:
+            Lead.objects.bulk_update(batch, ['local_hour', 'local_weekday'])
+            batch = []
+    if batch:
+        Lead.objects.bulk_update(batch, ['local_hour', 'local_weekday'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lawyers', '0002_remove_lawfirm_email_remove_lawfirm_phone_and_more'),
+        ('leads', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='local_hour',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='Local Hour'),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='local_weekday',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='Local Weekday'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['lawyer', 'local_hour'], name='lead_lawyer_hour_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['lawyer', 'local_weekday', 'local_hour'], name='lead_lawyer_wday_idx'),
+        ),
+        migrations.RunPython(backfill_local_time_buckets, migrations.RunPython.noop),
+    ]
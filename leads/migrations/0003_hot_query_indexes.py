@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-19 06:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lawyers', '0002_remove_lawfirm_email_remove_lawfirm_phone_and_more'),
+        ('leads', '0002_local_time_buckets'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['lawyer', 'scheduled_time', 'status'], name='consult_lawyer_sched_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['lawyer', 'status'], name='consult_lawyer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(condition=models.Q(('status__in', ['scheduled', 'confirmed'])), fields=['lawyer', 'scheduled_time'], name='consult_upcoming_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['lawyer', '-created_at'], name='lead_lawyer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['lawyer', 'source'], name='lead_lawyer_source_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['lawyer', 'status'], name='lead_lawyer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leadnote',
+            index=models.Index(fields=['lead', '-created_at'], name='lead_note_lead_created_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2 on 2026-10-19 06:17
+
+import re
+
+from django.conf import settings
+from django.db import migrations
+
+
+# Frozen copy of chatbot.extraction's normalizers as of this migration;
+# the live ones may change later without changing what this step did
+
+KYRGYZSTAN_CODE = '996'
+
+_NON_DIGIT_RE = re.compile(r'\D')
+
+
+def normalize_phone(value):
+    """E.164 for a phone number, assuming Kyrgyzstan for local formats; None when it cannot be one"""
+    if not value:
+        return None
+    value = value.strip()
+    digits = _NON_DIGIT_RE.sub('', value)
+
+    if value.startswith('+') or value.startswith('00'):
+        digits = digits[2:] if value.startswith('00') else digits
+        if digits.startswith(KYRGYZSTAN_CODE) and len(digits) != 12:
+            return None
+        return f'+{digits}' if 8 <= len(digits) <= 15 else None
+    if digits.startswith(KYRGYZSTAN_CODE) and len(digits) == 12:
+        return f'+{digits}'
+    if digits.startswith('0') and len(digits) == 10:
+        return f'+{KYRGYZSTAN_CODE}{digits[1:]}'
+    if len(digits) == 9 and not digits.startswith('0'):
+        return f'+{KYRGYZSTAN_CODE}{digits}'
+    return None
+
+
+def normalize_email(value):
+    return value.strip().lower() if value else ''
+
+
+def normalize_lead_contacts(apps, schema_editor):
+    """Rewrite existing phones to E.164 and emails to lower case in bounded batches"""
+    Lead = apps.get_model('leads', 'Lead')
+    batch = []
+    for obj in Lead.objects.only('id', 'phone', 'email').iterator(chunk_size=1000):
+        phone = normalize_phone(obj.phone) or obj.phone
+        email = normalize_email(obj.email)
+        if (phone, email) == (obj.phone, obj.email):
+            continue
+        obj.phone, obj.email = phone, email
+        batch.append(obj)
+        if len(batch) >= 1000:
+            Lead.objects.bulk_update(batch, ['phone', 'email'])
+            batch = []
+    if batch:
+        Lead.objects.bulk_update(batch, ['phone', 'email'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lawyers', '0002_remove_lawfirm_email_remove_lawfirm_phone_and_more'),
+        ('leads', '0003_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_lead_contacts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 5.2 on 2026-10-19 06:22
+
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Frozen copy of the phone normalizer and leads.dedup merge as of this
+# migration; the live modules may change later without changing what this step did
+
+KYRGYZSTAN_CODE = '996'
+
+_NON_DIGIT_RE = re.compile(r'\D')
+
+FILL_FIELDS = [
+    'email', 'legal_category', 'ip_address', 'user_agent', 'referrer_url',
+    'utm_source', 'utm_medium', 'utm_campaign', 'assigned_to_id', 'estimated_budget',
+]
+
+
+def normalize_phone(value):
+    """E.164 for a phone number, assuming Kyrgyzstan for local formats; None when it cannot be one"""
+    if not value:
+        return None
+    value = value.strip()
+    digits = _NON_DIGIT_RE.sub('', value)
+
+    if value.startswith('+') or value.startswith('00'):
+        digits = digits[2:] if value.startswith('00') else digits
+        if digits.startswith(KYRGYZSTAN_CODE) and len(digits) != 12:
+            return None
+        return f'+{digits}' if 8 <= len(digits) <= 15 else None
+    if digits.startswith(KYRGYZSTAN_CODE) and len(digits) == 12:
+        return f'+{digits}'
+    if digits.startswith('0') and len(digits) == 10:
+        return f'+{KYRGYZSTAN_CODE}{digits[1:]}'
+    if len(digits) == 9 and not digits.startswith('0'):
+        return f'+{KYRGYZSTAN_CODE}{digits}'
+    return None
+
+
+def merge_leads(Lead, keeper, duplicates):
+    """Re-point related rows to `keeper`, carry over blank fields and descriptions, delete the duplicates"""
+    duplicate_ids = [lead.pk for lead in duplicates]
+    for relation in Lead._meta.related_objects:
+        if relation.one_to_many:
+            relation.related_model._base_manager.filter(
+                **{f'{relation.field.name}__in': duplicate_ids}
+            ).update(**{relation.field.name: keeper.pk})
+
+    descriptions = [keeper.case_description]
+    for lead in duplicates:
+        for field in FILL_FIELDS:
+            if getattr(keeper, field) in ('', None) and getattr(lead, field) not in ('', None):
+                setattr(keeper, field, getattr(lead, field))
+        if lead.case_description and lead.case_description not in descriptions:
+            descriptions.append(lead.case_description)
+        if keeper.status == 'new' and lead.status != 'new':
+            keeper.status = lead.status
+        if lead.contacted_at and (not keeper.contacted_at or lead.contacted_at < keeper.contacted_at):
+            keeper.contacted_at = lead.contacted_at
+    keeper.case_description = '\n\n'.join(description for description in descriptions if description)
+
+    Lead._base_manager.filter(pk__in=duplicate_ids).delete()
+    keeper.save(update_fields=FILL_FIELDS + ['case_description', 'status', 'contacted_at'])
+
+
+def merge_and_backfill(apps, schema_editor):
+    """Merge leads sharing a normalized phone, then fill phone_e164 so the unique constraint holds"""
+    Lead = apps.get_model('leads', 'Lead')
+
+    groups = defaultdict(list)
+    leads = Lead._base_manager.exclude(phone='').order_by('created_at', 'pk')
+    for pk, lawyer, phone in leads.values_list('pk', 'lawyer_id', 'phone').iterator(chunk_size=2000):
+        phone_e164 = normalize_phone(phone)
+        if phone_e164:
+            groups[(lawyer, phone_e164)].append(pk)
+    for ids in groups.values():
+        if len(ids) > 1:
+            by_pk = {lead.pk: lead for lead in Lead._base_manager.filter(pk__in=ids)}
+            merge_leads(Lead, by_pk[ids[0]], [by_pk[pk] for pk in ids[1:]])
+
+    batch = []
+    for lead in Lead._base_manager.exclude(phone='').only('id', 'phone').iterator(chunk_size=1000):
+        lead.phone_e164 = normalize_phone(lead.phone)
+        if lead.phone_e164:
+            batch.append(lead)
+        if len(batch) >= 1000:
+            Lead._base_manager.bulk_update(batch, ['phone_e164'])
+            batch = []
+    if batch:
+        Lead._base_manager.bulk_update(batch, ['phone_e164'])
+
+    # The deletes leave deferred foreign-key checks queued; PostgreSQL refuses
+    # to ALTER leads_lead with pending trigger events, so fire them now
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        schema_editor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lawyers', '0002_remove_lawfirm_email_remove_lawfirm_phone_and_more'),
+        ('chatbot', '0010_session_lead_and_idle_index'),
+        ('leads', '0004_lead_phone_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='phone_e164',
+            field=models.CharField(blank=True, editable=False, max_length=16, null=True, verbose_name='Phone (E.164)'),
+        ),
+        migrations.RunPython(merge_and_backfill, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='lead',
+            constraint=models.UniqueConstraint(fields=('lawyer', 'phone_e164'), name='lead_lawyer_phone_e164_uniq'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+from django.db import migrations
+
+
+# Frozen copy of the search table DDL and backfill as of this migration;
+# leads.search may change later without changing what this step did
+
+POSTGRES_INSTALL = [
+    """
+    CREATE TABLE IF NOT EXISTS leads_lead_search (
+        lead_id bigint PRIMARY KEY,
+        lawyer_id bigint NOT NULL,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS leads_lead_search_document_gin ON leads_lead_search USING GIN (document)",
+    "CREATE INDEX IF NOT EXISTS leads_lead_search_lawyer_idx ON leads_lead_search (lawyer_id)",
+    """
+    INSERT INTO leads_lead_search (lead_id, lawyer_id, document)
+    SELECT l.id, l.lawyer_id,
+        setweight(to_tsvector('russian', l.name), 'A')
+        || setweight(to_tsvector('simple', l.email || ' ' || l.phone), 'A')
+        || setweight(to_tsvector('russian', l.legal_category || ' ' || l.case_description), 'B')
+        || setweight(to_tsvector('russian', coalesce(
+            (SELECT string_agg(n.title || ' ' || n.content, ' ') FROM leads_leadnote n WHERE n.lead_id = l.id), ''
+        )), 'C')
+    FROM leads_lead l
+    ON CONFLICT (lead_id) DO NOTHING
+    """,
+]
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS leads_lead_fts USING fts5(
+        name, contacts, description, notes, lawyer_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT OR REPLACE INTO leads_lead_fts (rowid, name, contacts, description, notes, lawyer_id)
+    SELECT l.id, l.name, l.email || ' ' || l.phone, l.legal_category || ' ' || l.case_description,
+        coalesce((SELECT group_concat(n.title || ' ' || n.content, ' ') FROM leads_leadnote n WHERE n.lead_id = l.id), ''),
+        l.lawyer_id
+    FROM leads_lead l
+    """,
+]
+
+UNINSTALL = {
+    'postgresql': ["DROP TABLE IF EXISTS leads_lead_search"],
+    'sqlite': ["DROP TABLE IF EXISTS leads_lead_fts"],
+}
+
+
+def create_search_index(apps, schema_editor):
+    """Create the backend's full-text table and index every existing lead; other backends have none"""
+    vendor = schema_editor.connection.vendor
+    for statement in {'postgresql': POSTGRES_INSTALL, 'sqlite': SQLITE_INSTALL}.get(vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    for statement in UNINSTALL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0005_lead_phone_e164'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,91 @@
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+# Frozen copy of the exclusion constraint as of this migration
+POSTGRES_INSTALL = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    """
+    ALTER TABLE leads_consultation ADD CONSTRAINT consult_no_overlap
+    EXCLUDE USING gist (lawyer_id WITH =, tstzrange(scheduled_time, ends_at) WITH &&)
+    WHERE (status IN ('scheduled', 'confirmed'))
+    """,
+]
+POSTGRES_UNINSTALL = ["ALTER TABLE leads_consultation DROP CONSTRAINT IF EXISTS consult_no_overlap"]
+
+
+def backfill_ends_at(apps, schema_editor):
+    Consultation = apps.get_model('leads', 'Consultation')
+    batch = []
+    for consultation in Consultation.objects.filter(ends_at__isnull=True).only(
+        'id', 'scheduled_time', 'duration_minutes'
+    ).iterator(chunk_size=1000):
+        consultation.ends_at = consultation.scheduled_time + timedelta(minutes=consultation.duration_minutes)
+        batch.append(consultation)
+        if len(batch) >= 1000:
+            Consultation.objects.bulk_update(batch, ['ends_at'])
+            batch = []
+    if batch:
+        Consultation.objects.bulk_update(batch, ['ends_at'])
+
+
+def _overlaps(Consultation):
+    """(earlier_pk, overlapping_pk) pairs of active consultations of the same lawyer"""
+    overlaps = []
+    current_lawyer, kept_pk, kept_until = None, None, None
+    active = Consultation.objects.filter(status__in=['scheduled', 'confirmed'])
+    for lawyer, pk, start, end in active.order_by('lawyer_id', 'scheduled_time', 'created_at').values_list(
+        'lawyer_id', 'pk', 'scheduled_time', 'ends_at'
+    ):
+        if lawyer == current_lawyer and start < kept_until:
+            overlaps.append((kept_pk, pk))
+        else:
+            current_lawyer, kept_pk, kept_until = lawyer, pk, end
+    return overlaps
+
+
+def add_no_overlap_constraint(apps, schema_editor):
+    """
+    Add the exclusion constraint (PostgreSQL only). Existing double bookings
+    are left for a person to resolve: the migration stops and lists them.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    overlaps = _overlaps(apps.get_model('leads', 'Consultation'))
+    if overlaps:
+        pairs = ', '.join(f'{earlier} and {later}' for earlier, later in overlaps)
+        raise RuntimeError(
+            f'Overlapping active consultations: {pairs}. Reschedule or cancel one of each pair '
+            '(manage.py find_overlapping_consultations lists them) and migrate again.'
+        )
+    for statement in POSTGRES_INSTALL:
+        schema_editor.execute(statement)
+
+
+def drop_no_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_UNINSTALL:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0006_lead_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consultation',
+            name='ends_at',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Ends At'),
+        ),
+        migrations.RunPython(backfill_ends_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='consultation',
+            name='ends_at',
+            field=models.DateTimeField(editable=False, verbose_name='Ends At'),
+        ),
+        migrations.RunPython(add_no_overlap_constraint, drop_no_overlap_constraint),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lawyers', '0002_remove_lawfirm_email_remove_lawfirm_phone_and_more'),
+        ('leads', '0007_consultation_ends_at_no_overlap'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['status', 'scheduled_time', 'reminder_sent'], name='consult_reminder_due_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 07:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0009_outbox_message'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consultation',
+            name='reminder_claimed_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Reminder Claimed Until'),
+        ),
+    ]
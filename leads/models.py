@@ -1,6 +1,40 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+
+class LeadManager(models.Manager):
+    def upsert_by_phone(self, lawyer, phone, defaults=None):
+        """
+        Return (lead, created) for the lawyer's lead with this phone number in
+        any format. Race-safe: the (lawyer, phone_e164) unique constraint makes
+        a concurrent insert fail, and get_or_create then fetches the winner.
+        An existing lead gets its blank fields filled in from `defaults`.
+        """
+        # Import here to avoid circular imports
+        from chatbot.extraction import normalize_phone
+        
+        defaults = dict(defaults or {})
+        phone_e164 = normalize_phone(phone)
+        if not phone_e164:
+            return self.create(lawyer=lawyer, phone=phone, **defaults), True
+        
+        lead, created = self.get_or_create(
+            lawyer=lawyer, phone_e164=phone_e164, defaults={'phone': phone_e164, **defaults}
+        )
+        if not created:
+            filled = [field for field, value in defaults.items() if value and not getattr(lead, field)]
+            for field in filled:
+                setattr(lead, field, defaults[field])
+            if filled:
+                lead.save(update_fields=filled + ['updated_at'])
+        return lead, created
 
 
 class Lead(models.Model):
@@ -38,6 +72,7 @@ class Lead(models.Model):
     name = models.CharField(_('Full Name'), max_length=200)
     email = models.EmailField(_('Email'), blank=True)
     phone = models.CharField(_('Phone'), max_length=20, blank=True)
+    phone_e164 = models.CharField(_('Phone (E.164)'), max_length=16, blank=True, null=True, editable=False)
     
     # Lead Details
     legal_category = models.CharField(_('Legal Category'), max_length=100, blank=True)
@@ -67,14 +102,57 @@ class Lead(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     contacted_at = models.DateTimeField(_('First Contact Date'), blank=True, null=True)
     
+    # Local-time buckets of created_at for peak-hour analysis
+    local_hour = models.PositiveSmallIntegerField(_('Local Hour'), blank=True, null=True, editable=False)
+    local_weekday = models.PositiveSmallIntegerField(_('Local Weekday'), blank=True, null=True, editable=False)
+    
+    objects = LeadManager()
+    
     class Meta:
         verbose_name = _('Lead')
         verbose_name_plural = _('Leads')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['lawyer', '-created_at'], name='lead_lawyer_created_idx'),
+            models.Index(fields=['lawyer', 'source'], name='lead_lawyer_source_idx'),
+            models.Index(fields=['lawyer', 'status'], name='lead_lawyer_status_idx'),
+            models.Index(fields=['lawyer', 'local_hour'], name='lead_lawyer_hour_idx'),
+            models.Index(fields=['lawyer', 'local_weekday', 'local_hour'], name='lead_lawyer_wday_idx'),
+        ]
+        constraints = [
+            # One lead per phone number and lawyer; leads without a phone are NULL and never collide
+            models.UniqueConstraint(fields=['lawyer', 'phone_e164'], name='lead_lawyer_phone_e164_uniq'),
+        ]
     
     def __str__(self):
         return f"{self.name} - {self.legal_category or 'General Inquiry'}"
     
+    def clean(self):
+        super().clean()
+        # Import here to avoid circular imports
+        from chatbot.extraction import normalize_phone
+        
+        phone_e164 = normalize_phone(self.phone)
+        if phone_e164 and self.lawyer_id:
+            duplicates = Lead.objects.filter(lawyer_id=self.lawyer_id, phone_e164=phone_e164).exclude(pk=self.pk)
+            if duplicates.exists():
+                raise ValidationError({'phone': _('A lead with this phone number already exists.')})
+    
+    def save(self, *args, **kwargs):
+        # Import here to avoid circular imports
+        from chatbot.analytics import local_time_buckets
+        from chatbot.extraction import normalize_email, normalize_phone
+        
+        if self.local_hour is None:
+            self.local_hour, self.local_weekday = local_time_buckets(self.created_at)
+        # Normalized contacts let lookups and dedup use exact indexed matches
+        self.phone_e164 = normalize_phone(self.phone)
+        self.phone = self.phone_e164 or self.phone
+        self.email = normalize_email(self.email)
+        if kwargs.get('update_fields') is not None and 'phone' in kwargs['update_fields']:
+            kwargs['update_fields'] = list(kwargs['update_fields']) + ['phone_e164']
+        super().save(*args, **kwargs)
+    
     @property
     def contact_info(self):
         """Get primary contact information"""
@@ -122,6 +200,8 @@ class Consultation(models.Model):
     # Appointment Details
     scheduled_time = models.DateTimeField(_('Scheduled Time'))
     duration_minutes = models.PositiveIntegerField(_('Duration (minutes)'), choices=DURATION_CHOICES, default=30)
+    # scheduled_time + duration, stored so the no-overlap constraint can index the range
+    ends_at = models.DateTimeField(_('Ends At'), editable=False)
     consultation_type = models.CharField(_('Type'), max_length=20, choices=TYPE_CHOICES, default='free')
     
     # Status and Management
@@ -157,6 +237,8 @@ class Consultation(models.Model):
     # Communication
     confirmation_sent = models.BooleanField(_('Confirmation Sent'), default=False)
     reminder_sent = models.BooleanField(_('Reminder Sent'), default=False)
+    # Lease of a reminder sender on this row (leads.reminders); expires if the sender dies
+    reminder_claimed_until = models.DateTimeField(_('Reminder Claimed Until'), null=True, blank=True, editable=False)
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -167,10 +249,39 @@ class Consultation(models.Model):
         verbose_name = _('Consultation')
         verbose_name_plural = _('Consultations')
         ordering = ['scheduled_time']
+        indexes = [
+            models.Index(fields=['lawyer', 'scheduled_time', 'status'], name='consult_lawyer_sched_idx'),
+            models.Index(fields=['lawyer', 'status'], name='consult_lawyer_status_idx'),
+            models.Index(
+                fields=['lawyer', 'scheduled_time'],
+                name='consult_upcoming_idx',
+                condition=models.Q(status__in=['scheduled', 'confirmed']),
+            ),
+            # Due-reminder scan (leads.reminders)
+            models.Index(fields=['status', 'scheduled_time', 'reminder_sent'], name='consult_reminder_due_idx'),
+        ]
     
     def __str__(self):
         return f"{self.lead.name} - {self.scheduled_time.strftime('%Y-%m-%d %H:%M')}"
     
+    def clean(self):
+        super().clean()
+        # Import here to avoid circular imports
+        from .availability import ACTIVE_STATUSES
+        from .booking import OVERLAP_MESSAGE, overlapping
+        
+        if self.status not in ACTIVE_STATUSES or not (self.lawyer_id and self.scheduled_time and self.duration_minutes):
+            return
+        if overlapping(Consultation, self.lawyer_id, self.scheduled_time, self.end_time).exclude(pk=self.pk).exists():
+            raise ValidationError({'scheduled_time': OVERLAP_MESSAGE})
+    
+    def save(self, *args, **kwargs):
+        self.ends_at = self.end_time
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'scheduled_time', 'duration_minutes'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'ends_at'}
+        super().save(*args, **kwargs)
+    
     @property
     def end_time(self):
         """Calculate consultation end time"""
@@ -217,11 +328,29 @@ class LeadNote(models.Model):
         verbose_name = _('Lead Note')
         verbose_name_plural = _('Lead Notes')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['lead', '-created_at'], name='lead_note_lead_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.lead.name} - {self.note_type}: {self.content[:50]}..."
 
 
+class LeadSourceQuerySet(models.QuerySet):
+    def with_stats(self):
+        """
+        Annotate leads_total and leads_converted: one correlated COUNT each over
+        the (lawyer, source) index, instead of two queries per row.
+        """
+        leads = Lead.objects.filter(lawyer=OuterRef('lawyer'), source=OuterRef('name')).order_by().values('lawyer')
+        return self.annotate(
+            leads_total=Coalesce(Subquery(leads.annotate(count=Count('pk')).values('count')), 0),
+            leads_converted=Coalesce(
+                Subquery(leads.annotate(count=Count('pk', filter=Q(status='converted'))).values('count')), 0
+            ),
+        )
+
+
 class LeadSource(models.Model):
     """Track and manage lead sources for analytics"""
     lawyer = models.ForeignKey('lawyers.Lawyer', on_delete=models.CASCADE, related_name='lead_sources')
@@ -235,6 +364,8 @@ class LeadSource(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = LeadSourceQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _('Lead Source')
         verbose_name_plural = _('Lead Sources')
@@ -244,22 +375,22 @@ class LeadSource(models.Model):
         return f"{self.lawyer.full_name} - {self.name}"
     
     def get_leads_count(self):
-        """Get total leads from this source"""
-        return Lead.objects.filter(lawyer=self.lawyer, source=self.name).count()
+        """Get total leads from this source (annotated by with_stats(), or counted)"""
+        if hasattr(self, 'leads_total'):
+            return self.leads_total
+        return Lead.objects.filter(lawyer=self.lawyer_id, source=self.name).count()
+    
+    def get_converted_count(self):
+        if hasattr(self, 'leads_converted'):
+            return self.leads_converted
+        return Lead.objects.filter(lawyer=self.lawyer_id, source=self.name, status='converted').count()
     
     def get_conversion_rate(self):
         """Calculate conversion rate for this source"""
         total_leads = self.get_leads_count()
         if total_leads == 0:
             return 0
-        
-        converted_leads = Lead.objects.filter(
-            lawyer=self.lawyer, 
-            source=self.name, 
-            status='converted'
-        ).count()
-        
-        return (converted_leads / total_leads) * 100
+        return (self.get_converted_count() / total_leads) * 100
 
 
 class LeadAnalytics(models.Model):
@@ -296,3 +427,94 @@ class LeadAnalytics(models.Model):
     
     def __str__(self):
         return f"{self.lawyer.full_name} - {self.date}"
+
+
+class OutboxMessage(models.Model):
+    """
+    Email queued in the same transaction as the change that triggers it and
+    delivered later by the send_outbox command (see leads.outbox)
+    """
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('sent', _('Sent')),
+        ('failed', _('Failed')),
+    ]
+    
+    kind = models.CharField(_('Kind'), max_length=50)
+    recipients = models.JSONField(_('Recipients'), default=list)
+    reply_to = models.JSONField(_('Reply To'), default=list, blank=True)
+    subject = models.CharField(_('Subject'), max_length=255)
+    body = models.TextField(_('Body'))
+    # The consultation a confirmation is about; delivery sets its confirmation_sent
+    consultation = models.ForeignKey(
+        Consultation, on_delete=models.SET_NULL, null=True, blank=True, related_name='outbox_messages'
+    )
+    
+    status = models.CharField(_('Status'), max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(_('Attempts'), default=0)
+    # Next time a sender may pick the message up: after its lease or retry backoff expires
+    available_at = models.DateTimeField(_('Available At'), default=timezone.now)
+    last_error = models.TextField(_('Last Error'), blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(_('Sent At'), blank=True, null=True)
+    
+    class Meta:
+        verbose_name = _('Outbox Message')
+        verbose_name_plural = _('Outbox Messages')
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='outbox_status_available_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} to {', '.join(self.recipients)} ({self.status})"
+
+
+@receiver(post_save, sender=Lead)
+def index_lead_for_search(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Keep the lead's full-text document current; saves touching only other fields are skipped"""
+    # Import here to avoid circular imports
+    from .search import SEARCH_FIELDS, index_leads
+    
+    if raw or (update_fields is not None and not SEARCH_FIELDS & set(update_fields)):
+        return
+    index_leads([instance.pk])
+
+
+@receiver(post_delete, sender=Lead)
+def remove_lead_from_search(sender, instance, **kwargs):
+    from .search import remove_leads
+    
+    remove_leads([instance.pk])
+
+
+@receiver(post_save, sender=LeadNote)
+@receiver(post_delete, sender=LeadNote)
+def index_note_for_search(sender, instance, raw=False, **kwargs):
+    """Notes are part of their lead's document"""
+    from .search import index_leads
+    
+    if not raw:
+        index_leads([instance.lead_id])
+
+
+@receiver(post_save, sender=Consultation)
+@receiver(post_delete, sender=Consultation)
+@receiver(post_save, sender='chatbot.ChatConfiguration')
+def invalidate_availability(sender, instance, raw=False, **kwargs):
+    """Bookings and office-hours edits retire the lawyer's cached availability once committed"""
+    from .availability import invalidate
+    
+    if not raw:
+        transaction.on_commit(lambda: invalidate(instance.lawyer_id))
+
+
+@receiver(post_save, sender=Consultation)
+@receiver(post_delete, sender=Consultation)
+@receiver(post_save, sender=Lead)
+def invalidate_calendar_feed(sender, instance, raw=False, **kwargs):
+    """Consultations, and the lead names and contacts shown on them, are part of the feed"""
+    from .calendar import invalidate
+    
+    if not raw:
+        transaction.on_commit(lambda: invalidate(instance.lawyer_id))
@@ -0,0 +1,94 @@
+# Emails about leads and consultations. Each function queues its messages in
+# the outbox, so call it inside the transaction that creates the lead or
+# consultation.
+
+from .availability import office_schedule
+from .outbox import enqueue_email
+
+
+NEW_LEAD_SUBJECT = 'Новая заявка: {name}'
+
+NEW_LEAD_BODY = """Новая заявка от клиента.
+
+Имя: {name}
+Телефон: {phone}
+Email: {email}
+Категория: {category}
+Источник: {source}
+
+{description}
+"""
+
+BOOKED_CLIENT_SUBJECT = 'Консультация назначена на {date} в {time}'
+
+BOOKED_CLIENT_BODY = """Здравствуйте, {name}!
+
+Ваша консультация с юристом {lawyer} назначена.
+
+Дата: {date}
+Время: {time}
+Формат: {method}
+
+Юрист свяжется с вами для подтверждения.
+"""
+
+BOOKED_LAWYER_SUBJECT = 'Новая консультация: {name}, {date} в {time}'
+
+BOOKED_LAWYER_BODY = """Клиент записался на консультацию.
+
+Клиент: {name}
+Телефон: {phone}
+Email: {email}
+Дата: {date}
+Время: {time}
+Формат: {method}
+{agenda}
+"""
+
+
+def _lawyer_name(lawyer):
+    return lawyer.user.get_full_name() or lawyer.user.username
+
+
+def notify_new_lead(lead, lawyer):
+    """Tell the lawyer about a new lead"""
+    context = {
+        'name': lead.name,
+        'phone': lead.phone or '—',
+        'email': lead.email or '—',
+        'category': lead.legal_category or '—',
+        'source': lead.get_source_display(),
+        'description': lead.case_description[:1000],
+    }
+    enqueue_email(
+        'new_lead', [lawyer.user.email], NEW_LEAD_SUBJECT.format(**context), NEW_LEAD_BODY.format(**context),
+        reply_to=[lead.email],
+    )
+
+
+def notify_consultation_booked(consultation, lawyer):
+    """Confirm the booking to the client and announce it to the lawyer"""
+    lead = consultation.lead
+    # The time as the lawyer's office keeps it
+    local = consultation.scheduled_time.astimezone(office_schedule(lawyer).zone)
+    context = {
+        'name': lead.name,
+        'phone': lead.phone or '—',
+        'email': lead.email or '—',
+        'lawyer': _lawyer_name(lawyer),
+        'date': local.strftime('%d.%m.%Y'),
+        'time': local.strftime('%H:%M'),
+        'method': consultation.get_meeting_method_display(),
+        'agenda': consultation.agenda,
+    }
+    # Delivery, not queueing, sets the consultation's confirmation_sent (see leads.outbox)
+    enqueue_email(
+        'consultation_confirmation', [lead.email],
+        BOOKED_CLIENT_SUBJECT.format(**context), BOOKED_CLIENT_BODY.format(**context),
+        reply_to=[lawyer.user.email], consultation=consultation,
+    )
+    enqueue_email(
+        'consultation_booked', [lawyer.user.email],
+        BOOKED_LAWYER_SUBJECT.format(**context), BOOKED_LAWYER_BODY.format(**context),
+        reply_to=[lead.email],
+    )
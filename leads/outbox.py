@@ -0,0 +1,143 @@
+# Transactional outbox for email. Requests only insert an OutboxMessage row in
+# the transaction that makes the triggering change, so a message exists iff
+# the change committed and no request waits on SMTP. The send_outbox command
+# claims due messages by leasing them (pushing available_at forward) in a
+# short transaction, sends them from a bounded thread pool, and records each
+# outcome. A sender that dies mid-batch simply lets its leases expire, and
+# failed sends are retried with exponential backoff up to a maximum number of
+# attempts.
+
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Consultation, OutboxMessage
+
+
+# How long a claimed message is reserved for the sender that claimed it
+LEASE_SECONDS = 300
+
+BACKOFF_BASE_SECONDS = 60
+BACKOFF_MAX_SECONDS = 6 * 60 * 60
+
+
+# Kinds whose delivery marks their consultation's confirmation as sent
+CONFIRMATION_KINDS = {'consultation_confirmation'}
+
+
+def enqueue_email(kind, recipients, subject, body, reply_to=None, consultation=None):
+    """
+    Queue an email; call inside the transaction that makes the change it
+    announces. Returns the OutboxMessage, or None without recipients.
+    """
+    recipients = [address for address in recipients if address]
+    if not recipients:
+        return None
+    return OutboxMessage.objects.create(
+        kind=kind, recipients=recipients, subject=subject, body=body,
+        reply_to=[address for address in reply_to or [] if address], consultation=consultation,
+    )
+
+
+def backoff(attempts):
+    """Delay before retry number `attempts`: exponential, capped, with jitter"""
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0), BACKOFF_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_batch(batch_size, now=None):
+    """Lease up to `batch_size` due messages to this sender; returns them"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = OutboxMessage.objects.filter(status='pending', available_at__lte=now).order_by('available_at')
+        if connections[router.db_for_write(OutboxMessage)].features.has_select_for_update_skip_locked:
+            # Parallel senders lease disjoint batches instead of waiting on each other
+            due = due.select_for_update(skip_locked=True)
+        batch = list(due[:batch_size])
+        if batch:
+            OutboxMessage.objects.filter(pk__in=[message.pk for message in batch]).update(
+                available_at=now + timedelta(seconds=LEASE_SECONDS)
+            )
+    return batch
+
+
+def _deliver(messages):
+    """Send messages over one connection; returns {pk: error or None}. Runs in a worker thread."""
+    results = {}
+    connection = get_connection()
+    try:
+        connection.open()
+        for message in messages:
+            email = EmailMessage(
+                subject=message.subject, body=message.body, from_email=settings.DEFAULT_FROM_EMAIL,
+                to=message.recipients, reply_to=message.reply_to or None, connection=connection,
+            )
+            try:
+                results[message.pk] = None if email.send() else 'Not delivered'
+            except Exception as e:
+                results[message.pk] = f'{type(e).__name__}: {e}'
+    except Exception as e:
+        # Could not connect: every message not attempted yet failed the same way
+        for message in messages:
+            results.setdefault(message.pk, f'{type(e).__name__}: {e}')
+    finally:
+        connection.close()
+    return results
+
+
+def _record(batch, results, now):
+    """Mark delivered messages sent in one UPDATE; reschedule or fail the rest"""
+    sent = [pk for pk, error in results.items() if error is None]
+    if sent:
+        OutboxMessage.objects.filter(pk__in=sent).update(
+            status='sent', sent_at=now, attempts=F('attempts') + 1, last_error=''
+        )
+        confirmed = {
+            message.consultation_id for message in batch
+            if message.pk in sent and message.kind in CONFIRMATION_KINDS and message.consultation_id
+        }
+        if confirmed:
+            Consultation.objects.filter(pk__in=confirmed).update(confirmation_sent=True)
+    for message in batch:
+        error = results.get(message.pk)
+        if error is None:
+            continue
+        attempts = message.attempts + 1
+        give_up = attempts >= settings.OUTBOX_MAX_ATTEMPTS
+        OutboxMessage.objects.filter(pk=message.pk).update(
+            attempts=attempts,
+            status='failed' if give_up else 'pending',
+            available_at=now if give_up else now + backoff(attempts),
+            last_error=error[:2000],
+        )
+    return len(sent)
+
+
+def send_outbox(batch_size=100, concurrency=None, max_batches=None):
+    """
+    Deliver due messages batch by batch, each batch split across at most
+    `concurrency` SMTP connections. Returns {'sent': n, 'failed': n}.
+    """
+    concurrency = concurrency or settings.OUTBOX_CONCURRENCY
+    totals = {'sent': 0, 'failed': 0}
+    batches = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while max_batches is None or batches < max_batches:
+            batch = claim_batch(batch_size)
+            if not batch:
+                break
+            chunks = [batch[index::concurrency] for index in range(concurrency) if batch[index::concurrency]]
+            results = {}
+            for chunk_results in pool.map(_deliver, chunks):
+                results.update(chunk_results)
+            sent = _record(batch, results, timezone.now())
+            totals['sent'] += sent
+            totals['failed'] += len(batch) - sent
+            batches += 1
+    return totals
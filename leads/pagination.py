@@ -0,0 +1,95 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward keyset pagination on (ordering field, id). The cursor carries the
+    last row's values and the next page is a range condition on the index,
+    so page 1000 costs the same as page 1 (unlike OFFSET). Both ordering
+    fields must sort in the same direction.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        field, tiebreak = (name.lstrip('-') for name in self.ordering)
+        lookup = 'lt' if self.ordering[0].startswith('-') else 'gt'
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            value, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'{tiebreak}__{lookup}': pk})
+            )
+
+        # One extra row tells whether another page follows
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = (getattr(rows[-1], field), getattr(rows[-1], tiebreak)) if self.has_next else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            value, pk = data['v'], int(data['id'])
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+        parsed = parse_datetime(value) if isinstance(value, str) else None
+        return (parsed or value), pk
+
+    def encode_cursor(self, position):
+        value, pk = position
+        value = value.isoformat() if hasattr(value, 'isoformat') else value
+        return base64.urlsafe_b64encode(json.dumps({'v': value, 'id': pk}).encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        params = self.request.query_params.copy()
+        params[self.cursor_query_param] = self.encode_cursor(self.next_position)
+        return f"{self.request.build_absolute_uri(self.request.path)}?{params.urlencode()}"
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class LeadPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class ConsultationPagination(KeysetPagination):
+    ordering = ('-scheduled_time', '-id')
@@ -0,0 +1,156 @@
+# Consultation reminders. Due consultations are claimed in batches by leasing
+# them (reminder_claimed_until) in a short transaction that uses SELECT ...
+# FOR UPDATE SKIP LOCKED where supported, so several nodes can run the sender
+# at once without picking the same rows and no locks are held while talking
+# to SMTP. Each batch is rendered from one joined query and sent over a single
+# SMTP connection; delivered rows are then flagged with one UPDATE and the
+# rest released. A sender that dies mid-batch lets its leases expire.
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .availability import ACTIVE_STATUSES, office_schedule
+
+
+logger = logging.getLogger('leads.reminders')
+
+# How long a claimed consultation is reserved for the sender that claimed it
+LEASE_SECONDS = 300
+
+REMINDER_SUBJECT = 'Напоминание о консультации {date} в {time}'
+
+REMINDER_BODY = """Здравствуйте, {name}!
+
+Напоминаем о консультации с юристом {lawyer}.
+
+Дата: {date}
+Время: {time}
+Формат: {method}
+{place}
+Если планы изменились, пожалуйста, сообщите нам заранее.
+"""
+
+
+def due_consultations(now=None, hours=None):
+    """Active, unclaimed consultations starting within `hours` that still need a reminder"""
+    # Import here to avoid circular imports
+    from .models import Consultation
+
+    now = now or timezone.now()
+    hours = settings.CONSULTATION_REMINDER_HOURS if hours is None else hours
+    return Consultation.objects.filter(
+        status__in=ACTIVE_STATUSES,
+        scheduled_time__gt=now,
+        scheduled_time__lte=now + timedelta(hours=hours),
+        reminder_sent=False,
+    ).filter(
+        Q(reminder_claimed_until__isnull=True) | Q(reminder_claimed_until__lte=now)
+    ).exclude(lead__email='')
+
+
+def render_reminder(consultation):
+    lead, lawyer = consultation.lead, consultation.lawyer
+    # The time as the lawyer's office keeps it
+    local = consultation.scheduled_time.astimezone(office_schedule(lawyer).zone)
+    place = consultation.location or consultation.meeting_link
+    context = {
+        'name': lead.name,
+        'lawyer': lawyer.user.get_full_name() or lawyer.user.username,
+        'date': local.strftime('%d.%m.%Y'),
+        'time': local.strftime('%H:%M'),
+        'method': consultation.get_meeting_method_display(),
+        'place': f'Место: {place}\n' if place else '',
+    }
+    return EmailMessage(
+        subject=REMINDER_SUBJECT.format(**context),
+        body=REMINDER_BODY.format(**context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[lead.email],
+        reply_to=[lawyer.user.email] if lawyer.user.email else None,
+    )
+
+
+def _claim_batch(now, hours, batch_size, skip):
+    """Lease one batch of due consultations, leaving out the `skip` ids; returns them"""
+    # Import here to avoid circular imports
+    from .models import Consultation
+
+    with transaction.atomic():
+        due = due_consultations(now, hours).exclude(pk__in=skip)
+        due = due.select_related('lead', 'lawyer__user', 'lawyer__chat_config').order_by('scheduled_time')
+        features = connections[router.db_for_write(Consultation)].features
+        if features.has_select_for_update_skip_locked:
+            # Parallel senders take disjoint batches instead of waiting on each other
+            of = ('self',) if features.has_select_for_update_of else ()
+            due = due.select_for_update(skip_locked=True, of=of)
+        batch = list(due[:batch_size])
+        if batch:
+            Consultation.objects.filter(pk__in=[consultation.pk for consultation in batch]).update(
+                reminder_claimed_until=(now or timezone.now()) + timedelta(seconds=LEASE_SECONDS)
+            )
+    return batch
+
+
+def _deliver(batch):
+    """Send a batch's reminders over one connection; returns (sent ids, failed ids)"""
+    sent = set()
+    connection = get_connection()
+    try:
+        connection.open()
+        for consultation in batch:
+            try:
+                if connection.send_messages([render_reminder(consultation)]):
+                    sent.add(consultation.pk)
+            except Exception:
+                logger.exception("Could not send the reminder for consultation %s", consultation.pk)
+    except Exception:
+        # Could not connect: the reminders not attempted yet fail with the batch
+        logger.exception("Could not open the SMTP connection for %s reminders", len(batch))
+    finally:
+        connection.close()
+    return sorted(sent), [consultation.pk for consultation in batch if consultation.pk not in sent]
+
+
+def _send_batch(now, hours, batch_size, skip):
+    """Claim, send and flag one batch, leaving out the `skip` ids; returns (sent ids, failed ids)"""
+    # Import here to avoid circular imports
+    from .models import Consultation
+
+    batch = _claim_batch(now, hours, batch_size, skip)
+    if not batch:
+        return [], []
+    # No transaction or row locks are held while SMTP is slow
+    sent, failed = _deliver(batch)
+    if sent:
+        Consultation.objects.filter(pk__in=sent).update(
+            reminder_sent=True, reminder_claimed_until=None, updated_at=timezone.now()
+        )
+    if failed:
+        # Undelivered rows are released for the next run
+        Consultation.objects.filter(pk__in=failed).update(reminder_claimed_until=None)
+    return sent, failed
+
+
+def send_due_reminders(now=None, hours=None, batch_size=100, max_batches=None):
+    """
+    Send reminders for every due consultation, batch by batch.
+    Returns {'sent': n, 'failed': n}.
+    """
+    totals = {'sent': 0, 'failed': 0}
+    failed = []
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        sent, batch_failed = _send_batch(now, hours, batch_size, failed)
+        if not sent and not batch_failed:
+            break
+        totals['sent'] += len(sent)
+        failed += batch_failed
+        batches += 1
+    totals['failed'] = len(failed)
+    return totals
@@ -0,0 +1,224 @@
+# Full-text search over leads and their notes. PostgreSQL keeps a weighted
+# tsvector per lead (Russian stemming, GIN index) in leads_lead_search; SQLite
+# keeps an FTS5 table, leads_lead_fts. Both side tables are maintained
+# incrementally from Lead/LeadNote signals and bulk paths, and rebuilt with
+# the rebuild_search_index command. Other backends fall back to icontains.
+
+import re
+from collections import namedtuple
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from chatbot.extraction import normalize_phone
+from .models import Lead
+
+
+SearchHit = namedtuple('SearchHit', ['lead', 'rank'])
+
+# Fields whose changes require re-indexing a lead
+SEARCH_FIELDS = {'name', 'email', 'phone', 'legal_category', 'case_description', 'lawyer'}
+
+# Ids per statement when (re)indexing, well under SQLite's parameter limit
+INDEX_BATCH_SIZE = 500
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+POSTGRES_INSTALL = [
+    """
+    CREATE TABLE IF NOT EXISTS leads_lead_search (
+        lead_id bigint PRIMARY KEY,
+        lawyer_id bigint NOT NULL,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS leads_lead_search_document_gin ON leads_lead_search USING GIN (document)",
+    "CREATE INDEX IF NOT EXISTS leads_lead_search_lawyer_idx ON leads_lead_search (lawyer_id)",
+]
+POSTGRES_UNINSTALL = ["DROP TABLE IF EXISTS leads_lead_search"]
+
+POSTGRES_INDEX = """
+    INSERT INTO leads_lead_search (lead_id, lawyer_id, document)
+    SELECT l.id, l.lawyer_id,
+        setweight(to_tsvector('russian', l.name), 'A')
+        || setweight(to_tsvector('simple', l.email || ' ' || l.phone), 'A')
+        || setweight(to_tsvector('russian', l.legal_category || ' ' || l.case_description), 'B')
+        || setweight(to_tsvector('russian', coalesce(
+            (SELECT string_agg(n.title || ' ' || n.content, ' ') FROM leads_leadnote n WHERE n.lead_id = l.id), ''
+        )), 'C')
+    FROM leads_lead l
+    {where}
+    ON CONFLICT (lead_id) DO UPDATE SET lawyer_id = EXCLUDED.lawyer_id, document = EXCLUDED.document
+"""
+
+POSTGRES_MATCH = """
+    SELECT s.lead_id, ts_rank_cd(s.document, q) AS rank
+    FROM leads_lead_search s, websearch_to_tsquery('russian', %s) q
+    WHERE s.document @@ q {lawyer}
+    ORDER BY rank DESC, s.lead_id DESC
+"""
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS leads_lead_fts USING fts5(
+        name, contacts, description, notes, lawyer_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+]
+SQLITE_UNINSTALL = ["DROP TABLE IF EXISTS leads_lead_fts"]
+
+SQLITE_INDEX = """
+    INSERT OR REPLACE INTO leads_lead_fts (rowid, name, contacts, description, notes, lawyer_id)
+    SELECT l.id, l.name, l.email || ' ' || l.phone, l.legal_category || ' ' || l.case_description,
+        coalesce((SELECT group_concat(n.title || ' ' || n.content, ' ') FROM leads_leadnote n WHERE n.lead_id = l.id), ''),
+        l.lawyer_id
+    FROM leads_lead l
+    {where}
+"""
+
+# bm25() is lower-is-better; names and contacts outweigh descriptions and notes
+SQLITE_MATCH = """
+    SELECT rowid AS lead_id, -bm25(leads_lead_fts, 10.0, 10.0, 4.0, 1.0) AS rank
+    FROM leads_lead_fts
+    WHERE leads_lead_fts MATCH %s {lawyer}
+    ORDER BY rank DESC, lead_id DESC
+"""
+
+
+def _connection():
+    return connections[router.db_for_write(Lead)]
+
+
+def _execute(statements, params=None):
+    with _connection().cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement, params)
+
+
+def install(schema_editor=None):
+    """Create the backend's search table; a no-op on backends without full-text support"""
+    vendor = (schema_editor.connection if schema_editor else _connection()).vendor
+    statements = {'postgresql': POSTGRES_INSTALL, 'sqlite': SQLITE_INSTALL}.get(vendor, [])
+    if schema_editor:
+        for statement in statements:
+            schema_editor.execute(statement)
+    else:
+        _execute(statements)
+
+
+def uninstall(schema_editor):
+    vendor = schema_editor.connection.vendor
+    for statement in {'postgresql': POSTGRES_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}.get(vendor, []):
+        schema_editor.execute(statement)
+
+
+# Incremental maintenance
+
+def _batches(ids):
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), INDEX_BATCH_SIZE):
+        yield ids[start:start + INDEX_BATCH_SIZE]
+
+
+def index_leads(lead_ids):
+    """(Re)index the given leads with one statement per batch"""
+    vendor = _connection().vendor
+    for batch in _batches(lead_ids):
+        if vendor == 'postgresql':
+            _execute([POSTGRES_INDEX.format(where='WHERE l.id = ANY(%s)')], [batch])
+        elif vendor == 'sqlite':
+            placeholders = ', '.join(['%s'] * len(batch))
+            _execute([SQLITE_INDEX.format(where=f'WHERE l.id IN ({placeholders})')], batch)
+
+
+def remove_leads(lead_ids):
+    vendor = _connection().vendor
+    for batch in _batches(lead_ids):
+        if vendor == 'postgresql':
+            _execute(['DELETE FROM leads_lead_search WHERE lead_id = ANY(%s)'], [batch])
+        elif vendor == 'sqlite':
+            placeholders = ', '.join(['%s'] * len(batch))
+            _execute([f'DELETE FROM leads_lead_fts WHERE rowid IN ({placeholders})'], batch)
+
+
+def rebuild_index():
+    """Re-index every lead from scratch"""
+    vendor = _connection().vendor
+    if vendor == 'postgresql':
+        _execute(['TRUNCATE leads_lead_search', POSTGRES_INDEX.format(where='')])
+    elif vendor == 'sqlite':
+        _execute(['DELETE FROM leads_lead_fts', SQLITE_INDEX.format(where='')])
+
+
+# Querying
+
+def fts5_query(text):
+    """FTS5 MATCH expression: every word must match, as a prefix, with FTS syntax neutralized"""
+    return ' '.join(f'"{token}"*' for token in _TOKEN_RE.findall(text))
+
+
+def _match_sql(text, lawyer_id=None):
+    """(sql, params) selecting (lead id, rank) of matching leads, best first; None when unsupported"""
+    vendor = _connection().vendor
+    if vendor == 'postgresql':
+        lawyer = 'AND s.lawyer_id = %s' if lawyer_id else ''
+        return POSTGRES_MATCH.format(lawyer=lawyer), [text] + ([lawyer_id] if lawyer_id else [])
+    if vendor == 'sqlite':
+        query = fts5_query(text)
+        if not query:
+            return None
+        lawyer = 'AND lawyer_id = %s' if lawyer_id else ''
+        return SQLITE_MATCH.format(lawyer=lawyer), [query] + ([lawyer_id] if lawyer_id else [])
+    return None
+
+
+def _fallback_filter(text):
+    return (
+        Q(name__icontains=text) | Q(email__icontains=text) | Q(phone__icontains=text)
+        | Q(case_description__icontains=text) | Q(notes__content__icontains=text)
+    )
+
+
+def filter_leads(queryset, text):
+    """Narrow a Lead queryset to full-text matches (unranked), e.g. for admin search"""
+    text = text.strip()
+    if not text:
+        return queryset
+    phone = normalize_phone(text)
+    if phone:
+        return queryset.filter(phone_e164=phone)
+    match = _match_sql(text)
+    if match is None:
+        return queryset.filter(_fallback_filter(text)).distinct()
+    sql, params = match
+    return queryset.filter(pk__in=RawSQL(f'SELECT lead_id FROM ({sql}) matches', params))
+
+
+def search_leads(lawyer, text, offset=0, limit=20):
+    """
+    Ranked page of a lawyer's leads matching `text`: a list of SearchHit.
+    Fetch limit + 1 to know whether another page follows. A query that is a
+    phone number matches leads by normalized phone through the unique index.
+    """
+    text = text.strip()
+    if not text:
+        return []
+    leads = Lead.objects.filter(lawyer=lawyer)
+    phone = normalize_phone(text)
+    if phone:
+        return [SearchHit(lead, 1.0) for lead in leads.filter(phone_e164=phone)]
+
+    match = _match_sql(text, lawyer.pk)
+    if match is None:
+        page = leads.filter(_fallback_filter(text)).distinct().order_by('-created_at')[offset:offset + limit]
+        return [SearchHit(lead, None) for lead in page]
+
+    sql, params = match
+    with _connection().cursor() as cursor:
+        cursor.execute(f'{sql} LIMIT %s OFFSET %s', params + [limit, offset])
+        ranked = cursor.fetchall()
+    by_pk = leads.in_bulk([lead_id for lead_id, _rank in ranked])
+    return [SearchHit(by_pk[lead_id], rank) for lead_id, rank in ranked if lead_id in by_pk]
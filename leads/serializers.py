@@ -0,0 +1,118 @@
+from rest_framework import serializers
+
+from .models import Consultation, Lead, LeadNote, LeadSource
+
+
+def requested_fields(request):
+    """
+    Field names from ?fields=name,status,... on a GET, plus id; None when
+    every field is wanted. Writes always answer with the full representation.
+    """
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None
+    requested = request.query_params.get('fields')
+    if not requested:
+        return None
+    return {name.strip() for name in requested.split(',')} | {'id'}
+
+
+class SparseFieldsMixin:
+    """
+    Drop fields not named in ?fields=name,status,... on list and detail GETs.
+    Unknown names are ignored; an empty or missing parameter keeps every field.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        allowed = requested_fields(self.context.get('request'))
+        if allowed is None:
+            return
+        for name in set(self.fields) - allowed:
+            self.fields.pop(name)
+
+
+class LeadNoteSerializer(serializers.ModelSerializer):
+    author = serializers.CharField(source='author.get_full_name', read_only=True)
+
+    class Meta:
+        model = LeadNote
+        fields = ['id', 'note_type', 'title', 'content', 'author', 'created_at']
+
+
+class LeadConsultationSerializer(serializers.ModelSerializer):
+    """Consultation as nested in a lead"""
+
+    class Meta:
+        model = Consultation
+        fields = ['id', 'scheduled_time', 'duration_minutes', 'consultation_type', 'status', 'meeting_method']
+
+
+class LeadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    assigned_to = serializers.CharField(source='assigned_to.username', read_only=True, default=None)
+
+    class Meta:
+        model = Lead
+        fields = [
+            'id', 'name', 'email', 'phone', 'legal_category', 'case_description', 'estimated_budget', 'urgency',
+            'status', 'priority', 'source', 'assigned_to', 'utm_source', 'utm_medium', 'utm_campaign',
+            'created_at', 'updated_at', 'contacted_at',
+        ]
+        read_only_fields = ['phone', 'source', 'utm_source', 'utm_medium', 'utm_campaign', 'created_at', 'updated_at']
+
+
+class LeadCreateSerializer(LeadSerializer):
+    """Phone and attribution are set once, when the lead is created"""
+
+    class Meta(LeadSerializer.Meta):
+        read_only_fields = ['created_at', 'updated_at']
+
+
+class LeadDetailSerializer(LeadSerializer):
+    """Lead with its notes and consultations (prefetched by the view)"""
+    notes = LeadNoteSerializer(many=True, read_only=True)
+    consultations = LeadConsultationSerializer(many=True, read_only=True)
+
+    class Meta(LeadSerializer.Meta):
+        fields = LeadSerializer.Meta.fields + ['internal_notes', 'notes', 'consultations']
+
+
+class ConsultationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    lead_name = serializers.CharField(source='lead.name', read_only=True)
+    lead_phone = serializers.CharField(source='lead.phone', read_only=True)
+
+    class Meta:
+        model = Consultation
+        fields = [
+            'id', 'lead', 'lead_name', 'lead_phone', 'scheduled_time', 'duration_minutes', 'consultation_type',
+            'status', 'fee', 'meeting_method', 'meeting_link', 'location', 'agenda', 'client_questions',
+            'follow_up_required', 'follow_up_date', 'created_at', 'updated_at',
+        ]
+        read_only_fields = ['created_at', 'updated_at']
+
+    def validate_lead(self, lead):
+        lawyer = self.context['request'].user.lawyer_profile
+        if lead.lawyer_id != lawyer.pk:
+            raise serializers.ValidationError('Lead not found')
+        return lead
+
+
+class LeadSourceSerializer(serializers.ModelSerializer):
+    """Lead source with the totals annotated by LeadSource.objects.with_stats()"""
+    leads_total = serializers.IntegerField(read_only=True)
+    leads_converted = serializers.IntegerField(read_only=True)
+    conversion_rate = serializers.SerializerMethodField()
+    total_cost = serializers.SerializerMethodField()
+
+    class Meta:
+        model = LeadSource
+        fields = [
+            'id', 'name', 'description', 'is_active', 'cost_per_lead',
+            'leads_total', 'leads_converted', 'conversion_rate', 'total_cost',
+        ]
+
+    def get_conversion_rate(self, source):
+        return round(source.get_conversion_rate(), 1)
+
+    def get_total_cost(self, source):
+        # A string, like cost_per_lead
+        return str(source.cost_per_lead * source.leads_total)
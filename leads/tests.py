@@ -1,3 +1,642 @@
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+from zoneinfo import ZoneInfo
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from adylai.testing import QueryBudgetMixin
+from chatbot.models import ChatConfiguration
+from .availability import build_index, get_availability
+from .booking import CONSTRAINT_NAME, SlotUnavailable, book_consultation, find_overlaps
+from .calendar import feed_token
+from .outbox import send_outbox
+from .reminders import send_due_reminders
+from .models import Consultation, Lead, LeadAnalytics, LeadNote, LeadSource, OutboxMessage
+
+
+class LeadViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Lead dashboards and API endpoints stay within fixed query budgets"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lawyer', password='secret')
+        lawyer = cls.user.lawyer_profile
+        soon = timezone.now() + timedelta(minutes=30)
+        for index in range(5):
+            lead = Lead.objects.create(
+                lawyer=lawyer,
+                name=f'Клиент {index}',
+                phone=f'+99670000000{index}',
+                source='website_chat' if index % 2 else 'website_form',
+            )
+            Consultation.objects.create(lawyer=lawyer, lead=lead, scheduled_time=soon + timedelta(minutes=index))
+        Lead.objects.filter(source='website_chat').update(status='converted')
+        for name in ['website_chat', 'website_form', 'referral']:
+            LeadSource.objects.create(lawyer=lawyer, name=name, cost_per_lead=100)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_lead_list(self):
+        response = self.assertQueryBudget(8, 'get', reverse('leads:lead_list'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_consultation_list(self):
+        response = self.assertQueryBudget(4, 'get', reverse('leads:consultation_list'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_analytics(self):
+        # Includes one annotated query for the tracked sources' conversion and cost
+        response = self.assertQueryBudget(9, 'get', reverse('leads:analytics'))
+        self.assertEqual(response.status_code, 200)
+        # Every lead was created in the same local hour
+        hour = response.context['lead_peak_hours'][0]
+        self.assertEqual(hour['count'], 5)
+        self.assertContains(response, hour['label'])
+
+    def test_api_endpoints(self):
+        response = self.assertQueryBudget(2, 'get', reverse('leads_api:analytics'))
+        self.assertEqual(response.status_code, 200)
+        # Session, user and one query with every source's totals annotated
+        response = self.assertQueryBudget(3, 'get', reverse('leads_api:sources'))
+        self.assertEqual(response.status_code, 200)
+    
+    def test_api_sources(self):
+        response = self.client.get(reverse('leads_api:sources'))
+        stats = {source['name']: source for source in response.json()}
+        self.assertEqual(stats['website_form']['leads_total'], 3)
+        self.assertEqual(stats['website_chat']['leads_converted'], 2)
+        self.assertEqual(stats['website_chat']['conversion_rate'], 100.0)
+        self.assertEqual(stats['referral']['leads_total'], 0)
+        self.assertEqual(stats['website_form']['total_cost'], '300.00')
+
+    def test_admin_lead_sources(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        # Same count for any number of sources: no per-row COUNT queries
+        response = self.assertQueryBudget(6, 'get', reverse('admin:leads_leadsource_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'website_chat')
+    
+    def test_api_lists(self):
+        # Session, user and one query for the page, however many rows it holds
+        for name in ['lead_list', 'consultation_list']:
+            with self.subTest(name=name):
+                response = self.assertQueryBudget(3, 'get', reverse(f'leads_api:{name}'))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['results']), 5)
+    
+    def test_api_lead_detail(self):
+        lead = Lead.objects.first()
+        response = self.assertQueryBudget(5, 'get', reverse('leads_api:lead_detail', args=[lead.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['consultations']), 1)
+
+
+class AdminChangelistQueryTests(QueryBudgetMixin, TestCase):
+    """Admin changelists run a fixed number of queries however many rows they show"""
+
+    # Session, user, counts, the page and list filter choices; str(obj) labels each row's checkbox
+    QUERIES = {'lead': 5, 'consultation': 5, 'leadnote': 5, 'leadanalytics': 8, 'outboxmessage': 6}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='secret')
+
+    def create_rows(self, start, stop):
+        soon = timezone.now() + timedelta(days=1)
+        for index in range(start, stop):
+            lawyer = User.objects.create_user(f'lawyer{index}', first_name='Айбек').lawyer_profile
+            lead = Lead.objects.create(lawyer=lawyer, name=f'Клиент {index}', phone=f'+99670000000{index}')
+            Consultation.objects.create(lawyer=lawyer, lead=lead, scheduled_time=soon)
+            LeadNote.objects.create(lead=lead, author=self.admin, content='Перезвонить')
+            LeadAnalytics.objects.create(lawyer=lawyer, date=timezone.localdate())
+            OutboxMessage.objects.create(kind='new_lead', recipients=['lawyer@example.com'], subject='Заявка', body='')
+
+    def test_changelists(self):
+        self.client.force_login(self.admin)
+        # The same count with one row and with five
+        for start, stop in [(0, 1), (1, 5)]:
+            self.create_rows(start, stop)
+            for model, expected in self.QUERIES.items():
+                with self.subTest(model=model, rows=stop):
+                    response = self.assertQueryCount(expected, 'get', reverse(f'admin:leads_{model}_changelist'))
+                    self.assertEqual(response.status_code, 200)
+
+
+class LeadAPITests(TestCase):
+    """Keyset pages are stable and complete; ?fields= trims the payload"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lawyer', password='secret')
+        other = User.objects.create_user('other', password='secret')
+        lawyer = cls.user.lawyer_profile
+        cls.leads = [
+            Lead.objects.create(lawyer=lawyer, name=f'Клиент {index}', phone=f'+99670000001{index}')
+            for index in range(5)
+        ]
+        # Same timestamp everywhere, so only the id tiebreak orders the pages
+        Lead.objects.update(created_at=timezone.now())
+        Lead.objects.create(lawyer=other.lawyer_profile, name='Чужой', phone='+996700000099')
+    
+    def setUp(self):
+        self.client.force_login(self.user)
+    
+    def test_cursor_walks_every_lead_once(self):
+        url, seen = reverse('leads_api:lead_list') + '?page_size=2', []
+        while url:
+            data = self.client.get(url).json()
+            seen += [lead['id'] for lead in data['results']]
+            url = data['next']
+        self.assertEqual(seen, sorted((lead.pk for lead in self.leads), reverse=True))
+    
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('leads_api:lead_list'), {'cursor': 'bogus'})
+        self.assertEqual(response.status_code, 404)
+    
+    def test_sparse_fields(self):
+        response = self.client.get(reverse('leads_api:lead_list'), {'fields': 'name,status'})
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'name', 'status'})
+        
+        # The detail view skips the joins and prefetches of fields left out: no consultations query
+        lead = self.leads[0]
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('leads_api:lead_detail', args=[lead.pk]), {'fields': 'name,notes'})
+        self.assertEqual(set(response.json()), {'id', 'name', 'notes'})
+        
+        # Writes ignore ?fields= and answer with the whole lead
+        response = self.client.patch(
+            reverse('leads_api:update_lead', args=[lead.pk]) + '?fields=name',
+            {'status': 'contacted'}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'contacted')
+    
+    def test_update_and_foreign_lead(self):
+        lead = self.leads[0]
+        response = self.client.patch(
+            reverse('leads_api:update_lead', args=[lead.pk]), {'status': 'contacted'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        lead.refresh_from_db()
+        self.assertEqual(lead.status, 'contacted')
+        
+        foreign = Lead.objects.get(name='Чужой')
+        self.assertEqual(self.client.get(reverse('leads_api:lead_detail', args=[foreign.pk])).status_code, 404)
+        response = self.client.post(
+            reverse('leads_api:create_consultation'),
+            {'lead': foreign.pk, 'scheduled_time': timezone.now().isoformat()},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class AvailabilityTests(TestCase):
+    """Free slots come from office hours minus buffered bookings"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lawyer', password='secret')
+        cls.lawyer = cls.user.lawyer_profile
+        cls.lead = Lead.objects.create(lawyer=cls.lawyer, name='Клиент', phone='+996700000001')
+    
+    def local(self, day, hour, minute=0):
+        return datetime(2030, 1, day, hour, minute, tzinfo=ZoneInfo('Asia/Bishkek'))
+    
+    def test_buffered_booking(self):
+        # Monday 10:00-11:00 with the 10 minute buffer blocks 09:50-11:10
+        Consultation.objects.create(
+            lawyer=self.lawyer, lead=self.lead, scheduled_time=self.local(7, 10), duration_minutes=60
+        )
+        with self.assertNumQueries(2):
+            index = build_index(self.lawyer, now=self.local(7, 8))
+        
+        self.assertTrue(index.is_free(self.local(7, 9), 30))
+        self.assertFalse(index.is_free(self.local(7, 9, 30), 30))
+        self.assertFalse(index.is_free(self.local(7, 17, 30), 60))
+        slots = index.next_free_slots(3, 30, after=self.local(7, 8))
+        self.assertEqual(slots, [self.local(7, 9), self.local(7, 11, 30), self.local(7, 12)])
+        # A slot that started seconds ago is not offered
+        just_after = self.local(7, 9) + timedelta(seconds=5)
+        self.assertEqual(index.next_free_slots(1, 30, after=just_after), [self.local(7, 11, 30)])
+        # Saturday and Sunday are closed by default
+        weekend = build_index(self.lawyer, now=self.local(5, 8))
+        self.assertEqual(weekend.next_free_slots(1, 30, after=self.local(5, 8)), [self.local(7, 9)])
+    
+    def test_booking_invalidates_cache(self):
+        cache.clear()
+        ChatConfiguration.objects.create(lawyer=self.lawyer, office_hours={
+            day: {'enabled': True, 'start': '00:00', 'end': '24:00'}
+            for day in ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+        })
+        slot = (timezone.now() + timedelta(days=1)).replace(second=0, microsecond=0)
+        self.assertTrue(get_availability(self.lawyer).is_free(slot, 60))
+        # Two cache reads (version, index) and no rebuild
+        with self.assertNumQueries(2):
+            get_availability(self.lawyer)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Consultation.objects.create(lawyer=self.lawyer, lead=self.lead, scheduled_time=slot)
+        self.assertFalse(get_availability(self.lawyer).is_free(slot, 60))
+
+
+class BookingTests(TestCase):
+    """Overlapping active consultations are refused at write time"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lawyer', password='secret')
+        cls.lawyer = cls.user.lawyer_profile
+        cls.lead = Lead.objects.create(lawyer=cls.lawyer, name='Клиент', phone='+996700000001')
+        cls.start = timezone.now().replace(second=0, microsecond=0) + timedelta(days=2)
+    
+    def test_overlap_refused(self):
+        book_consultation(self.lawyer, self.start, 60, lead=self.lead)
+        with self.assertRaises(SlotUnavailable):
+            book_consultation(self.lawyer, self.start + timedelta(minutes=30), 60, lead=self.lead)
+        # Back to back is fine, and cancelled bookings free their slot
+        book_consultation(self.lawyer, self.start + timedelta(minutes=60), 30, lead=self.lead)
+        Consultation.objects.filter(scheduled_time=self.start).update(status='cancelled')
+        book_consultation(self.lawyer, self.start, 60, lead=self.lead)
+        self.assertEqual(Consultation.objects.count(), 3)
+    
+    def test_api_conflict(self):
+        self.client.force_login(self.user)
+        book_consultation(self.lawyer, self.start, 60, lead=self.lead)
+        response = self.client.post(
+            reverse('leads_api:create_consultation'),
+            {'lead': self.lead.pk, 'scheduled_time': self.start.isoformat(), 'duration_minutes': 30},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('available_slots', response.json())
+    
+    def test_find_overlaps(self):
+        first = Consultation.objects.create(lawyer=self.lawyer, lead=self.lead, scheduled_time=self.start)
+        second = Consultation.objects.create(lawyer=self.lawyer, lead=self.lead, scheduled_time=self.start)
+        self.assertEqual(find_overlaps(Consultation), [(first.pk, second.pk)])
+        out = StringIO()
+        call_command('find_overlapping_consultations', stdout=out)
+        self.assertIn(f'Consultation {second.pk} overlaps consultation {first.pk}', out.getvalue())
+        # Reporting changes nothing
+        self.assertEqual(set(Consultation.objects.values_list('status', flat=True)), {'scheduled'})
+    
+    def test_admin_refuses_overlap(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='secret'))
+        booked = book_consultation(self.lawyer, self.start, 60, lead=self.lead)
+        other = book_consultation(self.lawyer, self.start + timedelta(hours=2), 60, lead=self.lead)
+        local = timezone.localtime(booked.scheduled_time + timedelta(minutes=30))
+        url = reverse('admin:leads_consultation_change', args=[other.pk])
+        data = {
+            'lead': self.lead.pk, 'lawyer': self.lawyer.pk, 'consultation_type': 'free', 'fee': '0',
+            'scheduled_time_0': local.strftime('%Y-%m-%d'), 'scheduled_time_1': local.strftime('%H:%M:%S'),
+            'duration_minutes': 60, 'status': 'scheduled', 'meeting_method': other.meeting_method,
+        }
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('scheduled_time', response.context['adminform'].form.errors)
+        
+        # A booking that slips in after validation trips the constraint: an error message, not a 500
+        with mock.patch.object(Consultation, 'clean'), mock.patch(
+            'django.contrib.admin.ModelAdmin.save_model', side_effect=IntegrityError(f'violates {CONSTRAINT_NAME}'),
+        ):
+            response = self.client.post(url, data, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ['The lawyer already has a consultation at this time.'],
+        )
+        other.refresh_from_db()
+        self.assertEqual(other.scheduled_time, self.start + timedelta(hours=2))
+
+
+class CalendarFeedTests(TestCase):
+    """The ICS feed is token-addressed and answers unchanged polls with 304 from cache"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lawyer', password='secret')
+        cls.lawyer = cls.user.lawyer_profile
+        cls.lead = Lead.objects.create(lawyer=cls.lawyer, name='Клиент; Иванов', phone='+996700000001')
+        cls.consultation = Consultation.objects.create(
+            lawyer=cls.lawyer, lead=cls.lead, scheduled_time=timezone.now() + timedelta(days=1),
+            agenda='Договор аренды, ' * 10,
+        )
+        cls.url = reverse('leads:calendar_feed', args=[feed_token(cls.lawyer)])
+    
+    def setUp(self):
+        cache.clear()
+    
+    def test_feed(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode('utf-8')
+        self.assertIn(f'UID:consultation-{self.consultation.pk}@testserver', body)
+        self.assertIn('Клиент\\; Иванов', body)
+        self.assertTrue(all(len(line.encode('utf-8')) <= 75 for line in body.split('\r\n')))
+        
+        # Two cache reads (version, feed) and no consultation query
+        with self.assertNumQueries(2):
+            repeat = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeat.status_code, 304)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.consultation.status = 'confirmed'
+            self.consultation.save()
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn('STATUS:CONFIRMED', changed.content.decode('utf-8'))
+    
+    def test_delete_moves_last_modified(self):
+        earlier = Consultation.objects.create(
+            lawyer=self.lawyer, lead=self.lead, scheduled_time=timezone.now() + timedelta(days=2),
+        )
+        Consultation.objects.filter(pk=earlier.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        Consultation.objects.filter(pk=self.consultation.pk).update(updated_at=timezone.now() - timedelta(minutes=1))
+        newest = self.client.get(self.url)['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=newest).status_code, 304)
+        
+        # Deleting the most recently updated consultation must not move Last-Modified back
+        with self.captureOnCommitCallbacks(execute=True):
+            Consultation.objects.filter(pk=self.consultation.pk).delete()
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=newest)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(f'consultation-{self.consultation.pk}@', response.content.decode('utf-8'))
+    
+    def test_forged_token(self):
+        self.assertEqual(self.client.get(reverse('leads:calendar_feed', args=[f'{self.lawyer.pk}-1.forged'])).status_code, 404)
+    
+    def test_rotate(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('leads:calendar_feed_rotate'))
+        self.assertRedirects(response, reverse('leads:consultation_list'), fetch_redirect_response=False)
+        
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.lawyer.refresh_from_db()
+        self.assertEqual(self.client.get(reverse('leads:calendar_feed', args=[feed_token(self.lawyer)])).status_code, 200)
+
+
+class ReminderTests(TestCase):
+    """Due reminders go out once, one SMTP connection per batch"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.lawyer = lawyer = User.objects.create_user('lawyer', email='lawyer@example.com').lawyer_profile
+        soon = timezone.now() + timedelta(hours=2)
+        for index in range(5):
+            lead = Lead.objects.create(
+                lawyer=lawyer, name=f'Клиент {index}', phone=f'+99670000000{index}',
+                email=f'client{index}@example.com' if index else '',
+            )
+            Consultation.objects.create(lawyer=lawyer, lead=lead, scheduled_time=soon + timedelta(hours=index))
+        # Too far ahead
+        Consultation.objects.create(lawyer=lawyer, lead=lead, scheduled_time=soon + timedelta(days=3))
+    
+    def test_send_due_reminders(self):
+        with mock.patch('leads.reminders.get_connection', wraps=get_connection) as connection:
+            # Per batch: the claim (select, lease update, savepoint pair) and the sent flag update;
+            # the final empty batch has no updates
+            with self.assertNumQueries(5 * 2 + 3):
+                totals = send_due_reminders(batch_size=2)
+        self.assertEqual(totals, {'sent': 4, 'failed': 0})
+        self.assertEqual(connection.call_count, 2)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [f'client{i}@example.com' for i in range(1, 5)])
+        self.assertEqual(Consultation.objects.filter(reminder_sent=True).count(), 4)
+        
+        self.assertEqual(send_due_reminders(), {'sent': 0, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 4)
+    
+    def test_connection_failure_releases_batch(self):
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=OSError('refused')):
+            with self.assertLogs('leads.reminders', 'ERROR') as logs:
+                self.assertEqual(send_due_reminders(batch_size=2), {'sent': 0, 'failed': 4})
+        self.assertEqual(len(logs.records), 2)
+        self.assertFalse(Consultation.objects.filter(reminder_sent=True).exists())
+        self.assertFalse(Consultation.objects.filter(reminder_claimed_until__isnull=False).exists())
+        # The next run picks them up again
+        self.assertEqual(send_due_reminders(), {'sent': 4, 'failed': 0})
+    
+    def test_office_time_zone(self):
+        ChatConfiguration.objects.create(lawyer=self.lawyer, office_hours={
+            'timezone': 'Europe/Moscow', 'monday': {'enabled': True, 'start': '09:00', 'end': '18:00'},
+        })
+        send_due_reminders()
+        consultation = Consultation.objects.get(lead__email='client1@example.com')
+        local = consultation.scheduled_time.astimezone(ZoneInfo('Europe/Moscow'))
+        message = next(message for message in mail.outbox if message.to == ['client1@example.com'])
+        self.assertIn(f"Время: {local:%H:%M}", message.body)
+    
+    def test_claimed_rows_are_skipped(self):
+        Consultation.objects.update(reminder_claimed_until=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(send_due_reminders(), {'sent': 0, 'failed': 0})
+        # An expired lease (its sender died) makes the row due again
+        Consultation.objects.update(reminder_claimed_until=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(send_due_reminders(), {'sent': 4, 'failed': 0})
+
+
+class OutboxTests(TestCase):
+    """Notifications are queued with the booking and delivered, or retried, by the sender"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lawyer', password='secret', email='lawyer@example.com')
+        cls.lawyer = cls.user.lawyer_profile
+        cls.lead = Lead.objects.create(
+            lawyer=cls.lawyer, name='Клиент', phone='+996700000001', email='client@example.com'
+        )
+    
+    def book(self):
+        self.client.force_login(self.user)
+        return self.client.post(
+            reverse('leads_api:create_consultation'),
+            {'lead': self.lead.pk, 'scheduled_time': (timezone.now() + timedelta(days=2)).isoformat()},
+            content_type='application/json',
+        )
+    
+    def test_booking_queues_without_sending(self):
+        self.assertEqual(self.book().status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            sorted(OutboxMessage.objects.values_list('kind', flat=True)), ['consultation_booked', 'consultation_confirmation']
+        )
+        # Queued is not sent: delivery flags the confirmation
+        self.assertFalse(Consultation.objects.get().confirmation_sent)
+        
+        self.assertEqual(send_outbox(concurrency=2), {'sent': 2, 'failed': 0})
+        self.assertTrue(Consultation.objects.get().confirmation_sent)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['client@example.com', 'lawyer@example.com'])
+        self.assertFalse(OutboxMessage.objects.exclude(status='sent').exists())
+        self.assertEqual(send_outbox(), {'sent': 0, 'failed': 0})
+    
+    def test_times_in_office_time_zone(self):
+        ChatConfiguration.objects.create(lawyer=self.lawyer, office_hours={
+            'timezone': 'Europe/Moscow',
+            **{day: {'enabled': True, 'start': '00:00', 'end': '24:00'}
+               for day in ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']},
+        })
+        self.assertEqual(self.book().status_code, 201)
+        local = Consultation.objects.get().scheduled_time.astimezone(ZoneInfo('Europe/Moscow'))
+        for message in OutboxMessage.objects.all():
+            with self.subTest(kind=message.kind):
+                self.assertIn(f"{local:%H:%M}", message.subject)
+    
+    def test_failed_send_backs_off(self):
+        self.book()
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('down')):
+            self.assertEqual(send_outbox(), {'sent': 0, 'failed': 2})
+        message = OutboxMessage.objects.first()
+        self.assertEqual((message.status, message.attempts), ('pending', 1))
+        self.assertGreater(message.available_at, timezone.now())
+        self.assertIn('down', message.last_error)
+        self.assertFalse(Consultation.objects.get().confirmation_sent)
+        # Not due again until the backoff passes
+        self.assertEqual(send_outbox(), {'sent': 0, 'failed': 0})
+
+
+class ExportTests(TestCase):
+    """Exports stream every matching row from one query and honour the filters"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lawyer', password='secret')
+        lawyer = cls.user.lawyer_profile
+        for index in range(3):
+            lead = Lead.objects.create(
+                lawyer=lawyer, name=f'=Клиент {index}', phone=f'0555 12345{index}',
+                status='new' if index else 'converted', source='chatbot',
+            )
+            Consultation.objects.create(lawyer=lawyer, lead=lead, scheduled_time=timezone.now())
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def read_csv(self, name, **params):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            content = b''.join(response.streaming_content).decode('utf-8-sig')
+        return [line.split(',') for line in content.splitlines()]
+
+    def test_lead_csv(self):
+        rows = self.read_csv('leads:lead_export', status='new')
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][2:4], ["'=Клиент 2", '+996555123452'])
+        self.assertEqual(rows[1][6], 'New')
+
+    def test_consultation_csv(self):
+        rows = self.read_csv('leads:consultation_export', date_from=timezone.localdate().isoformat())
+        self.assertEqual(len(rows), 4)
+
+    def test_lead_xlsx(self):
+        response = self.client.get(reverse('leads:lead_export'), {'format': 'xlsx', 'status': 'new'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'].split('; ')[0], 'attachment')
+        sheet = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True).active
+        rows = [list(row) for row in sheet.iter_rows(values_only=True)]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0][:3], ['ID', 'Created', 'Name'])
+        self.assertEqual(rows[1][2:4], ["'=Клиент 2", '+996555123452'])
+        self.assertEqual(rows[1][6], 'New')
+
+    def test_invalid_filters(self):
+        self.assertEqual(self.client.get(reverse('leads:lead_export'), {'date_to': 'tomorrow'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('leads:lead_export'), {'format': 'pdf'}).status_code, 400)
+
+
+class LeadDeduplicationTests(TestCase):
+    """Leads are keyed by lawyer and normalized phone; existing duplicates merge with their related rows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lawyer', password='secret')
+        cls.lawyer = cls.user.lawyer_profile
+
+    def test_upsert_by_phone(self):
+        lead, created = Lead.objects.upsert_by_phone(self.lawyer, '0555 12-34-56', {'name': 'Азамат'})
+        self.assertTrue(created)
+        again, created = Lead.objects.upsert_by_phone(
+            self.lawyer, '+996 555 123 456', {'name': 'Другое имя', 'email': 'a@example.com'}
+        )
+        self.assertFalse(created)
+        self.assertEqual(again.pk, lead.pk)
+        self.assertEqual((again.name, again.email), ('Азамат', 'a@example.com'))
+
+    def test_merge_duplicate_leads(self):
+        from django.core.management import call_command
+        from .models import LeadNote
+
+        first = Lead.objects.create(lawyer=self.lawyer, name='Азамат', phone='0555123456', case_description='Аренда')
+        second = Lead.objects.create(lawyer=self.lawyer, name='Азамат', email='a@example.com', case_description='Развод')
+        # A row written around save(), as bulk inserts and imports do
+        Lead.objects.filter(pk=second.pk).update(phone='996555123456')
+        Consultation.objects.create(lawyer=self.lawyer, lead=second, scheduled_time=timezone.now())
+        LeadNote.objects.create(lead=second, author=self.user, title='Звонок', content='Перезвонить')
+
+        call_command('merge_duplicate_leads', stdout=open('/dev/null', 'w'))
+
+        self.assertFalse(Lead.objects.filter(pk=second.pk).exists())
+        first.refresh_from_db()
+        self.assertEqual(first.email, 'a@example.com')
+        self.assertEqual(first.case_description, 'Аренда\n\nРазвод')
+        self.assertEqual(first.consultations.count(), 1)
+        self.assertEqual(first.notes.count(), 1)
+
+
+class LeadSearchTests(TestCase):
+    """Lead search uses the full-text index, kept current as leads and notes change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        from .models import LeadNote
+
+        cls.user = User.objects.create_user('lawyer', password='secret')
+        lawyer = cls.user.lawyer_profile
+        cls.inheritance = Lead.objects.create(
+            lawyer=lawyer, name='Айгуль Токтогулова', phone='0555111222',
+            case_description='Вопрос о наследстве после смерти отца',
+        )
+        cls.divorce = Lead.objects.create(lawyer=lawyer, name='Бакыт', case_description='Развод и раздел имущества')
+        LeadNote.objects.create(lead=cls.divorce, author=cls.user, title='Звонок', content='Спросил про наследство бабушки')
+        other = User.objects.create_user('other', password='secret').lawyer_profile
+        Lead.objects.create(lawyer=other, name='Чужой', case_description='Наследство')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def search(self, query):
+        response = self.client.get(reverse('leads_api:search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [result['id'] for result in response.json()['results']]
+
+    def test_ranked_search(self):
+        self.assertEqual(self.search('наследств'), [self.inheritance.pk, self.divorce.pk])
+        self.assertEqual(self.search('айгуль'), [self.inheritance.pk])
+        self.assertEqual(self.search('+996 555 111 222'), [self.inheritance.pk])
+
+    def test_incremental_updates(self):
+        self.divorce.notes.all().delete()
+        self.assertEqual(self.search('бабушки'), [])
+        self.inheritance.name = 'Айгуль Асанова'
+        self.inheritance.save()
+        self.assertEqual(self.search('асанова'), [self.inheritance.pk])
+        self.inheritance.delete()
+        self.assertEqual(self.search('наследств'), [])
+
+    def test_admin_search(self):
+        from .search import filter_leads
 
-# Create your tests here.
+        self.assertEqual(filter_leads(Lead.objects.all(), 'наследств').count(), 3)
+        self.assertEqual(list(filter_leads(Lead.objects.all(), 'бабушки')), [self.divorce])
@@ -10,12 +10,16 @@ urlpatterns = [
     path('<int:pk>/', views.LeadDetailView.as_view(), name='lead_detail'),
     path('<int:pk>/edit/', views.LeadEditView.as_view(), name='lead_edit'),
     path('<int:pk>/delete/', views.LeadDeleteView.as_view(), name='lead_delete'),
+    path('export/', views.LeadExportView.as_view(), name='lead_export'),
     
     # Consultation management
     path('consultations/', views.ConsultationListView.as_view(), name='consultation_list'),
     path('consultations/create/', views.ConsultationCreateView.as_view(), name='consultation_create'),
     path('consultations/<int:pk>/', views.ConsultationDetailView.as_view(), name='consultation_detail'),
     path('consultations/<int:pk>/edit/', views.ConsultationEditView.as_view(), name='consultation_edit'),
+    path('consultations/export/', views.ConsultationExportView.as_view(), name='consultation_export'),
+    path('consultations/calendar/<str:token>.ics', views.ConsultationCalendarFeedView.as_view(), name='calendar_feed'),
+    path('consultations/calendar/rotate/', views.ConsultationCalendarFeedRotateView.as_view(), name='calendar_feed_rotate'),
     
     # Analytics
     path('analytics/', views.LeadAnalyticsView.as_view(), name='analytics'),
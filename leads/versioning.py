@@ -0,0 +1,25 @@
+# Per-lawyer cache versions. Cached values are stored under a key carrying the
+# lawyer's current version for their namespace; bumping the version retires
+# them all at once, and concurrent readers never resurrect a stale value.
+
+from django.core.cache import cache
+
+
+def _version_key(namespace, lawyer_id):
+    return f'leads:{namespace}:version:{lawyer_id}'
+
+
+def versioned_key(namespace, lawyer_id, *parts):
+    """Cache key for the lawyer's current version of `namespace`"""
+    version = cache.get(_version_key(namespace, lawyer_id), 1)
+    return ':'.join(str(part) for part in ['leads', namespace, lawyer_id, version, *parts])
+
+
+def bump_version(namespace, lawyer_id):
+    key = _version_key(namespace, lawyer_id)
+    if not cache.add(key, 2, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr()
+            cache.set(key, 2, timeout=None)
@@ -1,13 +1,23 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.views.generic import TemplateView, ListView, DetailView, CreateView, UpdateView, DeleteView
+from django.views.generic import View, TemplateView, ListView, DetailView, CreateView, UpdateView, DeleteView
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
 from django.contrib import messages
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.db import IntegrityError, transaction
 from django.db.models import Count, Q
 from django.utils import timezone
 from datetime import datetime, timedelta
+from .booking import OVERLAP_MESSAGE, is_overlap_error
 from .models import Lead, Consultation, LeadNote, LeadSource, LeadAnalytics
+from .calendar import feed_for_token, feed_token, rotate_feed
+from .exports import (
+    CONSULTATION_EXPORT_COLUMNS, LEAD_EXPORT_COLUMNS, csv_response, filter_export_queryset, xlsx_response,
+)
 from lawyers.models import Lawyer
+from chatbot.analytics import local_day_start, peak_hours
 
 
 class LeadListView(LoginRequiredMixin, ListView):
@@ -24,28 +34,30 @@ class LeadListView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         lawyer = self.request.user.lawyer_profile
         
-        # Real statistics from database
-        today = timezone.now().date()
-        week_ago = today - timedelta(days=7)
+        # Real statistics from database (local day bounds keep index range scans)
+        today_start, tomorrow_start = local_day_start(), local_day_start(-1)
+        week_ago = local_day_start(7)
         
-        total_leads = Lead.objects.filter(lawyer=lawyer).count()
-        new_leads_this_week = Lead.objects.filter(lawyer=lawyer, created_at__date__gte=week_ago).count()
-        
-        scheduled_consultations = Consultation.objects.filter(
-            lawyer=lawyer, 
-            status__in=['scheduled', 'confirmed']
-        ).count()
-        
-        consultations_today = Consultation.objects.filter(
-            lawyer=lawyer,
-            scheduled_time__date=today,
-            status__in=['scheduled', 'confirmed']
-        ).count()
-        
-        chat_leads = Lead.objects.filter(lawyer=lawyer, source='website_chat').count()
+        # One conditional aggregate per table instead of a COUNT per figure
+        lead_stats = Lead.objects.filter(lawyer=lawyer).aggregate(
+            total=Count('pk'),
+            new_this_week=Count('pk', filter=Q(created_at__gte=week_ago)),
+            chat=Count('pk', filter=Q(source='website_chat')),
+        )
+        active = Q(status__in=['scheduled', 'confirmed'])
+        consultation_stats = Consultation.objects.filter(lawyer=lawyer).aggregate(
+            total=Count('pk'),
+            scheduled=Count('pk', filter=active),
+            today=Count('pk', filter=active & Q(scheduled_time__gte=today_start, scheduled_time__lt=tomorrow_start)),
+        )
+        total_leads = lead_stats['total']
+        new_leads_this_week = lead_stats['new_this_week']
+        scheduled_consultations = consultation_stats['scheduled']
+        consultations_today = consultation_stats['today']
+        chat_leads = lead_stats['chat']
         
         # Conversion rate calculation
-        total_consultations = Consultation.objects.filter(lawyer=lawyer).count()
+        total_consultations = consultation_stats['total']
         conversion_rate = round((total_consultations / total_leads * 100) if total_leads > 0 else 0, 1)
         
         context.update({
@@ -57,9 +69,10 @@ class LeadListView(LoginRequiredMixin, ListView):
             'conversion_rate': conversion_rate,
             'today_consultations': Consultation.objects.filter(
                 lawyer=lawyer,
-                scheduled_time__date=today,
+                scheduled_time__gte=today_start,
+                scheduled_time__lt=tomorrow_start,
                 status__in=['scheduled', 'confirmed']
-            ).order_by('scheduled_time')[:3],
+            ).select_related('lead').order_by('scheduled_time')[:3],
             'recent_leads': Lead.objects.filter(lawyer=lawyer).order_by('-created_at')[:3]
         })
         return context
@@ -110,35 +123,62 @@ class ConsultationListView(LoginRequiredMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         lawyer = self.request.user.lawyer_profile
-        today = timezone.now().date()
+        today_start, tomorrow_start = local_day_start(), local_day_start(-1)
+        consultation_stats = Consultation.objects.filter(lawyer=lawyer).aggregate(
+            total=Count('pk'),
+            completed=Count('pk', filter=Q(status='completed')),
+        )
         
         # Real consultation data
         context.update({
             'today_consultations': Consultation.objects.filter(
                 lawyer=lawyer,
-                scheduled_time__date=today
+                scheduled_time__gte=today_start,
+                scheduled_time__lt=tomorrow_start
             ).order_by('scheduled_time'),
             'upcoming_consultations': Consultation.objects.filter(
                 lawyer=lawyer,
-                scheduled_time__date__gt=today,
+                scheduled_time__gte=tomorrow_start,
                 status__in=['scheduled', 'confirmed']
             ).order_by('scheduled_time')[:5],
-            'total_consultations': Consultation.objects.filter(lawyer=lawyer).count(),
-            'completed_consultations': Consultation.objects.filter(lawyer=lawyer, status='completed').count(),
+            'total_consultations': consultation_stats['total'],
+            'completed_consultations': consultation_stats['completed'],
+            'calendar_feed_url': self.request.build_absolute_uri(
+                reverse('leads:calendar_feed', args=[feed_token(lawyer)])
+            ),
         })
         return context
 
 
-class ConsultationCreateView(LoginRequiredMixin, CreateView):
+class ConsultationOverlapFormMixin:
+    """
+    The model form refuses overlapping consultations; one booked concurrently
+    trips the exclusion constraint on save and becomes a form error too.
+    """
+    
+    def form_valid(self, form):
+        try:
+            with transaction.atomic():
+                return super().form_valid(form)
+        except IntegrityError as e:
+            if not is_overlap_error(e):
+                raise
+            form.add_error('scheduled_time', OVERLAP_MESSAGE)
+            return self.form_invalid(form)
+
+
+class ConsultationCreateView(LoginRequiredMixin, ConsultationOverlapFormMixin, CreateView):
     """Create new consultation"""
     model = Consultation
     template_name = 'leads/consultation_create.html'
-    fields = ['lead', 'scheduled_time', 'duration', 'consultation_type', 'meeting_method', 'agenda']
+    fields = ['lead', 'scheduled_time', 'duration_minutes', 'consultation_type', 'meeting_method', 'agenda']
     success_url = reverse_lazy('leads:consultation_list')
     
-    def form_valid(self, form):
+    def get_form(self, form_class=None):
+        # The overlap check in Consultation.clean() needs the lawyer before validation
+        form = super().get_form(form_class)
         form.instance.lawyer = self.request.user.lawyer_profile
-        return super().form_valid(form)
+        return form
 
 
 class ConsultationDetailView(LoginRequiredMixin, DetailView):
@@ -151,11 +191,13 @@ class ConsultationDetailView(LoginRequiredMixin, DetailView):
         return Consultation.objects.filter(lawyer=self.request.user.lawyer_profile)
 
 
-class ConsultationEditView(LoginRequiredMixin, UpdateView):
+class ConsultationEditView(LoginRequiredMixin, ConsultationOverlapFormMixin, UpdateView):
     """Edit consultation"""
     model = Consultation
     template_name = 'leads/consultation_edit.html'
-    fields = ['scheduled_time', 'duration', 'status', 'consultation_type', 'meeting_method', 'agenda', 'notes']
+    fields = [
+        'scheduled_time', 'duration_minutes', 'status', 'consultation_type', 'meeting_method', 'agenda', 'lawyer_notes',
+    ]
     
     def get_queryset(self):
         return Consultation.objects.filter(lawyer=self.request.user.lawyer_profile)
@@ -173,16 +215,24 @@ class LeadAnalyticsView(LoginRequiredMixin, TemplateView):
         lawyer = self.request.user.lawyer_profile
         
         # Real analytics from database
-        today = timezone.now().date()
-        month_ago = today - timedelta(days=30)
+        month_ago = local_day_start(30)
         
         # Lead statistics
-        total_leads = Lead.objects.filter(lawyer=lawyer).count()
-        leads_this_month = Lead.objects.filter(lawyer=lawyer, created_at__date__gte=month_ago).count()
+        lead_stats = Lead.objects.filter(lawyer=lawyer).aggregate(
+            total=Count('pk'),
+            this_month=Count('pk', filter=Q(created_at__gte=month_ago)),
+            chat=Count('pk', filter=Q(source='website_chat')),
+        )
+        total_leads = lead_stats['total']
+        leads_this_month = lead_stats['this_month']
         
         # Consultation statistics  
-        total_consultations = Consultation.objects.filter(lawyer=lawyer).count()
-        completed_consultations = Consultation.objects.filter(lawyer=lawyer, status='completed').count()
+        consultation_stats = Consultation.objects.filter(lawyer=lawyer).aggregate(
+            total=Count('pk'),
+            completed=Count('pk', filter=Q(status='completed')),
+        )
+        total_consultations = consultation_stats['total']
+        completed_consultations = consultation_stats['completed']
         
         # Conversion rate
         conversion_rate = round((total_consultations / total_leads * 100) if total_leads > 0 else 0, 1)
@@ -193,14 +243,20 @@ class LeadAnalyticsView(LoginRequiredMixin, TemplateView):
         # Legal categories
         legal_categories = Lead.objects.filter(lawyer=lawyer).values('legal_category').annotate(count=Count('legal_category')).order_by('-count')
         
+        # Tracked sources carry their conversion rate and cost (one annotated query)
+        tracked_sources = {source.name: source for source in LeadSource.objects.filter(lawyer=lawyer).with_stats()}
+        
         # Calculate percentages for sources
         source_data = []
         for source in lead_sources:
             percentage = round((source['count'] / total_leads * 100) if total_leads > 0 else 0, 1)
+            tracked = tracked_sources.get(source['source'])
             source_data.append({
                 'source': source['source'],
                 'count': source['count'],
-                'percentage': percentage
+                'percentage': percentage,
+                'conversion_rate': round(tracked.get_conversion_rate(), 1) if tracked else None,
+                'total_cost': tracked.cost_per_lead * tracked.leads_total if tracked else None,
             })
         
         # Calculate percentages for categories  
@@ -216,8 +272,11 @@ class LeadAnalyticsView(LoginRequiredMixin, TemplateView):
         # Revenue calculation (basic)
         revenue_this_month = completed_consultations * float(lawyer.consultation_fee or 0)
         
+        # Peak lead hours (indexed group-by on the stored local hour)
+        lead_peak_hours = peak_hours(Lead.objects.filter(lawyer=lawyer))
+        
         # AI chat performance
-        chat_leads = Lead.objects.filter(lawyer=lawyer, source='website_chat').count()
+        chat_leads = lead_stats['chat']
         chat_conversion = round((chat_leads / total_leads * 100) if total_leads > 0 else 0, 1)
         
         context.update({
@@ -228,6 +287,7 @@ class LeadAnalyticsView(LoginRequiredMixin, TemplateView):
             'revenue_this_month': revenue_this_month,
             'source_data': source_data,
             'category_data': category_data,
+            'lead_peak_hours': lead_peak_hours,
             'total_consultations': total_consultations,
             'completed_consultations': completed_consultations,
         })
@@ -247,3 +307,80 @@ class LeadNoteCreateView(LoginRequiredMixin, CreateView):
     
     def get_success_url(self):
         return reverse_lazy('leads:lead_detail', kwargs={'pk': self.kwargs['lead_id']})
+
+
+class ConsultationCalendarFeedView(View):
+    """
+    iCalendar feed of a lawyer's consultations for calendar apps, addressed by
+    a signed token. Conditional polls of an unchanged feed get a 304 straight
+    from the cache.
+    """
+    
+    def get(self, request, token):
+        feed = feed_for_token(token, request.get_host())
+        if feed is None:
+            raise Http404
+        
+        # Whole seconds, as Last-Modified and If-Modified-Since carry them
+        last_modified = int(feed['last_modified'].timestamp()) if feed['last_modified'] else None
+        response = get_conditional_response(request, etag=feed['etag'], last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(feed['body'], content_type='text/calendar; charset=utf-8')
+            response['Content-Disposition'] = 'inline; filename="consultations.ics"'
+        response['ETag'] = feed['etag']
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        # Let clients keep the feed but revalidate on every poll
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class ConsultationCalendarFeedRotateView(LoginRequiredMixin, View):
+    """Replace the lawyer's calendar feed URL, e.g. after it leaked"""
+    
+    def post(self, request):
+        rotate_feed(request.user.lawyer_profile)
+        messages.success(request, 'Calendar feed link renewed. The old link no longer works.')
+        return redirect('leads:consultation_list')
+
+
+class ExportView(LoginRequiredMixin, View):
+    """Stream the current lawyer's rows as CSV (default) or XLSX, honouring the export filters"""
+    model = None
+    columns = None
+    ordering = None
+    title = None
+    
+    def get_queryset(self):
+        queryset = self.model.objects.filter(lawyer=self.request.user.lawyer_profile).order_by(*self.ordering)
+        return filter_export_queryset(queryset, self.request.GET)
+    
+    def get(self, request, *args, **kwargs):
+        try:
+            queryset = self.get_queryset()
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+        
+        filename = f"{self.title.lower()}-{timezone.localdate():%Y-%m-%d}"
+        export_format = request.GET.get('format', 'csv')
+        if export_format == 'csv':
+            return csv_response(queryset, self.columns, filename)
+        if export_format == 'xlsx':
+            return xlsx_response(queryset, self.columns, filename, self.title)
+        return HttpResponseBadRequest('format must be csv or xlsx')
+
+
+class LeadExportView(ExportView):
+    """Export leads"""
+    model = Lead
+    columns = LEAD_EXPORT_COLUMNS
+    ordering = ['-created_at']
+    title = 'Leads'
+
+
+class ConsultationExportView(ExportView):
+    """Export consultations with their client contacts"""
+    model = Consultation
+    columns = CONSULTATION_EXPORT_COLUMNS
+    ordering = ['-scheduled_time']
+    title = 'Consultations'
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 from django.utils.html import format_html
+from adylai.admin import related_filter
 from .models import WebsiteTemplate, Website, WebsitePage, WebsiteAsset, WebsiteAnalytics
 
 
@@ -30,6 +31,7 @@ class WebsiteAdmin(admin.ModelAdmin):
     list_display = ['title', 'lawyer', 'status', 'is_published', 'public_url_link', 'updated_at']
     list_filter = ['status', 'is_published', 'created_at']
     search_fields = ['title', 'lawyer__user__username', 'domain_slug']
+    list_select_related = ['lawyer__user']
     readonly_fields = ['created_at', 'updated_at', 'published_at', 'public_url']
     
     fieldsets = (
@@ -64,6 +66,7 @@ class WebsitePageAdmin(admin.ModelAdmin):
     list_display = ['title', 'website', 'page_type', 'is_published', 'order', 'updated_at']
     list_filter = ['page_type', 'is_published', 'created_at']
     search_fields = ['title', 'website__title', 'slug']
+    list_select_related = ['website__lawyer__user']
     readonly_fields = ['created_at', 'updated_at', 'url']
     
     fieldsets = (
@@ -88,6 +91,7 @@ class WebsiteAssetAdmin(admin.ModelAdmin):
     list_display = ['name', 'website', 'asset_type', 'file_extension_display', 'created_at']
     list_filter = ['asset_type', 'created_at']
     search_fields = ['name', 'website__title']
+    list_select_related = ['website__lawyer__user']
     readonly_fields = ['created_at', 'updated_at', 'file_extension']
     
     fieldsets = (
@@ -111,8 +115,9 @@ class WebsiteAssetAdmin(admin.ModelAdmin):
 @admin.register(WebsiteAnalytics)
 class WebsiteAnalyticsAdmin(admin.ModelAdmin):
     list_display = ['website', 'date', 'page_views', 'unique_visitors', 'bounce_rate']
-    list_filter = ['date', 'website']
+    list_filter = ['date', ('website', related_filter('lawyer__user'))]
     search_fields = ['website__title']
+    list_select_related = ['website__lawyer__user']
     readonly_fields = ['created_at']
     date_hierarchy = 'date'
     
@@ -1,3 +1,57 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
 
-# Create your tests here.
+from adylai.testing import QueryBudgetMixin
+from .models import WebsiteAnalytics, WebsiteAsset, WebsitePage, WebsiteTemplate
+
+
+class WebsiteBuilderQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Website builder dashboard and API endpoints stay within fixed query budgets"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lawyer', password='secret')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_dashboard(self):
+        response = self.assertQueryBudget(8, 'get', reverse('website_builder:dashboard'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_api_endpoints(self):
+        for name in ['website_content', 'pages', 'assets', 'analytics']:
+            with self.subTest(name=name):
+                response = self.assertQueryBudget(2, 'get', reverse(f'website_builder_api:{name}'))
+                self.assertEqual(response.status_code, 200)
+
+
+class AdminChangelistQueryTests(QueryBudgetMixin, TestCase):
+    """Admin changelists run a fixed number of queries however many rows they show"""
+
+    # Session, user, counts, the page and list filter choices; str(obj) labels each row's checkbox
+    QUERIES = {'website': 5, 'websitepage': 5, 'websiteasset': 5, 'websiteanalytics': 8, 'websitetemplate': 5}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='secret')
+
+    def create_rows(self, start, stop):
+        for index in range(start, stop):
+            website = User.objects.create_user(f'lawyer{index}', first_name='Айбек').lawyer_profile.publish_website()
+            WebsitePage.objects.create(website=website, page_type='about', title='О нас', slug='about')
+            WebsiteAsset.objects.create(website=website, asset_type='image', name='Логотип', file='logo.png')
+            WebsiteAnalytics.objects.create(website=website, date=timezone.localdate())
+            WebsiteTemplate.objects.create(name=f'Шаблон {index}', description='', thumbnail='thumb.png')
+
+    def test_changelists(self):
+        self.client.force_login(self.admin)
+        # The same count with one row and with five
+        for start, stop in [(0, 1), (1, 5)]:
+            self.create_rows(start, stop)
+            for model, expected in self.QUERIES.items():
+                with self.subTest(model=model, rows=stop):
+                    response = self.assertQueryCount(expected, 'get', reverse(f'admin:website_builder_{model}_changelist'))
+                    self.assertEqual(response.status_code, 200)